@@ -0,0 +1,208 @@
+"""
+Benchmark for the auto-responder hot path (responses.load_responses_file and responses.get_response).
+
+Generates synthetic responses files with a mix of literal and regex keywords, replays a message corpus against each,
+and reports load time (cold and from the compiled snapshot), throughput, p50/p99 latency and peak memory. Runs offline, no Discord connection is needed.
+
+Usage (from the repository root):
+    python -m benchmarks.responses_benchmark
+    python -m benchmarks.responses_benchmark --sizes 10 1000 100000 --messages 20000 --corpus messages.txt
+"""
+import argparse
+import csv
+import os
+import random
+import statistics
+import tempfile
+import time
+import tracemalloc
+from dataclasses import dataclass
+from typing import Final, Optional
+
+import src.utils.responses as responses
+
+DEFAULT_SIZES: Final = [10, 100, 1000, 10000, 100000]
+DEFAULT_MESSAGES: Final = 10000
+DEFAULT_REGEX_RATIO: Final = 0.1
+
+_WORDS: Final = [
+    "ohayaho", "hayato", "tokiya", "otoya", "masato", "natsuki", "syo", "ren", "cecil", "reiji", "ranmaru", "camus",
+    "starish", "quartet", "night", "heavens", "love", "song", "live", "stream", "concert", "ticket", "shining", "idol",
+    "ready", "forever", "sensei", "cute", "best", "today", "tomorrow", "album", "single", "event", "gacha", "card",
+]
+_REPEATED_MESSAGES: Final = ["ohayaho", "69", "lol", "OHAYAHO!!", "<:hayato:1206817126959161394>", "nice.", "same"]
+
+
+@dataclass
+class BenchmarkResult:
+    rows: int
+    load_seconds: float
+    snapshot_load_seconds: float
+    messages: int
+    matched: int
+    throughput: float
+    p50_us: float
+    p99_us: float
+    peak_memory_mb: float
+    cache_stats: str
+
+
+def generate_responses_file(path: str, rows: int, regex_ratio: float, rng: random.Random):
+    """
+    Write a synthetic responses file.
+
+    Args:
+        path: Where to write the file.
+        rows: The number of rules to generate.
+        regex_ratio: The fraction of keywords that are r"..." regex keywords.
+        rng: The random number generator to use.
+    """
+    with open(path, "w", newline="") as file:
+        writer = csv.writer(file)
+        file.write("# Generated by benchmarks/responses_benchmark.py\n")
+        for row in range(rows):
+            keywords = []
+            for _ in range(rng.randint(1, 3)):
+                if rng.random() < regex_ratio:
+                    keywords.append(rng.choice([
+                        f'r"(?<!\\d){row}(?!\\d)"',
+                        f'r"^{rng.choice(_WORDS)}\\b/i"',
+                        f'r"{rng.choice(_WORDS)}\\s+{rng.choice(_WORDS)}"',
+                    ]))
+                else:
+                    # The row number keeps generated keywords unique, so larger files are not full of duplicates.
+                    keywords.append(f"{rng.choice(_WORDS)} {rng.choice(_WORDS)} {row}")
+            responses_cell = ";; ".join(f"response {row}.{index}" for index in range(rng.randint(1, 3)))
+            writer.writerow([";; ".join(keywords), responses_cell])
+
+
+def generate_corpus(count: int, rows: int, rng: random.Random) -> list[str]:
+    """
+    Generate a message corpus that resembles a busy channel: mostly chatter, some repeated short messages, and some
+    messages that trigger a rule.
+
+    Args:
+        count: The number of messages to generate.
+        rows: The number of rules in the responses file, used to aim some messages at existing rules.
+        rng: The random number generator to use.
+
+    Returns:
+        list[str]: The messages.
+    """
+    corpus = []
+    for _ in range(count):
+        kind = rng.random()
+        if kind < 0.3:
+            corpus.append(rng.choice(_REPEATED_MESSAGES))
+        elif kind < 0.4:
+            corpus.append(f"{rng.choice(_WORDS).upper()} {rng.choice(_WORDS)} {rng.randrange(rows)}!")
+        else:
+            length = int(rng.expovariate(1 / 12)) + 1
+            corpus.append(" ".join(rng.choice(_WORDS + ["the", "a", "is", "and", "i", "you"]) for _ in range(length)))
+    return corpus
+
+
+def load_corpus(path: str) -> list[str]:
+    with open(path, "r") as file:
+        return [line.rstrip("\n") for line in file if line.strip()]
+
+
+def run_benchmark(path: str, rows: int, corpus: list[str]) -> Optional[BenchmarkResult]:
+    """
+    Load the responses file at path and replay the corpus against it.
+
+    Args:
+        path: The responses file to load.
+        rows: The number of rules in the file, for reporting.
+        corpus: The messages to replay.
+
+    Returns:
+        Optional[BenchmarkResult]: The measurements, or None if the file could not be loaded.
+    """
+    responses.RESPONSES_FILE_PATH = path
+    responses.SNAPSHOT_PATH = f"{path}.snapshot"
+
+    # Memory is measured in a separate pass, because tracing allocations slows down everything it traces.
+    tracemalloc.start()
+    loaded = responses.load_responses_file()
+    for message in corpus:
+        responses.get_response(message)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    if not loaded:
+        return None
+
+    os.remove(responses.SNAPSHOT_PATH)
+    start = time.perf_counter()
+    responses.load_responses_file()
+    load_seconds = time.perf_counter() - start
+
+    start = time.perf_counter()
+    responses.load_responses_file()
+    snapshot_load_seconds = time.perf_counter() - start
+
+    latencies = []
+    matched = 0
+    replay_start = time.perf_counter()
+    for message in corpus:
+        message_start = time.perf_counter_ns()
+        response = responses.get_response(message)
+        latencies.append(time.perf_counter_ns() - message_start)
+        if response is not None:
+            matched += 1
+    replay_seconds = time.perf_counter() - replay_start
+
+    quantiles = statistics.quantiles(latencies, n=100)
+    return BenchmarkResult(
+        rows=rows,
+        load_seconds=load_seconds,
+        snapshot_load_seconds=snapshot_load_seconds,
+        messages=len(corpus),
+        matched=matched,
+        throughput=len(corpus) / replay_seconds,
+        p50_us=quantiles[49] / 1000,
+        p99_us=quantiles[98] / 1000,
+        peak_memory_mb=peak / (1024 * 1024),
+        cache_stats=str(responses.get_cache_stats()),
+    )
+
+
+def print_results(results: list[BenchmarkResult]):
+    print(f"{'rows':>8} {'load s':>8} {'snap s':>8} {'msgs':>7} {'matched':>8} {'msg/s':>10} {'p50 us':>9} {'p99 us':>9} {'peak MB':>8}")
+    for result in results:
+        print(f"{result.rows:>8} {result.load_seconds:>8.3f} {result.snapshot_load_seconds:>8.3f} {result.messages:>7} {result.matched:>8} {result.throughput:>10.0f} "
+              f"{result.p50_us:>9.1f} {result.p99_us:>9.1f} {result.peak_memory_mb:>8.1f}")
+    for result in results:
+        print(f"{result.rows:>8} rows: cache {result.cache_stats}")
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description="Benchmark the auto-responder hot path.")
+    arg_parser.add_argument("--sizes", type=int, nargs="+", default=DEFAULT_SIZES, help="numbers of rules to benchmark")
+    arg_parser.add_argument("--messages", type=int, default=DEFAULT_MESSAGES, help="number of messages to replay")
+    arg_parser.add_argument("--regex-ratio", type=float, default=DEFAULT_REGEX_RATIO, help="fraction of regex keywords")
+    arg_parser.add_argument("--corpus", help="file with one message per line to replay instead of a generated corpus")
+    arg_parser.add_argument("--no-cache", action="store_true", help="disable the match cache")
+    arg_parser.add_argument("--seed", type=int, default=0, help="seed for the generated files and corpus")
+    args = arg_parser.parse_args()
+
+    if args.no_cache:
+        responses.RESPONSES_CACHE_SIZE = 0
+
+    results = []
+    with tempfile.TemporaryDirectory() as directory:
+        for rows in args.sizes:
+            rng = random.Random(args.seed)
+            path = os.path.join(directory, f"responses_{rows}.csv")
+            generate_responses_file(path, rows, args.regex_ratio, rng)
+            corpus = load_corpus(args.corpus) if args.corpus else generate_corpus(args.messages, rows, rng)
+            result = run_benchmark(path, rows, corpus)
+            if result is None:
+                print(f"{rows} rows: failed to load the generated responses file")
+                continue
+            results.append(result)
+    print_results(results)
+
+
+if __name__ == '__main__':
+    main()
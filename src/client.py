@@ -1,22 +1,42 @@
+import asyncio
+import io
 import os
-from typing import Optional
+import tempfile
+from datetime import datetime
+from typing import Literal, Optional
 
 import discord
+import pytz
 from dateutil import parser
 from discord import app_commands
 from discord.abc import GuildChannel
 from discord.interactions import Interaction
 from discord.utils import MISSING
 from dotenv import load_dotenv
+from tzlocal import get_localzone
 
 import src.utils.responses as responses
 from src import constants
 from src.constants import LOGGER
-from src.db.announcements.announcements_dao import announcements_dao
-from src.db.birthday.birthday_dao import birthday_dao
+from src.db.announcements.announcements_dao import AnnouncementsDao
+from src.db.birthday.birthday_dao import BirthdayDao
+from src.db.db_manager import DbManager
+from src.db.db_thread import AsyncDao, DbThread
+from src.db.response_hits.response_hits_dao import ResponseHitsDao
 from src.errors import LoggedRuntimeError
+from src.utils.announcements_import import parse_announcements_import
 from src.utils.announcements_util import AnnouncementsUtil
-from src.utils.birthday_util import BirthdayUtil
+from src.utils.attachment_store import attachment_store
+from src.utils.birthday_calendar import MEMBER_QUERY_LIMIT, SORT_BY_MONTH, BirthdayCalendar, MemberNameCache
+from src.utils.birthday_util import BIRTHDAY_TIMEZONE, BirthdayUtil
+from src.utils.birthdays_csv import parse_birthdays_import, write_birthdays_export
+from src.utils.catch_up import parse_catch_up_policy
+from src.utils.paginator import Paginator
+from src.utils.recurrence import parse_recurrence
+from src.utils.response_executor import ResponseExecutor
+from src.utils.response_hits_util import ResponseHitsUtil, get_hits_report
+from src.utils.response_limiter import ResponseLimiter, parse_rate_limit
+from src.utils.responses_watcher import ResponsesWatcher
 
 TAG = "client.py"
 
@@ -29,14 +49,40 @@ REQUESTS_CHANNEL_ID = os.getenv('REQUESTS_CHANNEL_ID')
 REQUESTS_CHANNEL_ID = int(REQUESTS_CHANNEL_ID) if REQUESTS_CHANNEL_ID is not None else None
 REQUESTS_USERS = os.getenv('REQUESTS_USERS')
 REQUESTS_USERS = REQUESTS_USERS.split(",") if REQUESTS_USERS else None
+RESPONSES_WATCH_INTERVAL = os.getenv('RESPONSES_WATCH_INTERVAL')
+RESPONSES_WATCH_INTERVAL = float(RESPONSES_WATCH_INTERVAL) if RESPONSES_WATCH_INTERVAL else None
+RESPONSES_EXECUTOR = os.getenv('RESPONSES_EXECUTOR', 'inline')
+RESPONSES_EXECUTOR_THRESHOLD = int(os.getenv('RESPONSES_EXECUTOR_THRESHOLD', 1000))
+RESPONSES_EXECUTOR_WORKERS = int(os.getenv('RESPONSES_EXECUTOR_WORKERS', 2))
+RESPONSES_EXECUTOR_MAX_PENDING = int(os.getenv('RESPONSES_EXECUTOR_MAX_PENDING', 100))
+ANNOUNCEMENTS_MAX_CONCURRENT_CHANNELS = int(os.getenv('ANNOUNCEMENTS_MAX_CONCURRENT_CHANNELS', 5))
+RESPONSE_HITS_FLUSH_INTERVAL = float(os.getenv('RESPONSE_HITS_FLUSH_INTERVAL', 300))
+RESPONSES_CHANNEL_RATE_LIMIT = os.getenv('RESPONSES_CHANNEL_RATE_LIMIT')
+RESPONSES_CHANNEL_RATE_LIMIT = parse_rate_limit(RESPONSES_CHANNEL_RATE_LIMIT) if RESPONSES_CHANNEL_RATE_LIMIT else None
+BIRTHDAY_BATCHED = os.getenv('BIRTHDAY_BATCHED', 'false').lower() == 'true'
+CATCH_UP_POLICY = parse_catch_up_policy(os.getenv('CATCH_UP_POLICY', 'all'))
+CATCH_UP_RATE_LIMIT = parse_rate_limit(os.getenv('CATCH_UP_RATE_LIMIT', '1/2'))
+MAX_REPORTED_IMPORT_ERRORS = 20
 announcements_util: Optional[AnnouncementsUtil] = None
 birthday_util: Optional[BirthdayUtil] = None
+responses_watcher: Optional[ResponsesWatcher] = None
+response_hits_util: Optional[ResponseHitsUtil] = None
 
 guild_object = discord.Object(id=GUILD_ID)
 
 if TOKEN is None:
     raise LoggedRuntimeError(TAG, "TOKEN not found. Check that .env file exists in src dir and that its contents are correct")
 
+response_executor = ResponseExecutor(RESPONSES_EXECUTOR, RESPONSES_EXECUTOR_THRESHOLD, RESPONSES_EXECUTOR_WORKERS, RESPONSES_EXECUTOR_MAX_PENDING)
+response_limiter = ResponseLimiter(RESPONSES_CHANNEL_RATE_LIMIT)
+trailing_response_tasks: set[asyncio.Task] = set()
+member_name_cache = MemberNameCache()
+# Slash commands use the database through this thread, so a slow disk or a locked database never blocks the event loop
+db_thread = DbThread(constants.DB_PATH)
+announcements_dao = AsyncDao(db_thread, AnnouncementsDao)
+birthday_dao = AsyncDao(db_thread, BirthdayDao)
+response_hits_dao = AsyncDao(db_thread, ResponseHitsDao)
+
 intents = discord.Intents.all()
 client = discord.Client(intents=intents)
 tree = app_commands.CommandTree(client)
@@ -51,7 +97,11 @@ async def send_wrapper(sender: Interaction | GuildChannel, text: str, attachment
         text = text[2000:]
     texts.append(text)
     if isinstance(sender, Interaction):
-        await sender.response.send_message(texts[0], file=file, ephemeral=ephemeral)
+        if sender.response.is_done():
+            # The command deferred its response, so the reply is a followup
+            await sender.followup.send(texts[0], file=file, ephemeral=ephemeral)
+        else:
+            await sender.response.send_message(texts[0], file=file, ephemeral=ephemeral)
         for text in texts[1:]:
             await sender.followup.send(text)
     elif isinstance(sender, GuildChannel):
@@ -60,6 +110,46 @@ async def send_wrapper(sender: Interaction | GuildChannel, text: str, attachment
             await sender.send(text)
 
 
+async def store_attachment(attachment: discord.Attachment) -> dict:
+    """
+    Download an attachment into the attachment store now, so it can be sent from local disk when the announcement is due.
+
+    Returns:
+        dict: The attachment data to save with the announcement, including the key of the stored blob.
+    """
+    data = await attachment.read()
+    sha256 = await asyncio.to_thread(attachment_store.put, data)
+    return attachment.to_dict() | {"sha256": sha256}
+
+
+def notify_birthdays_changed():
+    if birthday_util is not None:
+        birthday_util.notify_changed()
+
+
+async def parse_timezone_or_reply(interaction: discord.Interaction, timezone: Optional[str]) -> Optional[str]:
+    """
+    Validate an IANA timezone name given to a birthday command.
+
+    Returns:
+        Optional[str]: The canonical timezone name, None if no timezone was given, or MISSING after replying that the
+            timezone is unknown.
+    """
+    if not timezone:
+        return None
+    try:
+        return pytz.timezone(timezone.strip()).zone
+    except pytz.UnknownTimeZoneError:
+        LOGGER.e(TAG, f"parse_timezone_or_reply: unknown timezone: {timezone}")
+        await send_wrapper(interaction, f"Sorry, I do not know the timezone '{timezone}'. Please use a name like 'Asia/Tokyo' or 'America/New_York'.")
+        return MISSING
+
+
+def notify_announcements_changed():
+    if announcements_util is not None:
+        announcements_util.notify_changed()
+
+
 def replace_line_breaks(text: str) -> str:
     LOGGER.d(TAG, f"replace_line_breaks: text: {text}")
     return text.replace("\\n", "\n")
@@ -96,14 +186,26 @@ async def say(interaction: discord.Interaction, channel: discord.TextChannel, me
     guild=guild_object
 )
 @app_commands.default_permissions(administrator=True)
-async def schedule_announcement(interaction: discord.Interaction, time: str, channel: discord.TextChannel, message: str, attachment: Optional[discord.Attachment] = None):
-    LOGGER.d(TAG, f"schedule_announcement: time: {time}, channel: {channel} message: {message}, attachment: {attachment}")
+@app_commands.describe(recurrence="Repeat the announcement: an interval such as 1d, 1w or 6h, or a cron rule such as \"cron:0 9 * * 1\"")
+async def schedule_announcement(interaction: discord.Interaction, time: str, channel: discord.TextChannel, message: str, attachment: Optional[discord.Attachment] = None, recurrence: Optional[str] = None):
+    LOGGER.d(TAG, f"schedule_announcement: time: {time}, channel: {channel} message: {message}, attachment: {attachment}, recurrence: {recurrence}")
+    if attachment is not None:
+        # Downloading and hashing a large attachment can take longer than the 3 seconds Discord waits for a response
+        await interaction.response.defer()
     message = replace_line_breaks(message)
+    if recurrence:
+        try:
+            parse_recurrence(recurrence)
+        except ValueError as e:
+            LOGGER.e(TAG, f"schedule_announcement: failed to parse recurrence. recurrence provided: {recurrence}", e)
+            await send_wrapper(interaction, f"Was not able to parse the provided recurrence: {recurrence}. Use an interval such as 1d, 1w or 6h, or a cron rule such as \"cron:0 9 * * 1\". Announcement was not scheduled.")
+            return
     try:
         parsed_time = parser.parse(time)
         if parsed_time.tzinfo is None:
             parsed_time = constants.JST.localize(parsed_time)
-        announcement = announcements_dao.schedule_announcement(parsed_time, channel.id, message, attachment.to_dict() if attachment else None)
+        announcement = await announcements_dao.schedule_announcement(parsed_time, channel.id, message, await store_attachment(attachment) if attachment else None, recurrence.strip().lower() if recurrence else None)
+        notify_announcements_changed()
         await send_wrapper(interaction, f"Will send the message at time: {parsed_time}. Announcement details: {announcement}")
     except ValueError as e:
         LOGGER.e(TAG, f"schedule_announcement: failed to parse time. time provided: {time}", e)
@@ -112,19 +214,70 @@ async def schedule_announcement(interaction: discord.Interaction, time: str, cha
 
 @tree.command(
     name="cancel_announcement",
-    description="Cancel Announcement by ID",
+    description="Cancel Announcement by ID. Cancels every future occurrence of a recurring announcement",
     guild=guild_object
 )
 @app_commands.default_permissions(administrator=True)
 async def cancel_announcement(interaction: discord.Interaction, announcement_id: int):
     LOGGER.d(TAG, f"cancel_announcement: announcement_id: {announcement_id}")
-    announcement = announcements_dao.delete_announcement_by_id(announcement_id)
+    announcement = await announcements_dao.delete_announcement_by_id(announcement_id)
     if announcement is None:
         await send_wrapper(interaction, f"Could not find an announcement with the specified id: {announcement_id}.")
         return
+    notify_announcements_changed()
+    if announcement.attachment:
+        await asyncio.to_thread(attachment_store.collect_garbage, await announcements_dao.get_attachment_hashes())
     await send_wrapper(interaction, f"Announcement was canceled: {announcement}")
 
 
+@tree.command(
+    name="import_announcements",
+    description="Schedule many announcements from a CSV or JSON file with time, channel, message and recurrence",
+    guild=guild_object
+)
+@app_commands.default_permissions(administrator=True)
+async def import_announcements(interaction: discord.Interaction, file: discord.Attachment):
+    LOGGER.d(TAG, f"import_announcements: file: {file}")
+    # Reading and validating a large file can take longer than the 3 seconds Discord waits for a response
+    await interaction.response.defer()
+    imported, errors = parse_announcements_import(file.filename, await file.read(), datetime.now(get_localzone()))
+    for channel_id in sorted({announcement.channel for announcement in imported}):
+        if not isinstance(client.get_channel(channel_id), discord.TextChannel):
+            errors.append(f"text channel not found: {channel_id}")
+    if errors:
+        shown = "\n".join(errors[:MAX_REPORTED_IMPORT_ERRORS])
+        more = f"\n...and {len(errors) - MAX_REPORTED_IMPORT_ERRORS} more" if len(errors) > MAX_REPORTED_IMPORT_ERRORS else ""
+        await send_wrapper(interaction, f"Found {len(errors)} errors in {file.filename}. No announcements were scheduled.\n{shown}{more}")
+        return
+    count = await announcements_dao.schedule_announcements([(announcement.time, announcement.channel, announcement.message, None, announcement.recurrence) for announcement in imported])
+    notify_announcements_changed()
+    times = [announcement.time for announcement in imported]
+    recurring = sum(1 for announcement in imported if announcement.recurrence)
+    channels = len({announcement.channel for announcement in imported})
+    await send_wrapper(interaction, f"Scheduled {count} announcements ({recurring} recurring) to {channels} channels, due from {min(times)} to {max(times)}.")
+
+
+@tree.command(
+    name="cancel_announcements",
+    description="Cancel every announcement in an ID range and/or channel",
+    guild=guild_object
+)
+@app_commands.default_permissions(administrator=True)
+async def cancel_announcements(interaction: discord.Interaction, first_id: Optional[int] = None, last_id: Optional[int] = None, channel: Optional[discord.TextChannel] = None):
+    LOGGER.d(TAG, f"cancel_announcements: first_id: {first_id}, last_id: {last_id}, channel: {channel}")
+    if first_id is None and last_id is None and channel is None:
+        await send_wrapper(interaction, "Specify at least one of first_id, last_id or channel. No announcements were canceled.")
+        return
+    announcements = await announcements_dao.delete_announcements(first_id, last_id, channel.id if channel else None)
+    if not announcements:
+        await send_wrapper(interaction, "No announcements matched. No announcements were canceled.")
+        return
+    notify_announcements_changed()
+    if any(announcement.attachment for announcement in announcements):
+        await asyncio.to_thread(attachment_store.collect_garbage, await announcements_dao.get_attachment_hashes())
+    await send_wrapper(interaction, f"Canceled {len(announcements)} announcements with IDs: {', '.join(str(announcement.id) for announcement in announcements)}")
+
+
 @tree.command(
     name="view_scheduled_announcements",
     description="View All Scheduled Announcements",
@@ -133,11 +286,12 @@ async def cancel_announcement(interaction: discord.Interaction, announcement_id:
 @app_commands.default_permissions(administrator=True)
 async def view_scheduled_announcements(interaction: discord.Interaction):
     LOGGER.d(TAG, "view_scheduled_announcements:")
-    announcements = announcements_dao.get_all_announcements()
-    await send_wrapper(interaction, f"Found {len(announcements)} scheduled announcements:")
-    channel = interaction.channel
-    for announcement in announcements:
-        await send_wrapper(channel, announcement)
+    count = await announcements_dao.get_announcement_count()
+
+    async def fetch(after_id: Optional[int], limit: int) -> list[tuple[int, str]]:
+        return [(announcement.id, str(announcement)) for announcement in await announcements_dao.get_announcements_page(after_id, limit)]
+
+    await Paginator(fetch, f"Found {count} scheduled announcements", "There are no scheduled announcements.", interaction.user.id).send(interaction)
 
 
 @tree.command(
@@ -148,7 +302,7 @@ async def view_scheduled_announcements(interaction: discord.Interaction):
 @app_commands.default_permissions(administrator=True)
 async def view_scheduled_announcement_by_id(interaction: discord.Interaction, announcement_id: int):
     LOGGER.d(TAG, f"view_scheduled_announcement_by_id: announcement_id: {announcement_id}")
-    announcement = announcements_dao.get_announcement_by_id(announcement_id)
+    announcement = await announcements_dao.get_announcement_by_id(announcement_id)
     if announcement is None:
         await send_wrapper(interaction, f"Could not find an announcement with the specified id: {announcement_id}.")
         return
@@ -163,7 +317,8 @@ async def view_scheduled_announcement_by_id(interaction: discord.Interaction, an
 @app_commands.default_permissions(administrator=True)
 async def reload_responses(interaction: discord.Interaction):
     LOGGER.d(TAG, "reload_responses:")
-    if responses.load_responses_file():
+    # Parsing and compiling the responses file can take a while, so do it off the event loop.
+    if await asyncio.to_thread(responses.load_responses_file):
         await send_wrapper(interaction, "Responses file was reloaded.")
     else:
         await send_wrapper(interaction, "Failed to reload responses file. Please check the format and try again. No changes were made.")
@@ -179,20 +334,69 @@ async def get_all_responses(interaction: discord.Interaction):
     LOGGER.d(TAG, "get_all_responses:")
     await send_wrapper(interaction, responses.get_responses_file())
 
+
+@tree.command(
+    name="get_response_cache_stats",
+    description="Get the hit and miss counters of the responses cache",
+    guild=guild_object
+)
+@app_commands.default_permissions(administrator=True)
+async def get_response_cache_stats(interaction: discord.Interaction):
+    LOGGER.d(TAG, "get_response_cache_stats:")
+    await send_wrapper(interaction, f"Responses cache: {responses.get_cache_stats()}")
+
+
+@tree.command(
+    name="get_disabled_responses",
+    description="Get the response rules that were disabled or skipped for being too slow",
+    guild=guild_object
+)
+@app_commands.default_permissions(administrator=True)
+async def get_disabled_responses(interaction: discord.Interaction):
+    LOGGER.d(TAG, "get_disabled_responses:")
+    await send_wrapper(interaction, responses.get_disabled_rules_report())
+
+
+@tree.command(
+    name="get_response_executor_stats",
+    description="Get the queueing delay and backpressure counters of off-loop response matching",
+    guild=guild_object
+)
+@app_commands.default_permissions(administrator=True)
+async def get_response_executor_stats(interaction: discord.Interaction):
+    LOGGER.d(TAG, "get_response_executor_stats:")
+    await send_wrapper(interaction, f"Response executor: {response_executor.get_stats()}")
+
+
+@tree.command(
+    name="get_response_hits",
+    description="Get the most used response rules and the rules that never fired",
+    guild=guild_object
+)
+@app_commands.default_permissions(administrator=True)
+async def get_response_hits(interaction: discord.Interaction, count: Optional[int] = 10):
+    LOGGER.d(TAG, f"get_response_hits: count: {count}")
+    await send_wrapper(interaction, get_hits_report(responses.get_rule_keys(), await response_hits_dao.get_all_hits(), count))
+
 if BIRTHDAY_CHANNEL_ID is not None:
     @tree.command(
         name="learn_birthday",
         description="Tell me your birthday, and I will send you happy birthday wishes.",
         guild=guild_object
     )
-    async def learn_birthday(interaction: discord.Interaction, date: str):
+    @app_commands.describe(timezone="Your timezone, such as Asia/Tokyo or America/New_York, so I wish you at midnight where you live")
+    async def learn_birthday(interaction: discord.Interaction, date: str, timezone: Optional[str] = None):
         LOGGER.d(TAG, "learn_birthday:")
         user_id = interaction.user.id
+        timezone_name = await parse_timezone_or_reply(interaction, timezone)
+        if timezone_name is MISSING:
+            return
 
         try:
             parsed_date = parser.parse(date).strftime("%m-%d")
-            LOGGER.d(TAG, f"learn_birthday: user_id: {user_id}, parsed_date: {parsed_date}")
-            birthday = birthday_dao.learn_birthday(user_id, parsed_date)
+            LOGGER.d(TAG, f"learn_birthday: user_id: {user_id}, parsed_date: {parsed_date}, timezone: {timezone_name}")
+            birthday = await birthday_dao.learn_birthday(user_id, parsed_date, timezone_name)
+            notify_birthdays_changed()
             await send_wrapper(interaction, "I will remember that your birthday is on this day: " + birthday.date.strftime("%B %d"))
         except ValueError as e:
             LOGGER.e(TAG, f"learn_birthday: failed to parse date. date provided: {date}", e)
@@ -205,14 +409,19 @@ if BIRTHDAY_CHANNEL_ID is not None:
         description="Tell me someone's birthday, and I will send them happy birthday wishes.",
         guild=guild_object
     )
-    async def learn_others_birthday(interaction: discord.Interaction, user: discord.User, date: str):
+    @app_commands.describe(timezone="Their timezone, such as Asia/Tokyo or America/New_York, so I wish them at midnight where they live")
+    async def learn_others_birthday(interaction: discord.Interaction, user: discord.User, date: str, timezone: Optional[str] = None):
         LOGGER.d(TAG, "learn_birthday:")
         user_id = user.id
+        timezone_name = await parse_timezone_or_reply(interaction, timezone)
+        if timezone_name is MISSING:
+            return
 
         try:
             parsed_date = parser.parse(date).strftime("%m-%d")
-            LOGGER.d(TAG, f"learn_birthday: user_id: {user_id}, parsed_date: {parsed_date}")
-            birthday = birthday_dao.learn_birthday(user_id, parsed_date)
+            LOGGER.d(TAG, f"learn_birthday: user_id: {user_id}, parsed_date: {parsed_date}, timezone: {timezone_name}")
+            birthday = await birthday_dao.learn_birthday(user_id, parsed_date, timezone_name)
+            notify_birthdays_changed()
             await send_wrapper(interaction, f"I will remember that {user.mention}'s birthday is on this day: " + birthday.date.strftime("%B %d"))
         except ValueError as e:
             LOGGER.e(TAG, f"learn_birthday: failed to parse date. date provided: {date}", e)
@@ -229,7 +438,8 @@ if BIRTHDAY_CHANNEL_ID is not None:
         LOGGER.d(TAG, "forget_birthday:")
         user_id = interaction.user.id
         LOGGER.d(TAG, f"forget_birthday: user_id: {user_id}")
-        birthday_dao.forget_birthday(user_id)
+        await birthday_dao.forget_birthday(user_id)
+        notify_birthdays_changed()
         await send_wrapper(interaction, "Your birthday has been forgotten.")
 
 
@@ -240,13 +450,60 @@ if BIRTHDAY_CHANNEL_ID is not None:
         guild=guild_object
     )
     @app_commands.default_permissions(administrator=True)
-    async def get_all_birthdays(interaction: discord.Interaction):
-        LOGGER.d(TAG, "get_all_birthdays:")
-        birthdays = birthday_dao.get_all_birthdays()
-        response = "Birthdays:\n"
-        for birthday in birthdays:
-            response += f"username: {client.get_user(birthday.user_id)}: date: {birthday.date.strftime('%m/%d')}\n"
-        await send_wrapper(interaction, response)
+    @app_commands.describe(sort="Sort by month from January, or start from the next birthday")
+    async def get_all_birthdays(interaction: discord.Interaction, sort: Literal["month", "upcoming"] = SORT_BY_MONTH):
+        LOGGER.d(TAG, f"get_all_birthdays: sort: {sort}")
+        count = await birthday_dao.get_birthday_count()
+        calendar = BirthdayCalendar(birthday_dao, client.get_guild(GUILD_ID), sort, datetime.now(BIRTHDAY_TIMEZONE).date(), member_name_cache)
+        await Paginator(calendar.fetch, f"Birthdays ({count}, sorted by {sort})", "I do not know any birthdays yet.", interaction.user.id, MEMBER_QUERY_LIMIT).send(interaction)
+
+
+if BIRTHDAY_CHANNEL_ID is not None:
+    @tree.command(
+        name="import_birthdays",
+        description="Learn many birthdays from a CSV file with user_id, date and timezone",
+        guild=guild_object
+    )
+    @app_commands.default_permissions(administrator=True)
+    async def import_birthdays(interaction: discord.Interaction, file: discord.Attachment):
+        LOGGER.d(TAG, f"import_birthdays: file: {file}")
+        # Reading a file with thousands of birthdays can take longer than the 3 seconds Discord waits for a response
+        await interaction.response.defer()
+        imported, errors = parse_birthdays_import(file.filename, await file.read())
+        if errors:
+            shown = "\n".join(errors[:MAX_REPORTED_IMPORT_ERRORS])
+            more = f"\n...and {len(errors) - MAX_REPORTED_IMPORT_ERRORS} more" if len(errors) > MAX_REPORTED_IMPORT_ERRORS else ""
+            await send_wrapper(interaction, f"Found {len(errors)} errors in {file.filename}. No birthdays were learned.\n{shown}{more}")
+            return
+        count = await birthday_dao.learn_birthdays([(birthday.user_id, birthday.date, birthday.timezone) for birthday in imported])
+        notify_birthdays_changed()
+        with_timezone = sum(1 for birthday in imported if birthday.timezone)
+        await send_wrapper(interaction, f"Learned {count} birthdays ({with_timezone} with a timezone).")
+
+
+if BIRTHDAY_CHANNEL_ID is not None:
+    @tree.command(
+        name="export_birthdays",
+        description="Get all the birthdays as a CSV file that can be imported again",
+        guild=guild_object
+    )
+    @app_commands.default_permissions(administrator=True)
+    async def export_birthdays(interaction: discord.Interaction):
+        LOGGER.d(TAG, "export_birthdays:")
+        await interaction.response.defer()
+        with tempfile.TemporaryFile() as export_file:
+            def export(db_manager: DbManager) -> int:
+                text_file = io.TextIOWrapper(export_file, encoding="utf-8", newline="")
+                exported = write_birthdays_export(BirthdayDao(db_manager), text_file)
+                # Detach, so the binary file stays open for discord.File when the text wrapper is collected
+                text_file.detach()
+                return exported
+
+            # Reading the table and writing the file both happen on the database thread
+            count = await db_thread.run(export)
+            export_file.seek(0)
+            await interaction.followup.send(f"Exported {count} birthdays.", file=discord.File(export_file, filename="birthdays.csv"))
+
 
 if REQUESTS_CHANNEL_ID is not None:
     @tree.command(
@@ -287,9 +544,33 @@ async def on_message(message: discord.Message):
         LOGGER.d(TAG, f"on_message: message.guild.id: {message.guild.id} not equal to GUILD_ID: {GUILD_ID}")
         return
     msg = message.content
-    response = responses.get_response(msg)
-    if response:
+    response, rule = await response_executor.get_response_and_rule(msg)
+    if not response:
+        return
+    if response_limiter.allow(message.channel.id, rule, responses.get_rule_rate_limit(rule)):
         await message.channel.send(response)
+    elif response_limiter.get_pending(message.channel.id, rule) == 1:
+        # The first trigger coalesced since the last reply schedules the trailing reply for all of them
+        task = asyncio.create_task(send_trailing_response(message.channel, rule, response))
+        # The event loop only keeps weak references to tasks
+        trailing_response_tasks.add(task)
+        task.add_done_callback(trailing_response_tasks.discard)
+
+
+async def send_trailing_response(channel: discord.abc.Messageable, rule: str, response: str):
+    """
+    Send one reply for the triggers of a rule that were coalesced while its buckets were empty, once they refill.
+    """
+    while True:
+        count, delay = response_limiter.take_trailing_reply(channel.id, rule, responses.get_rule_rate_limit(rule))
+        if delay == 0:
+            break
+        await asyncio.sleep(delay)
+    if count == 0:
+        # A reply that was allowed in the meantime already answered them
+        return
+    LOGGER.d(TAG, f"send_trailing_response: answering {count} coalesced triggers of rule {rule} in channel {channel.id}")
+    await channel.send(response)
 
 
 @client.event
@@ -297,10 +578,12 @@ async def on_ready():
     LOGGER.d(TAG, "on_ready:")
     global announcements_util
     global birthday_util
+    global responses_watcher
+    global response_hits_util
     await tree.sync(guild=guild_object)
     if announcements_util is None or not announcements_util.is_running:
         # Start waiting for announcement scheduled time
-        announcements_util = AnnouncementsUtil(client)
+        announcements_util = AnnouncementsUtil(client, ANNOUNCEMENTS_MAX_CONCURRENT_CHANNELS, CATCH_UP_POLICY, CATCH_UP_RATE_LIMIT)
         LOGGER.d(TAG, f"on_ready: announcements_util.is_started: {announcements_util.is_running}")
     else:
         # If the announcements util is already set, skip setting it again
@@ -309,13 +592,27 @@ async def on_ready():
 
     # If the birthdays channel is set, start waiting for birthdays
     if BIRTHDAY_CHANNEL_ID is not None and (birthday_util is None or not birthday_util.is_running):
-        birthday_util = BirthdayUtil(client, BIRTHDAY_CHANNEL_ID)
+        birthday_util = BirthdayUtil(client, BIRTHDAY_CHANNEL_ID, CATCH_UP_POLICY, CATCH_UP_RATE_LIMIT, BIRTHDAY_BATCHED)
         LOGGER.d(TAG, f"on_ready: birthday_util.is_started: {birthday_util.is_running}")
     else:
         # If the birthday util is already set, skip setting it again
         # This happens in the case of a reconnect
         LOGGER.d(TAG, "on_ready: birthday_util is already started")
 
+    # If the watch interval is set, reload the responses file whenever it changes
+    if RESPONSES_WATCH_INTERVAL and responses.RESPONSES_FILE_PATH and (responses_watcher is None or not responses_watcher.is_running):
+        responses_watcher = ResponsesWatcher(responses.RESPONSES_FILE_PATH, RESPONSES_WATCH_INTERVAL)
+        LOGGER.d(TAG, f"on_ready: responses_watcher.is_started: {responses_watcher.is_running}")
+    else:
+        LOGGER.d(TAG, "on_ready: responses_watcher is disabled or already started")
+
+    if response_hits_util is None or not response_hits_util.is_running:
+        # Start flushing response hit counts to the database
+        response_hits_util = ResponseHitsUtil(RESPONSE_HITS_FLUSH_INTERVAL)
+        LOGGER.d(TAG, f"on_ready: response_hits_util.is_started: {response_hits_util.is_running}")
+    else:
+        LOGGER.d(TAG, "on_ready: response_hits_util is already started")
+
     LOGGER.d(TAG, "on_ready: done")
 
 client.run(TOKEN, reconnect=True)
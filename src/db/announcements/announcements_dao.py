@@ -1,5 +1,7 @@
 import json
-from datetime import datetime
+import math
+import sqlite3
+from datetime import datetime, timezone
 from typing import Optional
 
 from dateutil import parser
@@ -15,10 +17,20 @@ from src.db.db_manager import DbManager, db_manager
 # COLUMN_CHANNEL = 'channel'
 # COLUMN_MESSAGE = 'message'
 # COLUMN_ATTACHMENT = 'attachment'
+# COLUMN_DUE_EPOCH = 'due_epoch'
+# COLUMN_RECURRENCE = 'recurrence'
+# COLUMN_STATE = 'state'
+# COLUMN_ATTEMPTS = 'attempts'
+# COLUMN_LAST_ERROR = 'last_error'
+# COLUMN_SENDING_EPOCH = 'sending_epoch'
 
 TAG = "AnnouncementsDao"
 
 
+def _to_record(val: tuple) -> AnnouncementsRecord:
+    return AnnouncementsRecord(val[0], parser.parse(val[1]), val[2], val[3], json.loads(val[4]), val[6], val[7], val[8], val[9], val[10])
+
+
 class AnnouncementsDao:
     def __init__(self, db_manager: DbManager):
         self.db_manager = db_manager
@@ -29,7 +41,7 @@ class AnnouncementsDao:
         LOGGER.i(TAG, f"get_announcement_by_id(): executing {query} with params {params}")
         val = self.db_manager.cursor.execute(query, params).fetchone()
         if val is not None:
-            return AnnouncementsRecord(val[0], parser.parse(val[1]), val[2], val[3], json.loads(val[4]))
+            return _to_record(val)
         return None
 
     def get_all_announcements(self) -> list[AnnouncementsRecord]:
@@ -38,19 +50,157 @@ class AnnouncementsDao:
         vals = self.db_manager.cursor.execute(query).fetchall()
         out = []
         for val in vals:
-            out.append(AnnouncementsRecord(val[0], parser.parse(val[1]), val[2], val[3], json.loads(val[4])))
+            out.append(_to_record(val))
+        return out
+
+    def get_announcements_page(self, after_id: Optional[int], limit: int) -> list[AnnouncementsRecord]:
+        """
+        Get up to limit announcements in ID order, starting after the given ID. Uses keyset pagination on the primary key,
+        so every page is as cheap as the first.
+        """
+        query = "SELECT * FROM announcements WHERE id > ? ORDER BY id LIMIT ?"
+        params = (after_id if after_id is not None else -1, limit)
+        LOGGER.i(TAG, f"get_announcements_page(): executing {query} with params {params}")
+        vals = self.db_manager.cursor.execute(query, params).fetchall()
+        out = []
+        for val in vals:
+            out.append(_to_record(val))
+        return out
+
+    def get_announcement_count(self) -> int:
+        query = "SELECT COUNT(*) FROM announcements"
+        LOGGER.i(TAG, f"get_announcement_count(): executing {query}")
+        return self.db_manager.cursor.execute(query).fetchone()[0]
+
+    def get_due_announcements(self, now: datetime) -> list[AnnouncementsRecord]:
+        """
+        Get the pending announcements that are due at the given time, oldest first. Uses the index on (state, due_epoch).
+        """
+        query = "SELECT * FROM announcements WHERE state = 'pending' AND due_epoch <= ? ORDER BY due_epoch, id"
+        params = (math.floor(now.timestamp()),)
+        LOGGER.i(TAG, f"get_due_announcements(): executing {query} with params {params}")
+        vals = self.db_manager.cursor.execute(query, params).fetchall()
+        out = []
+        for val in vals:
+            out.append(_to_record(val))
         return out
 
-    def schedule_announcement(self, time: datetime, channel: int, message: str, attachment: dict) -> Optional[AnnouncementsRecord]:
-        query = "INSERT INTO announcements(time, channel, message, attachment) VALUES(?, ?, ?, ?) RETURNING *"
-        params = (time, channel, message, json.dumps(attachment))
+    def get_next_due_time(self) -> Optional[datetime]:
+        """
+        Get the due time of the first pending announcement. It may already be past, if the announcement came due while
+        an earlier batch was being sent. Uses the index on (state, due_epoch).
+        """
+        query = "SELECT MIN(due_epoch) FROM announcements WHERE state = 'pending'"
+        LOGGER.i(TAG, f"get_next_due_time(): executing {query}")
+        val = self.db_manager.cursor.execute(query).fetchone()
+        if val is not None and val[0] is not None:
+            return datetime.fromtimestamp(val[0], timezone.utc)
+        return None
+
+    def get_attachment_hashes(self) -> set[str]:
+        """
+        Get the keys of all attachment store blobs that are referenced by an announcement.
+        """
+        query = "SELECT DISTINCT json_extract(attachment, '$.sha256') FROM announcements WHERE json_extract(attachment, '$.sha256') IS NOT NULL"
+        LOGGER.i(TAG, f"get_attachment_hashes(): executing {query}")
+        vals = self.db_manager.cursor.execute(query).fetchall()
+        return {val[0] for val in vals}
+
+    def schedule_announcement(self, time: datetime, channel: int, message: str, attachment: dict, recurrence: Optional[str] = None) -> Optional[AnnouncementsRecord]:
+        query = "INSERT INTO announcements(time, channel, message, attachment, due_epoch, recurrence) VALUES(?, ?, ?, ?, ?, ?) RETURNING *"
+        params = (time, channel, message, json.dumps(attachment), math.ceil(time.timestamp()), recurrence)
         LOGGER.i(TAG, f"schedule_announcement(): executing {query} with params {params}")
         val = self.db_manager.cursor.execute(query, params).fetchone()
         self.db_manager.connection.commit()
         if val is not None:
-            return AnnouncementsRecord(val[0], parser.parse(val[1]), val[2], val[3], json.loads(val[4]))
+            return _to_record(val)
+        return None
+
+    def schedule_announcements(self, announcements: list[tuple[datetime, int, str, Optional[dict], Optional[str]]]) -> int:
+        """
+        Insert many announcements in one transaction. Either all of them are inserted or none are.
+
+        Args:
+            announcements: The (time, channel, message, attachment, recurrence) of each announcement.
+
+        Returns:
+            int: The number of inserted announcements.
+        """
+        query = "INSERT INTO announcements(time, channel, message, attachment, due_epoch, recurrence) VALUES(?, ?, ?, ?, ?, ?)"
+        params = [(time, channel, message, json.dumps(attachment), math.ceil(time.timestamp()), recurrence) for time, channel, message, attachment, recurrence in announcements]
+        LOGGER.i(TAG, f"schedule_announcements(): executing {query} for {len(params)} rows")
+        try:
+            self.db_manager.cursor.executemany(query, params)
+            self.db_manager.connection.commit()
+        except sqlite3.Error:
+            self.db_manager.connection.rollback()
+            raise
+        return len(params)
+
+    def reschedule_announcement(self, row_id: int, time: datetime) -> Optional[AnnouncementsRecord]:
+        """
+        Move a recurring announcement to its next occurrence. A series is a single row, so this replaces its due time.
+        """
+        query = "UPDATE announcements SET time=?, due_epoch=?, state='pending', attempts=0, last_error=NULL WHERE id=? RETURNING *"
+        params = (time, math.ceil(time.timestamp()), row_id)
+        LOGGER.i(TAG, f"reschedule_announcement(): executing {query} with params {params}")
+        val = self.db_manager.cursor.execute(query, params).fetchone()
+        self.db_manager.connection.commit()
+        if val is not None:
+            return _to_record(val)
+        return None
+
+    def get_sending_announcements(self) -> list[AnnouncementsRecord]:
+        """
+        Get the announcements that were being sent when the bot stopped. They may or may not have been posted.
+        """
+        query = "SELECT * FROM announcements WHERE state = 'sending' ORDER BY due_epoch, id"
+        LOGGER.i(TAG, f"get_sending_announcements(): executing {query}")
+        vals = self.db_manager.cursor.execute(query).fetchall()
+        out = []
+        for val in vals:
+            out.append(_to_record(val))
+        return out
+
+    def mark_sending(self, row_ids: list[int], now: datetime):
+        """
+        Record that announcements are about to be sent, before sending them. If the bot stops before their outcome is
+        recorded, they are found by get_sending_announcements instead of being sent again blindly, and the channel
+        history is checked from the time they were marked.
+        """
+        query = "UPDATE announcements SET state='sending', sending_epoch=? WHERE id=?"
+        LOGGER.i(TAG, f"mark_sending(): executing {query} for ids {row_ids}")
+        self.db_manager.cursor.executemany(query, [(math.floor(now.timestamp()), row_id) for row_id in row_ids])
+        self.db_manager.connection.commit()
+
+    def record_failed_attempt(self, row_id: int, error: str, retry_epoch: Optional[int]) -> Optional[AnnouncementsRecord]:
+        """
+        Record a failed attempt to send an announcement.
+
+        Args:
+            row_id: The ID of the announcement.
+            error: A description of the error.
+            retry_epoch: When to try again, as a UTC epoch. None to give up and mark the announcement as failed.
+        """
+        query = "UPDATE announcements SET state=?, attempts=attempts+1, last_error=?, due_epoch=COALESCE(?, due_epoch) WHERE id=? RETURNING *"
+        params = ('pending' if retry_epoch is not None else 'failed', error, retry_epoch, row_id)
+        LOGGER.i(TAG, f"record_failed_attempt(): executing {query} with params {params}")
+        val = self.db_manager.cursor.execute(query, params).fetchone()
+        self.db_manager.connection.commit()
+        if val is not None:
+            return _to_record(val)
         return None
 
+    def defer_announcement(self, row_id: int, due_epoch: int):
+        """
+        Put an announcement that was not attempted back to pending, due at the given UTC epoch.
+        """
+        query = "UPDATE announcements SET state='pending', due_epoch=? WHERE id=?"
+        params = (due_epoch, row_id)
+        LOGGER.i(TAG, f"defer_announcement(): executing {query} with params {params}")
+        self.db_manager.cursor.execute(query, params)
+        self.db_manager.connection.commit()
+
     def delete_announcement_by_id(self, row_id: int):
         query = "DELETE FROM announcements WHERE id=? returning *"
         params = (row_id,)
@@ -58,8 +208,31 @@ class AnnouncementsDao:
         val = self.db_manager.cursor.execute(query, params).fetchone()
         self.db_manager.connection.commit()
         if val is not None:
-            return AnnouncementsRecord(val[0], parser.parse(val[1]), val[2], val[3], json.loads(val[4]))
+            return _to_record(val)
         return None
 
+    def delete_announcements(self, first_id: Optional[int] = None, last_id: Optional[int] = None, channel: Optional[int] = None) -> list[AnnouncementsRecord]:
+        """
+        Delete every announcement that matches all the given filters in one statement. Filters that are None match
+        everything, so the caller must make sure at least one is given.
+
+        Args:
+            first_id: The lowest ID to delete.
+            last_id: The highest ID to delete.
+            channel: Only delete announcements to this channel.
+
+        Returns:
+            list[AnnouncementsRecord]: The deleted announcements.
+        """
+        query = "DELETE FROM announcements WHERE (? IS NULL OR id >= ?) AND (? IS NULL OR id <= ?) AND (? IS NULL OR channel = ?) RETURNING *"
+        params = (first_id, first_id, last_id, last_id, channel, channel)
+        LOGGER.i(TAG, f"delete_announcements(): executing {query} with params {params}")
+        vals = self.db_manager.cursor.execute(query, params).fetchall()
+        self.db_manager.connection.commit()
+        out = []
+        for val in vals:
+            out.append(_to_record(val))
+        return sorted(out, key=lambda announcement: announcement.id)
+
 
 announcements_dao = AnnouncementsDao(db_manager)
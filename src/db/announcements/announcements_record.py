@@ -1,6 +1,11 @@
 from dataclasses import dataclass
 from datetime import datetime
-from typing import Optional
+from typing import Final, Optional
+
+# The delivery states of an announcement. See DbManager.upgrade_to_version_6.
+STATE_PENDING: Final = "pending"
+STATE_SENDING: Final = "sending"
+STATE_FAILED: Final = "failed"
 
 
 @dataclass
@@ -10,6 +15,17 @@ class AnnouncementsRecord:
     channel: int
     message: str
     attachment: Optional[dict[str, str | int | bool]] = None
+    recurrence: Optional[str] = None
+    state: str = STATE_PENDING
+    attempts: int = 0
+    last_error: Optional[str] = None
+    # The UTC epoch of the last time the announcement was marked as sending
+    sending_epoch: Optional[int] = None
 
     def __str__(self):
-        return f"ID: {self.id}, time: {self.time}, channel: {self.channel}, message: {self.message}, attachment: {self.attachment.get('url') if self.attachment else None}"
+        out = f"ID: {self.id}, time: {self.time}, channel: {self.channel}, message: {self.message}, attachment: {self.attachment.get('url') if self.attachment else None}"
+        if self.recurrence:
+            out += f", repeats: {self.recurrence}"
+        if self.attempts:
+            out += f", state: {self.state} after {self.attempts} failed attempts, last error: {self.last_error}"
+        return out
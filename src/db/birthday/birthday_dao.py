@@ -1,20 +1,31 @@
-from datetime import datetime
+import calendar
+import sqlite3
+from datetime import date
 from typing import Optional
 
 from dateutil import parser
 
 from src.constants import LOGGER
 from src.db.birthday.birthday_record import BirthdayRecord
-from src.db.db_manager import DbManager, db_manager
+from src.db.db_manager import BIRTHDAY_PARSE_DEFAULT, DbManager, db_manager
 
 # Keeping these here for reference, but don't use them because formatted strings in queries are bad.
 # TABLE_BIRTHDAY = 'birthdays'
 # COLUMN_user_id = 'user_id'
 # COLUMN_DATE = 'date'
+# COLUMN_LAST_WISHED_YEAR = 'last_wished_year'
+# COLUMN_MONTH = 'month'
+# COLUMN_DAY = 'day'
+# COLUMN_TIMEZONE = 'timezone'
 
 TAG = "BirthdayDao"
 
 
+def _to_record(val: tuple) -> BirthdayRecord:
+    # Built from the month and day columns in a leap year, so February 29th is valid in every year
+    return BirthdayRecord(val[0], BIRTHDAY_PARSE_DEFAULT.replace(month=val[3], day=val[4]), val[2], val[5])
+
+
 class BirthdayDao:
     def __init__(self, db_manager: DbManager):
         self.db_manager = db_manager
@@ -25,7 +36,7 @@ class BirthdayDao:
         vals = self.db_manager.cursor.execute(query).fetchall()
         out = []
         for val in vals:
-            out.append(BirthdayRecord(val[0], parser.parse(val[1]), val[2]))
+            out.append(_to_record(val))
         return out
 
     def get_birthday_by_user_id(self, user_id: int) -> Optional[BirthdayRecord]:
@@ -34,19 +45,105 @@ class BirthdayDao:
         LOGGER.i(TAG, f"get_birthday_by_user_id(): executing {query} with params {params}")
         val = self.db_manager.cursor.execute(query, params).fetchone()
         if val is not None:
-            return BirthdayRecord(val[0], parser.parse(val[1]), val[2])
+            return _to_record(val)
         return None
 
-    def learn_birthday(self, user_id: int, date: datetime) -> Optional[BirthdayRecord]:
-        query = "INSERT OR REPLACE INTO birthdays(user_id, date, last_wished_year) VALUES(?, ?, ?) RETURNING *"
-        params = (user_id, date, 0)
+    def get_unwished_birthdays(self, day: date, timezone: Optional[str] = None) -> list[BirthdayRecord]:
+        """
+        Get the birthdays on the given day that have not been wished in its year yet. Uses the index on (month, day).
+        In years without February 29th, birthdays on February 29th are included on February 28th.
+
+        Args:
+            day: The day in the timezone of the users.
+            timezone: Only get the users in this timezone, or the users without a timezone if None.
+        """
+        query = "SELECT * FROM birthdays WHERE ((month=? AND day=?) OR (? AND month=2 AND day=29)) AND last_wished_year<? AND timezone IS ?"
+        params = (day.month, day.day, day.month == 2 and day.day == 28 and not calendar.isleap(day.year), day.year, timezone)
+        LOGGER.i(TAG, f"get_unwished_birthdays(): executing {query} with params {params}")
+        vals = self.db_manager.cursor.execute(query, params).fetchall()
+        out = []
+        for val in vals:
+            out.append(_to_record(val))
+        return out
+
+    def get_birthdays_page(self, after: Optional[tuple[int, int, int]], limit: int, before: Optional[tuple[int, int]] = None) -> list[BirthdayRecord]:
+        """
+        Get up to limit birthdays in calendar order, starting after the given key. Uses keyset pagination on the index on
+        (month, day), so every page is as cheap as the first.
+
+        Args:
+            after: The (month, day, user_id) of the last birthday of the previous page, or None to start at January 1st.
+            limit: The maximum number of birthdays to get.
+            before: If set, only get birthdays before this (month, day).
+        """
+        query = "SELECT * FROM birthdays WHERE (month, day, user_id) > (?, ?, ?) AND (? IS NULL OR (month, day) < (?, ?)) ORDER BY month, day, user_id LIMIT ?"
+        after = after if after is not None else (0, 0, 0)
+        before_month, before_day = before if before is not None else (None, None)
+        params = (*after, before_month, before_month, before_day, limit)
+        LOGGER.i(TAG, f"get_birthdays_page(): executing {query} with params {params}")
+        vals = self.db_manager.cursor.execute(query, params).fetchall()
+        out = []
+        for val in vals:
+            out.append(_to_record(val))
+        return out
+
+    def get_birthday_count(self) -> int:
+        query = "SELECT COUNT(*) FROM birthdays"
+        LOGGER.i(TAG, f"get_birthday_count(): executing {query}")
+        return self.db_manager.cursor.execute(query).fetchone()[0]
+
+    def get_timezones(self) -> set[Optional[str]]:
+        """
+        Get the distinct timezones of the birthdays, with None for birthdays without a timezone.
+        """
+        query = "SELECT DISTINCT timezone FROM birthdays"
+        LOGGER.i(TAG, f"get_timezones(): executing {query}")
+        vals = self.db_manager.cursor.execute(query).fetchall()
+        return {val[0] for val in vals}
+
+    def learn_birthday(self, user_id: int, date: str, timezone: Optional[str] = None) -> Optional[BirthdayRecord]:
+        """
+        Remember a birthday.
+
+        Args:
+            user_id: The ID of the user.
+            date: The birthday in the format "%m-%d".
+            timezone: The IANA timezone to wish the user in, or None for the default birthday timezone.
+        """
+        parsed_date = parser.parse(date, default=BIRTHDAY_PARSE_DEFAULT)
+        query = "INSERT OR REPLACE INTO birthdays(user_id, date, last_wished_year, month, day, timezone) VALUES(?, ?, ?, ?, ?, ?) RETURNING *"
+        params = (user_id, date, 0, parsed_date.month, parsed_date.day, timezone)
         LOGGER.i(TAG, f"remember_birthday(): executing {query} with params {params}")
         val = self.db_manager.cursor.execute(query, params).fetchone()
         self.db_manager.connection.commit()
         if val is not None:
-            return BirthdayRecord(val[0], parser.parse(val[1]), val[2])
+            return _to_record(val)
         return None
 
+    def learn_birthdays(self, birthdays: list[tuple[int, str, Optional[str]]]) -> int:
+        """
+        Remember many birthdays in one transaction. Either all of them are saved or none are.
+
+        Args:
+            birthdays: The (user_id, date, timezone) of each birthday, with the date in the format "%m-%d".
+
+        Returns:
+            int: The number of saved birthdays.
+        """
+        query = "INSERT OR REPLACE INTO birthdays(user_id, date, last_wished_year, month, day, timezone) VALUES(?, ?, ?, ?, ?, ?)"
+        params = []
+        for user_id, date, timezone in birthdays:
+            parsed_date = parser.parse(date, default=BIRTHDAY_PARSE_DEFAULT)
+            params.append((user_id, date, 0, parsed_date.month, parsed_date.day, timezone))
+        LOGGER.i(TAG, f"learn_birthdays(): executing {query} for {len(params)} rows")
+        try:
+            self.db_manager.cursor.executemany(query, params)
+            self.db_manager.connection.commit()
+        except sqlite3.Error:
+            self.db_manager.connection.rollback()
+            raise
+        return len(params)
+
     def forget_birthday(self, user_id: int) -> Optional[BirthdayRecord]:
         query = "DELETE FROM birthdays WHERE user_id=? returning *"
         params = (user_id,)
@@ -54,7 +151,7 @@ class BirthdayDao:
         val = self.db_manager.cursor.execute(query, params).fetchone()
         self.db_manager.connection.commit()
         if val is not None:
-            return BirthdayRecord(val[0], parser.parse(val[1]), val[2])
+            return _to_record(val)
         return None
 
     def update_last_wished_year(self, user_id: int, last_wished_year: int) -> Optional[BirthdayRecord]:
@@ -64,8 +161,17 @@ class BirthdayDao:
         val = self.db_manager.cursor.execute(query, params).fetchone()
         self.db_manager.connection.commit()
         if val is not None:
-            return BirthdayRecord(val[0], parser.parse(val[1]), val[2])
+            return _to_record(val)
         return None
 
+    def update_last_wished_years(self, user_ids: list[int], last_wished_year: int):
+        """
+        Mark many users as wished in one transaction.
+        """
+        query = "UPDATE birthdays SET last_wished_year=? WHERE user_id=?"
+        LOGGER.i(TAG, f"update_last_wished_years(): executing {query} for {len(user_ids)} users")
+        self.db_manager.cursor.executemany(query, [(last_wished_year, user_id) for user_id in user_ids])
+        self.db_manager.connection.commit()
+
 
 birthday_dao = BirthdayDao(db_manager)
@@ -1,5 +1,6 @@
 from dataclasses import dataclass
 from datetime import datetime
+from typing import Optional
 
 
 @dataclass
@@ -7,6 +8,10 @@ class BirthdayRecord:
     user_id: int
     date: datetime
     last_wished_year: int = 0
+    timezone: Optional[str] = None
 
     def __str__(self):
-        return f" user_id: {self.user_id}, date: {self.date}, last_wished_year: {self.last_wished_year}"
+        out = f" user_id: {self.user_id}, date: {self.date}, last_wished_year: {self.last_wished_year}"
+        if self.timezone:
+            out += f", timezone: {self.timezone}"
+        return out
@@ -1,7 +1,11 @@
+import math
 import sqlite3
+from datetime import datetime
 from sqlite3 import Error
 from typing import Final
 
+from dateutil import parser
+
 from src import constants
 from src.constants import LOGGER
 
@@ -40,7 +44,81 @@ CREATE_BIRTHDAY_TABLE: Final[str] = """
     )
 """
 
-DB_SCHEMA_VERSION: Final[int] = 2
+CREATE_RESPONSE_HITS_TABLE: Final[str] = """
+    CREATE TABLE IF NOT EXISTS response_hits(
+        rule TEXT PRIMARY KEY NOT NULL,
+        hits INTEGER NOT NULL,
+        last_hit TEXT
+    )
+"""
+
+ADD_ANNOUNCEMENTS_DUE_EPOCH_COLUMN: Final[str] = """
+    ALTER TABLE announcements ADD COLUMN due_epoch INTEGER NOT NULL DEFAULT 0
+"""
+
+CREATE_ANNOUNCEMENTS_DUE_EPOCH_INDEX: Final[str] = """
+    CREATE INDEX IF NOT EXISTS announcements_due_epoch ON announcements(due_epoch)
+"""
+
+ADD_ANNOUNCEMENTS_RECURRENCE_COLUMN: Final[str] = """
+    ALTER TABLE announcements ADD COLUMN recurrence TEXT
+"""
+
+ADD_ANNOUNCEMENTS_STATE_COLUMN: Final[str] = """
+    ALTER TABLE announcements ADD COLUMN state TEXT NOT NULL DEFAULT 'pending'
+"""
+
+ADD_ANNOUNCEMENTS_ATTEMPTS_COLUMN: Final[str] = """
+    ALTER TABLE announcements ADD COLUMN attempts INTEGER NOT NULL DEFAULT 0
+"""
+
+ADD_ANNOUNCEMENTS_LAST_ERROR_COLUMN: Final[str] = """
+    ALTER TABLE announcements ADD COLUMN last_error TEXT
+"""
+
+ADD_ANNOUNCEMENTS_SENDING_EPOCH_COLUMN: Final[str] = """
+    ALTER TABLE announcements ADD COLUMN sending_epoch INTEGER
+"""
+
+CREATE_ANNOUNCEMENTS_STATE_DUE_EPOCH_INDEX: Final[str] = """
+    CREATE INDEX IF NOT EXISTS announcements_state_due_epoch ON announcements(state, due_epoch)
+"""
+
+CREATE_SCHEDULER_STATE_TABLE: Final[str] = """
+    CREATE TABLE IF NOT EXISTS scheduler_state(
+        key TEXT PRIMARY KEY NOT NULL,
+        value TEXT NOT NULL
+    )
+"""
+
+ADD_BIRTHDAYS_MONTH_COLUMN: Final[str] = """
+    ALTER TABLE birthdays ADD COLUMN month INTEGER NOT NULL DEFAULT 0
+"""
+
+ADD_BIRTHDAYS_DAY_COLUMN: Final[str] = """
+    ALTER TABLE birthdays ADD COLUMN day INTEGER NOT NULL DEFAULT 0
+"""
+
+CREATE_BIRTHDAYS_MONTH_DAY_INDEX: Final[str] = """
+    CREATE INDEX IF NOT EXISTS birthdays_month_day ON birthdays(month, day)
+"""
+
+CREATE_BIRTHDAYS_UNPARSED_TABLE: Final[str] = """
+    CREATE TABLE IF NOT EXISTS birthdays_unparsed(
+        user_id INTEGER UNIQUE NOT NULL,
+        date TEXT NOT NULL,
+        last_wished_year INTEGER NOT NULL
+    )
+"""
+
+# Birthdays are parsed in a leap year, so February 29th is valid.
+BIRTHDAY_PARSE_DEFAULT: Final = datetime(2000, 1, 1)
+
+ADD_BIRTHDAYS_TIMEZONE_COLUMN: Final[str] = """
+    ALTER TABLE birthdays ADD COLUMN timezone TEXT
+"""
+
+DB_SCHEMA_VERSION: Final[int] = 9
 
 
 class DbManager:
@@ -94,6 +172,129 @@ class DbManager:
         # Create birthdays table
         self.cursor.execute(CREATE_BIRTHDAY_TABLE)
 
+    def upgrade_to_version_3(self):
+        """
+        DO NOT MODIFY THIS FUNCTION. It will break the database. If the database schema must change, add a new upgrade function and increment DB_SCHEMA_VERSION.
+
+        Upgrades the database schema to version 3 by adding the 'response_hits' table.
+
+        Note: This function assumes that a database connection has already been established.
+        """
+        LOGGER.w(TAG, "upgrade_to_version_3(): upgrading to version 3")
+
+        # Create response_hits table
+        self.cursor.execute(CREATE_RESPONSE_HITS_TABLE)
+
+    def upgrade_to_version_4(self):
+        """
+        DO NOT MODIFY THIS FUNCTION. It will break the database. If the database schema must change, add a new upgrade function and increment DB_SCHEMA_VERSION.
+
+        Upgrades the database schema to version 4 by adding the indexed 'due_epoch' column to the 'announcements' table.
+        'due_epoch' is the due time as a UTC epoch in whole seconds, rounded up so an announcement is never sent early.
+        Announcements whose 'time' cannot be parsed could never be sent, so they are logged and deleted.
+
+        Note: This function assumes that a database connection has already been established.
+        """
+        LOGGER.w(TAG, "upgrade_to_version_4(): upgrading to version 4")
+
+        self.cursor.execute(ADD_ANNOUNCEMENTS_DUE_EPOCH_COLUMN)
+        params = []
+        unparsed = []
+        for row_id, time, channel, message in self.cursor.execute("SELECT id, time, channel, message FROM announcements").fetchall():
+            try:
+                params.append((math.ceil(parser.parse(time).timestamp()), row_id))
+            except (ValueError, OverflowError) as e:
+                LOGGER.e(TAG, f"upgrade_to_version_4(): deleting announcement {row_id} with an unparsable time: {time}, channel: {channel}, message: {message}", e)
+                unparsed.append((row_id,))
+        self.cursor.executemany("UPDATE announcements SET due_epoch=? WHERE id=?", params)
+        self.cursor.executemany("DELETE FROM announcements WHERE id=?", unparsed)
+        self.cursor.execute(CREATE_ANNOUNCEMENTS_DUE_EPOCH_INDEX)
+
+    def upgrade_to_version_5(self):
+        """
+        DO NOT MODIFY THIS FUNCTION. It will break the database. If the database schema must change, add a new upgrade function and increment DB_SCHEMA_VERSION.
+
+        Upgrades the database schema to version 5 by adding the 'recurrence' column to the 'announcements' table.
+        Announcements without a recurrence are sent once. Recurring announcements are moved to their next occurrence instead of being deleted.
+
+        Note: This function assumes that a database connection has already been established.
+        """
+        LOGGER.w(TAG, "upgrade_to_version_5(): upgrading to version 5")
+
+        self.cursor.execute(ADD_ANNOUNCEMENTS_RECURRENCE_COLUMN)
+
+    def upgrade_to_version_6(self):
+        """
+        DO NOT MODIFY THIS FUNCTION. It will break the database. If the database schema must change, add a new upgrade function and increment DB_SCHEMA_VERSION.
+
+        Upgrades the database schema to version 6 by adding the delivery columns 'state', 'attempts', 'last_error' and 'sending_epoch' to the 'announcements' table, indexed on (state, due_epoch).
+        'state' is 'pending' until an announcement is due, 'sending' while it is being sent, and 'failed' once it has run out of attempts.
+        'sending_epoch' is the UTC epoch of the last time the announcement was marked as sending, or NULL if it never was.
+
+        Note: This function assumes that a database connection has already been established.
+        """
+        LOGGER.w(TAG, "upgrade_to_version_6(): upgrading to version 6")
+
+        self.cursor.execute(ADD_ANNOUNCEMENTS_STATE_COLUMN)
+        self.cursor.execute(ADD_ANNOUNCEMENTS_ATTEMPTS_COLUMN)
+        self.cursor.execute(ADD_ANNOUNCEMENTS_LAST_ERROR_COLUMN)
+        self.cursor.execute(ADD_ANNOUNCEMENTS_SENDING_EPOCH_COLUMN)
+        self.cursor.execute(CREATE_ANNOUNCEMENTS_STATE_DUE_EPOCH_INDEX)
+
+    def upgrade_to_version_7(self):
+        """
+        DO NOT MODIFY THIS FUNCTION. It will break the database. If the database schema must change, add a new upgrade function and increment DB_SCHEMA_VERSION.
+
+        Upgrades the database schema to version 7 by adding the 'scheduler_state' table, where schedulers persist markers such as the last day they processed.
+
+        Note: This function assumes that a database connection has already been established.
+        """
+        LOGGER.w(TAG, "upgrade_to_version_7(): upgrading to version 7")
+
+        # Create scheduler_state table
+        self.cursor.execute(CREATE_SCHEDULER_STATE_TABLE)
+
+    def upgrade_to_version_8(self):
+        """
+        DO NOT MODIFY THIS FUNCTION. It will break the database. If the database schema must change, add a new upgrade function and increment DB_SCHEMA_VERSION.
+
+        Upgrades the database schema to version 8 by adding the indexed 'month' and 'day' columns to the 'birthdays' table, backfilled from the 'date' column.
+        Birthdays whose 'date' cannot be parsed are moved to the 'birthdays_unparsed' table, so they can be fixed by hand, but are not returned by birthday queries.
+
+        Note: This function assumes that a database connection has already been established.
+        """
+        LOGGER.w(TAG, "upgrade_to_version_8(): upgrading to version 8")
+
+        self.cursor.execute(ADD_BIRTHDAYS_MONTH_COLUMN)
+        self.cursor.execute(ADD_BIRTHDAYS_DAY_COLUMN)
+        self.cursor.execute(CREATE_BIRTHDAYS_UNPARSED_TABLE)
+        params = []
+        unparsed = []
+        for user_id, date in self.cursor.execute("SELECT user_id, date FROM birthdays").fetchall():
+            try:
+                parsed_date = parser.parse(date, default=BIRTHDAY_PARSE_DEFAULT)
+                params.append((parsed_date.month, parsed_date.day, user_id))
+            except (ValueError, OverflowError) as e:
+                LOGGER.e(TAG, f"upgrade_to_version_8(): failed to parse the birthday of user {user_id}. Moving it to birthdays_unparsed: {date}", e)
+                unparsed.append((user_id,))
+        self.cursor.executemany("UPDATE birthdays SET month=?, day=? WHERE user_id=?", params)
+        self.cursor.executemany("INSERT INTO birthdays_unparsed(user_id, date, last_wished_year) SELECT user_id, date, last_wished_year FROM birthdays WHERE user_id=?", unparsed)
+        self.cursor.executemany("DELETE FROM birthdays WHERE user_id=?", unparsed)
+        self.cursor.execute(CREATE_BIRTHDAYS_MONTH_DAY_INDEX)
+
+    def upgrade_to_version_9(self):
+        """
+        DO NOT MODIFY THIS FUNCTION. It will break the database. If the database schema must change, add a new upgrade function and increment DB_SCHEMA_VERSION.
+
+        Upgrades the database schema to version 9 by adding the 'timezone' column to the 'birthdays' table.
+        'timezone' is an IANA timezone name, or NULL to use the default birthday timezone.
+
+        Note: This function assumes that a database connection has already been established.
+        """
+        LOGGER.w(TAG, "upgrade_to_version_9(): upgrading to version 9")
+
+        self.cursor.execute(ADD_BIRTHDAYS_TIMEZONE_COLUMN)
+
     def set_db_schema_version(self, version: int) -> bool:
         """
         Sets the database schema version.
@@ -149,11 +350,26 @@ class DbManager:
                 # The value is the name of the upgrade function.
                 # Do not add parentheses, or it will get executed every time.
                 1: self.create_tables,
-                2: self.upgrade_to_version_2
+                2: self.upgrade_to_version_2,
+                3: self.upgrade_to_version_3,
+                4: self.upgrade_to_version_4,
+                5: self.upgrade_to_version_5,
+                6: self.upgrade_to_version_6,
+                7: self.upgrade_to_version_7,
+                8: self.upgrade_to_version_8,
+                9: self.upgrade_to_version_9
             }
 
-            upgrade.get(from_version + 1, lambda: None)()
-            from_version += 1
+            # Each upgrade is committed together with its version, so a failed upgrade is rolled back instead of being
+            # applied again on the next start
+            self.cursor.execute("BEGIN")
+            try:
+                upgrade.get(from_version + 1, lambda: None)()
+                from_version += 1
+                self.set_db_schema_version(from_version)
+            except Exception:
+                self.connection.rollback()
+                raise
 
         self.set_db_schema_version(DB_SCHEMA_VERSION)
 
@@ -0,0 +1,133 @@
+import asyncio
+import queue
+import threading
+from typing import Any, Callable, Final, Optional, TypeVar
+
+from src.constants import LOGGER
+from src.db.db_manager import DbManager
+from src.utils.signal_util import signal_util
+
+TAG = "DbThread"
+
+# How often the idle thread checks whether the program was interrupted, in seconds.
+POLL_INTERVAL: Final = 1.0
+
+T = TypeVar("T")
+
+
+def _resolve(future: asyncio.Future, result: Any, error: Optional[BaseException]):
+    # The caller may have been cancelled while its request was running
+    if future.done():
+        return
+    if error is not None:
+        future.set_exception(error)
+    else:
+        future.set_result(result)
+
+
+class DbThread:
+    """
+    Runs database work on one dedicated thread with its own connection, so coroutines never block the event loop on
+    sqlite3 or on the fsync of a commit. Requests are queued and run one at a time in the order they were made, and the
+    result or exception of each request is handed back to the awaiting coroutine.
+    """
+
+    def __init__(self, path_to_db: str):
+        self.path_to_db = path_to_db
+        self.is_running = False
+        self._requests: queue.Queue = queue.Queue()
+        self._daos: dict[type, Any] = {}
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self):
+        with self._lock:
+            if self.is_running:
+                return
+            self.is_running = True
+            self._thread = threading.Thread(target=self._loop, name=TAG)
+            self._thread.start()
+
+    def stop(self):
+        """
+        Stop the thread after the requests that are already queued, and wait for it to close its connection.
+        """
+        self.is_running = False
+        # Wake the thread up, so it does not wait for the next poll to notice
+        self._requests.put(None)
+        if self._thread is not None:
+            self._thread.join()
+
+    async def run(self, function: Callable[[DbManager], T]) -> T:
+        """
+        Run a function on the database thread. The thread is started by the first request.
+
+        Args:
+            function: Called with the DbManager of the database thread.
+
+        Returns:
+            T: The return value of the function. Exceptions raised by the function are raised here.
+        """
+        self.start()
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._requests.put((function, future, loop))
+        return await future
+
+    async def call(self, dao_class: type, name: str, *args, **kwargs) -> Any:
+        """
+        Call a method of a DAO on the database thread. Each DAO class is created once, on the database thread.
+        """
+        def function(db_manager: DbManager):
+            if dao_class not in self._daos:
+                self._daos[dao_class] = dao_class(db_manager)
+            return getattr(self._daos[dao_class], name)(*args, **kwargs)
+
+        return await self.run(function)
+
+    def _loop(self):
+        # Need to get the DB manager here because it needs to be initialized in the same thread it is used from
+        db_manager = DbManager(self.path_to_db)
+        LOGGER.i(TAG, "DbThread started")
+        while not signal_util.is_interrupted and (self.is_running or not self._requests.empty()):
+            try:
+                request = self._requests.get(timeout=POLL_INTERVAL)
+            except queue.Empty:
+                continue
+            if request is None:
+                continue
+            function, future, loop = request
+            result, error = None, None
+            try:
+                result = function(db_manager)
+            except Exception as e:
+                LOGGER.e(TAG, "_loop: request failed", e)
+                error = e
+            try:
+                loop.call_soon_threadsafe(_resolve, future, result, error)
+            except RuntimeError as e:
+                # The event loop of the caller is closed, so nobody is waiting for the result
+                LOGGER.w(TAG, f"_loop: could not return the result of a request: {e}")
+        self.is_running = False
+        db_manager.close()
+        LOGGER.i(TAG, "DbThread stopped")
+
+
+class AsyncDao:
+    """
+    An awaitable version of a DAO. Every method of the DAO class is available as a coroutine that runs the method on a
+    DbThread, for example `await AsyncDao(db_thread, BirthdayDao).forget_birthday(user_id)`.
+    """
+
+    def __init__(self, db_thread: DbThread, dao_class: type):
+        self.db_thread = db_thread
+        self.dao_class = dao_class
+
+    def __getattr__(self, name: str) -> Callable:
+        if name.startswith("_") or not callable(getattr(self.dao_class, name, None)):
+            raise AttributeError(f"{self.dao_class.__name__} has no method {name}")
+
+        async def call(*args, **kwargs):
+            return await self.db_thread.call(self.dao_class, name, *args, **kwargs)
+
+        return call
@@ -0,0 +1,45 @@
+from datetime import datetime
+
+from dateutil import parser
+
+from src.constants import LOGGER
+from src.db.db_manager import DbManager, db_manager
+from src.db.response_hits.response_hits_record import ResponseHitsRecord
+
+# Keeping these here for reference, but don't use them because formatted strings in queries are bad.
+# TABLE_RESPONSE_HITS = 'response_hits'
+# COLUMN_RULE = 'rule'
+# COLUMN_HITS = 'hits'
+# COLUMN_LAST_HIT = 'last_hit'
+
+TAG = "ResponseHitsDao"
+
+
+class ResponseHitsDao:
+    def __init__(self, db_manager: DbManager):
+        self.db_manager = db_manager
+
+    def get_all_hits(self) -> list[ResponseHitsRecord]:
+        query = "SELECT * FROM response_hits"
+        LOGGER.i(TAG, f"get_all_hits(): executing {query}")
+        vals = self.db_manager.cursor.execute(query).fetchall()
+        out = []
+        for val in vals:
+            out.append(ResponseHitsRecord(val[0], val[1], parser.parse(val[2]) if val[2] else None))
+        return out
+
+    def add_hits(self, hits: dict[str, tuple[int, datetime]]):
+        """
+        Add a batch of hit counts in one transaction.
+
+        Args:
+            hits: The number of new hits and the time of the last hit, by rule.
+        """
+        query = "INSERT INTO response_hits(rule, hits, last_hit) VALUES(?, ?, ?) ON CONFLICT(rule) DO UPDATE SET hits = hits + excluded.hits, last_hit = excluded.last_hit"
+        params = [(rule, count, last_hit) for rule, (count, last_hit) in hits.items()]
+        LOGGER.i(TAG, f"add_hits(): executing {query} for {len(params)} rules")
+        self.db_manager.cursor.executemany(query, params)
+        self.db_manager.connection.commit()
+
+
+response_hits_dao = ResponseHitsDao(db_manager)
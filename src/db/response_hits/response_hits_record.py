@@ -0,0 +1,13 @@
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Optional
+
+
+@dataclass
+class ResponseHitsRecord:
+    rule: str
+    hits: int
+    last_hit: Optional[datetime] = None
+
+    def __str__(self):
+        return f"rule: {self.rule}, hits: {self.hits}, last_hit: {self.last_hit}"
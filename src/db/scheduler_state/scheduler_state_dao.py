@@ -0,0 +1,35 @@
+from typing import Optional
+
+from src.constants import LOGGER
+from src.db.db_manager import DbManager, db_manager
+
+# Keeping these here for reference, but don't use them because formatted strings in queries are bad.
+# TABLE_SCHEDULER_STATE = 'scheduler_state'
+# COLUMN_KEY = 'key'
+# COLUMN_VALUE = 'value'
+
+TAG = "SchedulerStateDao"
+
+
+class SchedulerStateDao:
+    def __init__(self, db_manager: DbManager):
+        self.db_manager = db_manager
+
+    def get_value(self, key: str) -> Optional[str]:
+        query = "SELECT value FROM scheduler_state WHERE key=?"
+        params = (key,)
+        LOGGER.i(TAG, f"get_value(): executing {query} with params {params}")
+        val = self.db_manager.cursor.execute(query, params).fetchone()
+        if val is not None:
+            return val[0]
+        return None
+
+    def set_value(self, key: str, value: str):
+        query = "INSERT OR REPLACE INTO scheduler_state(key, value) VALUES(?, ?)"
+        params = (key, value)
+        LOGGER.i(TAG, f"set_value(): executing {query} with params {params}")
+        self.db_manager.cursor.execute(query, params)
+        self.db_manager.connection.commit()
+
+
+scheduler_state_dao = SchedulerStateDao(db_manager)
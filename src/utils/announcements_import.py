@@ -0,0 +1,94 @@
+import csv
+import io
+import json
+import re
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Final, Optional
+
+from dateutil import parser
+
+from src import constants
+from src.constants import LOGGER
+from src.utils.recurrence import parse_recurrence
+
+TAG = "announcements_import.py"
+
+MAX_MESSAGE_LENGTH: Final = 2000
+MAX_IMPORT_ROWS: Final = 1000
+_CHANNEL_MENTION: Final = re.compile(r"^<#(\d+)>$")
+
+
+@dataclass
+class ImportedAnnouncement:
+    time: datetime
+    channel: int
+    message: str
+    recurrence: Optional[str] = None
+
+
+def _read_rows(filename: str, data: bytes) -> list[dict]:
+    text = data.decode("utf-8-sig")
+    if filename.lower().endswith(".json"):
+        rows = json.loads(text)
+        if not isinstance(rows, list) or not all(isinstance(row, dict) for row in rows):
+            raise ValueError("a JSON import must be a list of objects")
+        return rows
+    return list(csv.DictReader(io.StringIO(text)))
+
+
+def _parse_row(row: dict, now: datetime) -> ImportedAnnouncement:
+    time = str(row.get("time") or "").strip()
+    channel = str(row.get("channel") or "").strip()
+    message = str(row.get("message") or "").replace("\\n", "\n")
+    recurrence = str(row.get("recurrence") or "").strip().lower() or None
+    if not time or not channel or not message.strip():
+        raise ValueError("time, channel and message are required")
+    parsed_time = parser.parse(time)
+    if parsed_time.tzinfo is None:
+        parsed_time = constants.JST.localize(parsed_time)
+    if parsed_time <= now:
+        raise ValueError(f"time is in the past: {parsed_time}")
+    mention = _CHANNEL_MENTION.match(channel)
+    if not (mention or channel.isdigit()):
+        raise ValueError(f"channel must be a channel ID or mention: {channel}")
+    if len(message) > MAX_MESSAGE_LENGTH:
+        raise ValueError(f"message is longer than {MAX_MESSAGE_LENGTH} characters")
+    if recurrence is not None:
+        parse_recurrence(recurrence)
+    return ImportedAnnouncement(parsed_time, int(mention.group(1) if mention else channel), message, recurrence)
+
+
+def parse_announcements_import(filename: str, data: bytes, now: datetime) -> tuple[list[ImportedAnnouncement], list[str]]:
+    """
+    Parse and validate every row of a bulk import file. Nothing should be written unless there are no errors.
+
+    A CSV file needs a header row with the columns time, channel, message and, optionally, recurrence. A JSON file is a
+    list of objects with the same keys. The columns take the same values as the options of /schedule_announcement.
+
+    Args:
+        filename: The name of the uploaded file. Files ending in .json are read as JSON, anything else as CSV.
+        data: The content of the file.
+        now: Rows due at or before this time are rejected.
+
+    Returns:
+        tuple[list[ImportedAnnouncement], list[str]]: The valid rows and the errors of the invalid rows.
+    """
+    try:
+        rows = _read_rows(filename, data)
+    except (ValueError, csv.Error) as e:
+        LOGGER.e(TAG, f"parse_announcements_import: failed to read {filename}", e)
+        return [], [f"could not read {filename}: {e}"]
+    if not rows:
+        return [], [f"{filename} has no announcements"]
+    if len(rows) > MAX_IMPORT_ROWS:
+        return [], [f"{filename} has {len(rows)} announcements, but at most {MAX_IMPORT_ROWS} can be imported at once"]
+    announcements = []
+    errors = []
+    for index, row in enumerate(rows):
+        try:
+            announcements.append(_parse_row(row, now))
+        except (ValueError, OverflowError) as e:
+            # For CSV files, row 1 is the header, so the first announcement is on line 2
+            errors.append(f"row {index + 1 if filename.lower().endswith('.json') else index + 2}: {e}")
+    return announcements, errors
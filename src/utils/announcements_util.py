@@ -1,7 +1,8 @@
 import asyncio
+import math
 import threading
-from datetime import datetime
-from typing import Final
+from datetime import datetime, timedelta, timezone
+from typing import Final, Optional
 
 import discord
 from discord import Client
@@ -10,17 +11,47 @@ from tzlocal import get_localzone
 from src import constants
 from src.constants import LOGGER
 from src.db.announcements.announcements_dao import AnnouncementsDao
+from src.db.announcements.announcements_record import AnnouncementsRecord
 from src.db.db_manager import DbManager
+from src.utils.attachment_store import attachment_store
+from src.utils.catch_up import CatchUpPolicy, Pacer
+from src.utils.recurrence import parse_recurrence
+from src.utils.response_limiter import RateLimit
 from src.utils.signal_util import signal_util
 
 TAG = "AnnouncementsUtil"
-SLEEP_DELAY: Final = 60  # One minute
+MAX_CONCURRENT_CHANNELS: Final = 5
+CATCH_UP_RATE_LIMIT: Final = RateLimit(1, 2)
+# Failed sends are retried after RETRY_BASE_DELAY * 2 ** (attempts - 1) seconds, up to RETRY_MAX_DELAY.
+RETRY_BASE_DELAY: Final = 30
+RETRY_MAX_DELAY: Final = 3600
+MAX_ATTEMPTS: Final = 8
+# How many messages to look through for an announcement that may have been posted before the bot stopped. The search
+# starts at the time the announcement was marked as sending, and ends RECONCILE_SEND_WINDOW later.
+RECONCILE_HISTORY_LIMIT: Final = 500
+RECONCILE_SEND_WINDOW: Final = timedelta(minutes=15)
+RECONCILE_CLOCK_SKEW: Final = timedelta(minutes=1)
 
 
 class AnnouncementsUtil:
-    def __init__(self, client: Client):
+    """
+    Sends scheduled announcements. The thread sleeps until the next announcement is due, and is woken up early by
+    notify_changed() when an announcement is scheduled or canceled, so it does not poll the database while idle.
+
+    The announcements table is an outbox. Due announcements are marked as sending before they are sent, and their
+    outcome is recorded afterwards. Failed sends are retried with exponential backoff. On startup, announcements that were
+    still marked as sending are looked up in the channel history, so they are not posted twice.
+    """
+
+    def __init__(self, client: Client, max_concurrent_channels: int = MAX_CONCURRENT_CHANNELS, catch_up_policy: CatchUpPolicy = CatchUpPolicy(), catch_up_rate_limit: RateLimit = CATCH_UP_RATE_LIMIT):
         self.is_running = False
         self.client = client
+        self.max_concurrent_channels = max_concurrent_channels
+        self.catch_up_policy = catch_up_policy
+        self._pacer = Pacer(catch_up_rate_limit)
+        self._changed = False
+        # Announcements due before this time that were never attempted were missed while the bot was down
+        self._started_at = datetime.now(get_localzone())
         self.start()
 
     def start(self):
@@ -31,27 +62,211 @@ class AnnouncementsUtil:
 
     def stop(self):
         self.is_running = False
+        signal_util.notify()
+
+    def notify_changed(self):
+        """
+        Wake up the announcements thread to pick up a scheduled or canceled announcement.
+        """
+        self._changed = True
+        signal_util.notify()
+
+    def _get_sleep_delay(self, next_time: Optional[datetime]) -> Optional[float]:
+        if next_time is None:
+            LOGGER.d(TAG, "No announcements scheduled. Waiting until an announcement is scheduled.")
+            return None
+        delay = max((next_time - datetime.now(get_localzone())).total_seconds(), 0)
+        LOGGER.d(TAG, f"Next announcement is due in {delay} seconds")
+        return delay
+
+    async def _get_file(self, announcement: AnnouncementsRecord) -> discord.File:
+        if not announcement.attachment:
+            return discord.utils.MISSING
+        sha256 = announcement.attachment.get("sha256")
+        if attachment_store.has(sha256):
+            # Streamed from local disk, so sending does not depend on the CDN URL still being valid
+            return discord.File(attachment_store.get_path(sha256), filename=announcement.attachment.get("filename"))
+        # Announcements scheduled before the attachment store existed only have the CDN URL
+        LOGGER.w(TAG, f"_get_file: attachment of announcement {announcement.id} is not in the attachment store. Downloading it from the CDN.")
+        attachment = discord.Attachment(data=announcement.attachment, state=self.client._get_state())
+        return await attachment.to_file()
+
+    def _is_missed(self, announcement: AnnouncementsRecord) -> bool:
+        """
+        Check if an announcement was missed while the bot was down. Only those are subject to the catch-up policy.
+        Announcements that are waiting for a retry are late too, but they are retried as scheduled.
+        """
+        return announcement.attempts == 0 and CatchUpPolicy.is_late(announcement.time, self._started_at)
+
+    async def _send_announcement(self, announcement: AnnouncementsRecord):
+        channel = self.client.get_channel(announcement.channel)
+        if channel is None:
+            raise LookupError(f"channel not found: {announcement.channel}")
+        await channel.send(announcement.message, file=await self._get_file(announcement))
+        lag = (datetime.now(get_localzone()) - announcement.time).total_seconds()
+        LOGGER.i(TAG, f"_send_announcement: sent announcement {announcement.id} to channel {announcement.channel} with a dispatch lag of {lag:.3f} seconds")
+
+    async def _send_channel_announcements(self, announcements: list[AnnouncementsRecord], semaphore: asyncio.Semaphore, results: dict[int, Optional[Exception]]):
+        async with semaphore:
+            for announcement in announcements:
+                if self._is_missed(announcement):
+                    # Missed announcements are spread out, so a restart after an outage does not flood the channels
+                    await self._pacer.wait()
+                try:
+                    await self._send_announcement(announcement)
+                except Exception as e:
+                    # Stop here, so the remaining announcements of this channel are not posted out of order
+                    LOGGER.e(TAG, f"_send_channel_announcements: failed to send announcement {announcement.id}", e)
+                    results[announcement.id] = e
+                    return
+                results[announcement.id] = None
+
+    async def _dispatch(self, announcements: list[AnnouncementsRecord]) -> dict[int, Optional[Exception]]:
+        """
+        Send due announcements. Announcements to the same channel are sent one after another in due order, and up to
+        max_concurrent_channels channels are sent to in parallel.
+
+        Args:
+            announcements: The due announcements, oldest first.
+
+        Returns:
+            dict[int, Optional[Exception]]: The outcome of each attempted announcement by ID: None if it was sent, or the
+                error if it failed. Announcements after a failure in the same channel are not attempted and not included.
+        """
+        announcements_by_channel: dict[int, list[AnnouncementsRecord]] = {}
+        for announcement in announcements:
+            announcements_by_channel.setdefault(announcement.channel, []).append(announcement)
+        semaphore = asyncio.Semaphore(self.max_concurrent_channels)
+        results = {}
+        await asyncio.gather(*(self._send_channel_announcements(channel_announcements, semaphore, results) for channel_announcements in announcements_by_channel.values()))
+        return results
+
+    async def _was_posted(self, announcement: AnnouncementsRecord) -> bool:
+        """
+        Check the channel history for an announcement that was being sent when the bot stopped. The history is read from
+        the time of the last attempt, which may be long after the due time because of retries.
+        """
+        channel = self.client.get_channel(announcement.channel)
+        if channel is None:
+            return False
+        since = datetime.fromtimestamp(announcement.sending_epoch, timezone.utc)
+        async for message in channel.history(limit=RECONCILE_HISTORY_LIMIT, after=since - RECONCILE_CLOCK_SKEW, oldest_first=True):
+            if message.created_at > since + RECONCILE_SEND_WINDOW:
+                break
+            if message.author == self.client.user and message.content == announcement.message:
+                return True
+        return False
+
+    def _reconcile(self, announcements_dao: AnnouncementsDao, loop):
+        """
+        Resolve the announcements that were being sent when the bot stopped, so they are neither lost nor posted twice.
+        """
+        for announcement in announcements_dao.get_sending_announcements():
+            try:
+                posted = asyncio.run_coroutine_threadsafe(self._was_posted(announcement), loop).result()
+            except Exception as e:
+                LOGGER.e(TAG, f"_reconcile: failed to check the history of channel {announcement.channel}", e)
+                posted = False
+            LOGGER.w(TAG, f"_reconcile: announcement {announcement.id} was interrupted while sending. Posted: {posted}")
+            if posted:
+                self._complete(announcements_dao, announcement)
+            else:
+                announcements_dao.defer_announcement(announcement.id, math.ceil(announcement.time.timestamp()))
+
+    @staticmethod
+    def _get_retry_delay(attempts: int) -> float:
+        return min(RETRY_BASE_DELAY * 2 ** attempts, RETRY_MAX_DELAY)
+
+    def _record_failure(self, announcements_dao: AnnouncementsDao, announcement: AnnouncementsRecord, error: Exception) -> int:
+        """
+        Record a failed attempt and back off exponentially. Errors that cannot go away by themselves, and announcements
+        that run out of attempts, are not retried. A recurring announcement moves on to its next occurrence instead.
+
+        Returns:
+            int: The UTC epoch of the retry, or of the next occurrence.
+        """
+        now = datetime.now(get_localzone())
+        permanent = isinstance(error, (discord.Forbidden, discord.NotFound))
+        if not permanent and announcement.attempts + 1 < MAX_ATTEMPTS:
+            retry_epoch = math.ceil(now.timestamp() + self._get_retry_delay(announcement.attempts))
+            LOGGER.w(TAG, f"_record_failure: announcement {announcement.id} will be retried at {datetime.fromtimestamp(retry_epoch, timezone.utc)}")
+            announcements_dao.record_failed_attempt(announcement.id, repr(error), retry_epoch)
+            return retry_epoch
+        LOGGER.e(TAG, f"_record_failure: giving up on announcement {announcement.id} after {announcement.attempts + 1} attempts")
+        announcements_dao.record_failed_attempt(announcement.id, repr(error), None)
+        if announcement.recurrence:
+            self._complete(announcements_dao, announcement)
+        return math.ceil(now.timestamp())
+
+    def _complete(self, announcements_dao: AnnouncementsDao, announcement: AnnouncementsRecord):
+        """
+        Delete an announcement that was sent, or move it to its next occurrence if it is recurring.
+        """
+        next_time = None
+        if announcement.recurrence:
+            try:
+                next_time = parse_recurrence(announcement.recurrence).next_after(announcement.time, datetime.now(get_localzone()))
+            except ValueError as e:
+                LOGGER.e(TAG, f"_complete: invalid recurrence for announcement {announcement.id}: {announcement.recurrence}", e)
+        if next_time is None:
+            announcements_dao.delete_announcement_by_id(announcement.id)
+            return
+        LOGGER.d(TAG, f"_complete: announcement {announcement.id} repeats at {next_time}")
+        announcements_dao.reschedule_announcement(announcement.id, next_time)
+
+    def _process_due_announcements(self, announcements_dao: AnnouncementsDao, loop):
+        """
+        Send the due announcements and record their outcomes.
+        """
+        now = datetime.now(get_localzone())
+        due = announcements_dao.get_due_announcements(now)
+        _, dropped = self.catch_up_policy.select([announcement for announcement in due if self._is_missed(announcement)], now, lambda announcement: announcement.time, lambda announcement: announcement.channel)
+        dropped_ids = {announcement.id for announcement in dropped}
+        announcements = [announcement for announcement in due if announcement.id not in dropped_ids]
+        for announcement in dropped:
+            LOGGER.w(TAG, f"_process_due_announcements: dropping missed announcement {announcement.id} because of catch-up policy {self.catch_up_policy}")
+            self._complete(announcements_dao, announcement)
+        if any(announcement.attachment for announcement in dropped):
+            attachment_store.collect_garbage(announcements_dao.get_attachment_hashes())
+        if not announcements:
+            return
+        LOGGER.d(TAG, f"Dispatching {len(announcements)} due announcements")
+        announcements_dao.mark_sending([announcement.id for announcement in announcements], now)
+        results = asyncio.run_coroutine_threadsafe(self._dispatch(announcements), loop).result()
+        retry_epochs: dict[int, int] = {}
+        for announcement in announcements:
+            if announcement.id not in results:
+                # Not attempted because an earlier announcement to the channel failed. Retry it after that one.
+                announcements_dao.defer_announcement(announcement.id, retry_epochs[announcement.channel])
+            elif results[announcement.id] is None:
+                self._complete(announcements_dao, announcement)
+            else:
+                retry_epochs[announcement.channel] = self._record_failure(announcements_dao, announcement, results[announcement.id])
+        if any(announcement.attachment and results.get(announcement.id, False) is None for announcement in announcements):
+            attachment_store.collect_garbage(announcements_dao.get_attachment_hashes())
 
     def _loop(self, loop):
         db_manager = DbManager(constants.DB_PATH)
         announcements_dao = AnnouncementsDao(db_manager)
+        reconciled = False
+        failures = 0
         while not signal_util.is_interrupted and self.is_running:
             LOGGER.d(TAG, "AnnouncementsUtil is processing announcements...")
-            announcements = announcements_dao.get_all_announcements()
-            if announcements is None:
-                LOGGER.d(TAG, "No announcements to process")
-                signal_util.wait(SLEEP_DELAY)
-                continue
-            for announcement in announcements:
-                LOGGER.d(TAG, f"announcement: {announcement}")
-                if announcement.time < datetime.now(get_localzone()):
-                    channel = self.client.get_channel(announcement.channel)
-                    # TODO: add try/catch
-                    if channel is not None:
-                        attachment_from_announcement = discord.Attachment(data=announcement.attachment, state=self.client._get_state()) if announcement.attachment else None
-                        file = asyncio.run_coroutine_threadsafe(attachment_from_announcement.to_file(), loop).result() if attachment_from_announcement else discord.utils.MISSING
-                        asyncio.run_coroutine_threadsafe(channel.send(announcement.message, file=file), loop).result()
-                        announcements_dao.delete_announcement_by_id(announcement.id)
-            signal_util.wait(SLEEP_DELAY)
+            self._changed = False
+            try:
+                if not reconciled:
+                    self._reconcile(announcements_dao, loop)
+                    reconciled = True
+                self._process_due_announcements(announcements_dao, loop)
+                delay = self._get_sleep_delay(announcements_dao.get_next_due_time())
+                failures = 0
+            except Exception as e:
+                # A locked database or a failed dispatch must not end the thread, or no announcement is sent until the
+                # bot restarts. Announcements the pass left marked as sending are reconciled before the next pass.
+                delay = self._get_retry_delay(failures)
+                failures += 1
+                reconciled = False
+                LOGGER.e(TAG, f"_loop: failed to process announcements. Trying again in {delay} seconds", e)
+            signal_util.wait(delay, lambda: self._changed or not self.is_running)
         self.stop()
         LOGGER.i(TAG, "AnnouncementsUtil stopped")
@@ -0,0 +1,85 @@
+import hashlib
+import os
+import time
+from typing import Final, Optional
+
+from src import constants
+from src.constants import LOGGER
+
+TAG = "AttachmentStore"
+ATTACHMENTS_PATH: Final = f"{constants.OUT_PATH}/attachments/"
+# Blobs younger than this are never collected, so a blob that was just stored for an announcement that is still being
+# inserted is not deleted from under it.
+GC_GRACE_SECONDS: Final = 3600
+
+
+class AttachmentStore:
+    """
+    Content-addressed store for the attachments of scheduled announcements. Each blob is saved once under the SHA-256
+    of its content, so the same file attached to many announcements is only stored once.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        os.makedirs(self.path, exist_ok=True)
+
+    def get_path(self, sha256: str) -> str:
+        return os.path.join(self.path, sha256)
+
+    def has(self, sha256: Optional[str]) -> bool:
+        return sha256 is not None and os.path.isfile(self.get_path(sha256))
+
+    def put(self, data: bytes) -> str:
+        """
+        Store a blob, unless a blob with the same content is already stored.
+
+        Args:
+            data: The content of the attachment.
+
+        Returns:
+            str: The SHA-256 of the content, which is the key of the blob.
+        """
+        sha256 = hashlib.sha256(data).hexdigest()
+        path = self.get_path(sha256)
+        if os.path.isfile(path):
+            # Refresh the modification time, so the garbage collector sees the blob as recently used.
+            os.utime(path)
+            return sha256
+        temp_path = f"{path}.tmp"
+        with open(temp_path, "wb") as blob_file:
+            blob_file.write(data)
+        os.replace(temp_path, path)
+        LOGGER.d(TAG, f"put: stored blob {sha256} of {len(data)} bytes")
+        return sha256
+
+    def collect_garbage(self, referenced: set[str]) -> int:
+        """
+        Delete the blobs that are not referenced by any announcement.
+
+        Args:
+            referenced: The SHA-256 keys of all blobs that are still referenced.
+
+        Returns:
+            int: The number of deleted blobs.
+        """
+        deleted = 0
+        now = time.time()
+        for name in os.listdir(self.path):
+            if name in referenced:
+                continue
+            path = self.get_path(name)
+            try:
+                if now - os.path.getmtime(path) < GC_GRACE_SECONDS:
+                    continue
+                os.remove(path)
+                deleted += 1
+            except FileNotFoundError:
+                # Deleted since the directory was listed, for example by a garbage collection on another thread
+                continue
+            except OSError as e:
+                LOGGER.e(TAG, f"collect_garbage: failed to delete blob: {name}", e)
+        LOGGER.d(TAG, f"collect_garbage: deleted {deleted} blobs")
+        return deleted
+
+
+attachment_store = AttachmentStore(ATTACHMENTS_PATH)
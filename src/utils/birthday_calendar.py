@@ -0,0 +1,110 @@
+import asyncio
+from collections import OrderedDict
+from datetime import date
+from typing import Final, Optional
+
+import discord
+
+from src.constants import LOGGER
+from src.db.birthday.birthday_record import BirthdayRecord
+from src.db.db_thread import AsyncDao
+
+TAG = "BirthdayCalendar"
+
+SORT_BY_MONTH: Final = "month"
+SORT_UPCOMING: Final = "upcoming"
+# Discord resolves at most 100 members per member chunk request.
+MEMBER_QUERY_LIMIT: Final = 100
+# Interactions must be answered within 3 seconds, so a slow member query gives up before that.
+MEMBER_QUERY_TIMEOUT: Final = 2.0
+NAME_CACHE_SIZE: Final = 20000
+
+
+class MemberNameCache:
+    """
+    Bounded LRU cache of display names by user ID. Users that could not be found are cached as None, so members who
+    left the guild are not looked up again on every page.
+    """
+
+    def __init__(self, max_size: int = NAME_CACHE_SIZE):
+        self.max_size = max_size
+        self._names: OrderedDict[int, Optional[str]] = OrderedDict()
+
+    def _put(self, user_id: int, name: Optional[str]):
+        self._names[user_id] = name
+        self._names.move_to_end(user_id)
+        if len(self._names) > self.max_size:
+            self._names.popitem(last=False)
+
+    async def resolve(self, guild: Optional[discord.Guild], user_ids: list[int]) -> dict[int, Optional[str]]:
+        """
+        Get the display names of users. Names come from this cache, then the client's member cache, and the remaining
+        users are requested from the gateway in chunks of MEMBER_QUERY_LIMIT.
+
+        Returns:
+            dict[int, Optional[str]]: The display name of each user, or None if the user is not in the guild.
+        """
+        names = {}
+        missing = []
+        for user_id in user_ids:
+            if user_id in self._names:
+                self._names.move_to_end(user_id)
+                names[user_id] = self._names[user_id]
+            elif guild is not None and (member := guild.get_member(user_id)) is not None:
+                names[user_id] = member.display_name
+                self._put(user_id, member.display_name)
+            else:
+                missing.append(user_id)
+        for start in range(0, len(missing) if guild is not None else 0, MEMBER_QUERY_LIMIT):
+            chunk = missing[start:start + MEMBER_QUERY_LIMIT]
+            try:
+                members = await asyncio.wait_for(guild.query_members(user_ids=chunk, limit=len(chunk), cache=True), MEMBER_QUERY_TIMEOUT)
+            except (asyncio.TimeoutError, discord.ClientException) as e:
+                # Not cached, so the next page tries again
+                LOGGER.w(TAG, f"resolve: failed to query {len(chunk)} members: {e!r}")
+                continue
+            found = {member.id: member.display_name for member in members}
+            LOGGER.d(TAG, f"resolve: queried {len(chunk)} members, found {len(found)}")
+            for user_id in chunk:
+                names[user_id] = found.get(user_id)
+                self._put(user_id, found.get(user_id))
+        return names
+
+
+class BirthdayCalendar:
+    """
+    Fetches the pages of the birthday calendar for a Paginator, sorted by month or starting from today.
+
+    The keys are the sort order of the birthdays, so each page is a keyset query. For the upcoming sort, the birthdays
+    from today to the end of the year come first, followed by the ones from January 1st to yesterday.
+    """
+
+    def __init__(self, birthday_dao: AsyncDao, guild: Optional[discord.Guild], sort: str, today: date, name_cache: MemberNameCache):
+        self.birthday_dao = birthday_dao
+        self.guild = guild
+        self.sort = sort
+        self.today = (today.month, today.day)
+        self.name_cache = name_cache
+
+    async def _fetch_birthdays(self, after: Optional[tuple], limit: int) -> list[tuple[tuple, BirthdayRecord]]:
+        if self.sort != SORT_UPCOMING:
+            return [((birthday.date.month, birthday.date.day, birthday.user_id), birthday) for birthday in await self.birthday_dao.get_birthdays_page(after, limit)]
+        # The key is (0 for this year or 1 for next year, month, day, user_id)
+        segment, *position = after if after is not None else (0, *self.today, -1)
+        out = []
+        if segment == 0:
+            out += [((0, birthday.date.month, birthday.date.day, birthday.user_id), birthday) for birthday in await self.birthday_dao.get_birthdays_page(tuple(position), limit)]
+            position = None
+        if len(out) < limit:
+            out += [((1, birthday.date.month, birthday.date.day, birthday.user_id), birthday) for birthday in await self.birthday_dao.get_birthdays_page(tuple(position) if position else None, limit - len(out), self.today)]
+        return out
+
+    async def fetch(self, after: Optional[tuple], limit: int) -> list[tuple[tuple, str]]:
+        birthdays = await self._fetch_birthdays(after, limit)
+        names = await self.name_cache.resolve(self.guild, [birthday.user_id for _, birthday in birthdays])
+        out = []
+        for key, birthday in birthdays:
+            name = names.get(birthday.user_id) or f"unknown user {birthday.user_id}"
+            timezone = f" ({birthday.timezone})" if birthday.timezone else ""
+            out.append((key, f"{birthday.date.strftime('%B %d')}: {name}{timezone}"))
+        return out
@@ -1,8 +1,8 @@
 import asyncio
 import threading
 from asyncio import AbstractEventLoop
-from datetime import datetime, timedelta
-from typing import Optional
+from datetime import date, datetime, time, timedelta, timezone
+from typing import Callable, Optional
 
 import pytz
 from discord import Client
@@ -10,22 +10,112 @@ from discord import Client
 import src.constants as constants
 from src.constants import LOGGER
 from src.db.birthday.birthday_dao import BirthdayDao
+from src.db.birthday.birthday_record import BirthdayRecord
 from src.db.db_manager import DbManager
+from src.db.scheduler_state.scheduler_state_dao import SchedulerStateDao
+from src.utils.catch_up import CatchUpPolicy, Pacer
+from src.utils.response_limiter import RateLimit
 from src.utils.signal_util import signal_util
 
 TAG = "BirthdayUtil"
 BIRTHDAY_TIMEZONE = pytz.timezone('Etc/GMT+12')
 BIRTHDAY_REPLACEMENT = "{{BIRTHDAY_REPLACEMENT}}"
 BIRTHDAY_MESSAGE_TEMPLATE = f"OHAYAHO!!!!! IT IS {BIRTHDAY_REPLACEMENT}'s BIRTHDAY!!!!! HAPPY BIRTHDAY, {BIRTHDAY_REPLACEMENT}!!!!!"
+BIRTHDAY_BATCH_MESSAGE_TEMPLATE = f"OHAYAHO!!!!! IT IS THE BIRTHDAY OF {BIRTHDAY_REPLACEMENT}!!!!! HAPPY BIRTHDAY!!!!!"
+BIRTHDAY_MENTION_SEPARATOR = ", "
+MAX_MESSAGE_LENGTH = 2000
 
 DATE_FORMAT = '%Y-%m-%d'
+# The scheduler_state key of the last day whose birthdays were processed.
+LAST_RUN_KEY = 'birthday_last_run_date'
+# Birthdays missed more than this many days ago are not caught up on.
+MAX_CATCH_UP_DAYS = 30
+CATCH_UP_RATE_LIMIT = RateLimit(1, 2)
+
+
+def get_batched_birthday_messages(user_ids: list[int]) -> list[tuple[str, list[int]]]:
+    """
+    Build the combined birthday message for everyone with a birthday on the same day, split into as few messages as fit
+    in Discord's message length limit.
+
+    Args:
+        user_ids: The IDs of the users to wish.
+
+    Returns:
+        list[tuple[str, list[int]]]: Each message, with the IDs of the users it mentions.
+    """
+    chunks = []
+    mentions = []
+    chunk_user_ids = []
+    template_length = len(BIRTHDAY_BATCH_MESSAGE_TEMPLATE) - len(BIRTHDAY_REPLACEMENT)
+    length = template_length
+    for user_id in user_ids:
+        mention = f"<@{user_id}>"
+        if mentions and length + len(BIRTHDAY_MENTION_SEPARATOR) + len(mention) > MAX_MESSAGE_LENGTH:
+            chunks.append((BIRTHDAY_BATCH_MESSAGE_TEMPLATE.replace(BIRTHDAY_REPLACEMENT, BIRTHDAY_MENTION_SEPARATOR.join(mentions)), chunk_user_ids))
+            mentions = []
+            chunk_user_ids = []
+            length = template_length
+        length += (len(BIRTHDAY_MENTION_SEPARATOR) if mentions else 0) + len(mention)
+        mentions.append(mention)
+        chunk_user_ids.append(user_id)
+    if mentions:
+        chunks.append((BIRTHDAY_BATCH_MESSAGE_TEMPLATE.replace(BIRTHDAY_REPLACEMENT, BIRTHDAY_MENTION_SEPARATOR.join(mentions)), chunk_user_ids))
+    return chunks
+
+
+class TimezoneWheel:
+    """
+    Timer wheel over the timezones of the birthdays, with a bucket per UTC offset. A new day starts at the same instant
+    for every timezone in a bucket, so the birthdays thread only wakes at the next midnight of any bucket, and then only
+    processes the timezones of that bucket.
+    """
+
+    def __init__(self, timezone_names: set[Optional[str]], now: datetime):
+        """
+        Args:
+            timezone_names: The IANA timezones, with None for BIRTHDAY_TIMEZONE.
+            now: The time to compute the UTC offsets at, which change with daylight saving time.
+        """
+        self.timezones = sorted(timezone_names, key=lambda name: name or "")
+        self.buckets: dict[timedelta, list[Optional[str]]] = {}
+        for timezone_name in self.timezones:
+            tz = pytz.timezone(timezone_name) if timezone_name else BIRTHDAY_TIMEZONE
+            self.buckets.setdefault(now.astimezone(tz).utcoffset(), []).append(timezone_name)
+
+    @staticmethod
+    def _get_next_bucket_midnight(offset: timedelta, now: datetime) -> datetime:
+        tz = timezone(offset)
+        # 2 seconds after midnight, so a rounding error cannot make it 23:59:59 of the day before
+        return datetime.combine(now.astimezone(tz).date() + timedelta(days=1), time(second=2), tz)
+
+    def get_next_midnight(self, now: datetime) -> datetime:
+        """
+        Get the next time a new day starts in any bucket.
+        """
+        return min(self._get_next_bucket_midnight(offset, now) for offset in self.buckets)
+
+    def get_started_timezones(self, since: datetime, now: datetime) -> list[Optional[str]]:
+        """
+        Get the timezones of the buckets where a new day has started between the given times.
+        """
+        return [timezone_name for offset, timezone_names in self.buckets.items() if self._get_next_bucket_midnight(offset, since) <= now for timezone_name in timezone_names]
 
 
 class BirthdayUtil:
-    def __init__(self, client: Client, channel_id: int):
+    def __init__(self, client: Client, channel_id: int, catch_up_policy: CatchUpPolicy = CatchUpPolicy(), catch_up_rate_limit: RateLimit = CATCH_UP_RATE_LIMIT, batched: bool = False):
+        """
+        Args:
+            batched: Wish everyone who has a birthday on the same day in one combined message, instead of one message each.
+        """
         self.is_running = False
         self.client = client
         self.channel = client.get_channel(channel_id)
+        self.batched = batched
+        self._changed = False
+        self._last_wake: Optional[datetime] = None
+        self.catch_up_policy = catch_up_policy
+        self._pacer = Pacer(catch_up_rate_limit)
         self.start()
 
     def start(self):
@@ -36,6 +126,15 @@ class BirthdayUtil:
 
     def stop(self):
         self.is_running = False
+        signal_util.notify()
+
+    def notify_changed(self):
+        """
+        Wake up the birthdays thread to rebuild its timezone wheel after birthdays were learned or forgotten, so it waits
+        for every timezone that has a birthday, and only for those.
+        """
+        self._changed = True
+        signal_util.notify()
 
     def _get_birthday_message(self, user_id: int) -> Optional[str]:
         LOGGER.d(TAG, f"_get_birthday_message: user_id: {user_id}")
@@ -50,38 +149,122 @@ class BirthdayUtil:
             return None
 
     @staticmethod
-    def _get_sleep_delay() -> int:
-        now = datetime.now().astimezone(BIRTHDAY_TIMEZONE)
-        # Set time as 2 seconds after midnight to prevent rounding error from making it 23:59:59, because then the birthday will be announced repeatedly. 
-        tomorrow = datetime.today().astimezone(BIRTHDAY_TIMEZONE).replace(hour=0, minute=0, second=2, microsecond=0) + timedelta(days=1)
-        seconds_until_tomorrow = int((tomorrow - now).total_seconds())
-        LOGGER.d(TAG, f"seconds_until_tomorrow: {seconds_until_tomorrow}")
-        return seconds_until_tomorrow
+    def _get_days_to_process(last_run: Optional[str], today: date) -> list[date]:
+        """
+        Get the days whose birthdays have not been processed yet: today, and the days the bot slept through since the
+        last run, up to MAX_CATCH_UP_DAYS back. Empty if today was already processed.
+        """
+        if last_run is None:
+            return [today]
+        first_day = max(datetime.strptime(last_run, DATE_FORMAT).date() + timedelta(days=1), today - timedelta(days=MAX_CATCH_UP_DAYS))
+        return [first_day + timedelta(days=offset) for offset in range((today - first_day).days + 1)]
+
+    async def _send_birthday_message(self, message: str, late: bool):
+        if late:
+            # Missed birthdays are spread out, so a restart after an outage does not flood the channel
+            await self._pacer.wait()
+        await self.channel.send(message)
+
+    def _wish_individually(self, loop: AbstractEventLoop, birthday_dao: BirthdayDao, due: list[tuple[BirthdayRecord, date]], now: datetime, get_due: Callable[[tuple[BirthdayRecord, date]], datetime]):
+        for birthday, day in due:
+            LOGGER.d(TAG, f"birthday: {birthday}, day: {day}")
+            try:
+                if self.channel is not None:
+                    birthday_message = self._get_birthday_message(birthday.user_id)
+                    if birthday_message is not None:
+                        asyncio.run_coroutine_threadsafe(self._send_birthday_message(birthday_message, CatchUpPolicy.is_late(get_due((birthday, day)), now)), loop).result()
+                        birthday_dao.update_last_wished_year(birthday.user_id, day.year)
+                    else:
+                        LOGGER.e(TAG, f"_wish_individually: failed to get birthday message for user: {birthday.user_id}.")
+            except Exception as e:
+                LOGGER.e(TAG, f"_wish_individually: failed to send birthday message for user: {birthday.user_id}", e)
+
+    async def _send_batched_messages(self, chunks: list[tuple[str, list[int]]], late: bool) -> list[int]:
+        """
+        Send the chunks of a combined birthday message in order, stopping at the first failure.
+
+        Returns:
+            list[int]: The IDs of the users whose mention was sent.
+        """
+        wished = []
+        for message, user_ids in chunks:
+            try:
+                await self._send_birthday_message(message, late)
+            except Exception as e:
+                LOGGER.e(TAG, f"_send_batched_messages: failed to send birthday message for users: {user_ids}", e)
+                break
+            wished.extend(user_ids)
+        return wished
+
+    def _wish_batched(self, loop: AbstractEventLoop, birthday_dao: BirthdayDao, due: list[tuple[BirthdayRecord, date]], now: datetime, get_due: Callable[[tuple[BirthdayRecord, date]], datetime]):
+        if self.channel is None:
+            return
+        birthdays_by_day: dict[date, list[BirthdayRecord]] = {}
+        for birthday, day in due:
+            birthdays_by_day.setdefault(day, []).append(birthday)
+        for day, birthdays in birthdays_by_day.items():
+            user_ids = []
+            for birthday in birthdays:
+                if self.client.get_user(birthday.user_id) is not None:
+                    user_ids.append(birthday.user_id)
+                else:
+                    LOGGER.e(TAG, f"_wish_batched: user not found: {birthday.user_id}")
+            if not user_ids:
+                continue
+            chunks = get_batched_birthday_messages(user_ids)
+            LOGGER.d(TAG, f"_wish_batched: wishing {len(user_ids)} users on {day} in {len(chunks)} messages")
+            late = CatchUpPolicy.is_late(get_due((birthdays[0], day)), now)
+            wished = asyncio.run_coroutine_threadsafe(self._send_batched_messages(chunks, late), loop).result()
+            birthday_dao.update_last_wished_years(wished, day.year)
+
+    def _process_birthdays(self, loop: AbstractEventLoop, birthday_dao: BirthdayDao, scheduler_state_dao: SchedulerStateDao, timezone_name: Optional[str]):
+        """
+        Wish the birthdays of the users in a timezone, if a new day has started there since the last run.
+
+        Args:
+            timezone_name: The IANA timezone, or None for the users without a timezone, who use BIRTHDAY_TIMEZONE.
+        """
+        tz = pytz.timezone(timezone_name) if timezone_name else BIRTHDAY_TIMEZONE
+        now = datetime.now(tz)
+        last_run_key = f"{LAST_RUN_KEY}:{timezone_name}" if timezone_name else LAST_RUN_KEY
+        days = self._get_days_to_process(scheduler_state_dao.get_value(last_run_key), now.date())
+        if not days:
+            return
+        LOGGER.d(TAG, f"_process_birthdays: processing {days} in timezone {tz}")
+        # Only the birthdays of the days being processed are loaded, so the pass scales with the birthdays per day, not the guild
+        due = [(birthday, day) for day in days for birthday in birthday_dao.get_unwished_birthdays(day, timezone_name)]
+
+        def get_due(item: tuple[BirthdayRecord, date]) -> datetime:
+            # A birthday is due until the end of its day, so it only counts as missed once its day is over
+            return tz.localize(datetime.combine(item[1] + timedelta(days=1), time()))
+
+        due, dropped = self.catch_up_policy.select(due, now, get_due, lambda item: self.channel)
+        for birthday, day in dropped:
+            LOGGER.w(TAG, f"_process_birthdays: dropping missed birthday of user {birthday.user_id} on {day} because of catch-up policy {self.catch_up_policy}")
+        if self.batched:
+            self._wish_batched(loop, birthday_dao, due, now, get_due)
+        else:
+            self._wish_individually(loop, birthday_dao, due, now, get_due)
+        scheduler_state_dao.set_value(last_run_key, now.strftime(DATE_FORMAT))
 
     def _loop(self, loop: AbstractEventLoop) -> None:
         # Need to get the DB manager and dao here because it needs to be initialized in the same thread it is used from
         db_manager = DbManager(constants.DB_PATH)
         birthday_dao = BirthdayDao(db_manager)
+        scheduler_state_dao = SchedulerStateDao(db_manager)
         while not signal_util.is_interrupted and self.is_running:
             LOGGER.d(TAG, "BirthdayUtil is processing birthdays...")
-            birthdays = birthday_dao.get_all_birthdays()
-            if birthdays is None:
-                LOGGER.d(TAG, "No birthdays to process")
-                signal_util.wait(self._get_sleep_delay())
-                continue
-            for birthday in birthdays:
-                LOGGER.d(TAG, f"birthday: {birthday}")
-                if birthday.date.strftime(DATE_FORMAT) == datetime.now().astimezone(BIRTHDAY_TIMEZONE).strftime(DATE_FORMAT) and birthday.last_wished_year < datetime.now().astimezone(BIRTHDAY_TIMEZONE).year:
-                    try:
-                        if self.channel is not None:
-                            birthday_message = self._get_birthday_message(birthday.user_id)
-                            if birthday_message is not None:
-                                asyncio.run_coroutine_threadsafe(self.channel.send(birthday_message), loop).result()
-                                birthday_dao.update_last_wished_year(birthday.user_id, datetime.now().astimezone(BIRTHDAY_TIMEZONE).year)
-                            else:
-                                LOGGER.e(TAG, f"_loop: failed to get birthday message for user: {birthday.user_id}.")
-                    except Exception as e:
-                        LOGGER.e(TAG, f"_loop: failed to send birthday message for user: {birthday.user_id}", e)
-            signal_util.wait(self._get_sleep_delay())
+            self._changed = False
+            wheel = TimezoneWheel(birthday_dao.get_timezones() | {None}, datetime.now(timezone.utc))
+            # On startup, and when the birthdays change, every timezone is checked. Otherwise only the bucket whose
+            # midnight woke the thread has started a new day.
+            for timezone_name in wheel.get_started_timezones(self._last_wake, datetime.now(timezone.utc)) if self._last_wake is not None else wheel.timezones:
+                self._process_birthdays(loop, birthday_dao, scheduler_state_dao, timezone_name)
+            next_wake = wheel.get_next_midnight(datetime.now(timezone.utc))
+            LOGGER.d(TAG, f"_loop: next midnight is at {next_wake}")
+            self._last_wake = datetime.now(timezone.utc)
+            signal_util.wait(max((next_wake - datetime.now(timezone.utc)).total_seconds(), 0), lambda: self._changed or not self.is_running)
+            if self._changed:
+                self._last_wake = None
         self.stop()
         LOGGER.i(TAG, "BirthdaysUtil stopped")
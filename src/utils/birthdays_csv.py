@@ -0,0 +1,112 @@
+import csv
+import io
+import re
+from dataclasses import dataclass
+from typing import IO, Final, Optional
+
+import pytz
+from dateutil import parser
+
+from src.constants import LOGGER
+from src.db.birthday.birthday_dao import BirthdayDao
+from src.db.db_manager import BIRTHDAY_PARSE_DEFAULT
+
+TAG = "birthdays_csv.py"
+
+CSV_COLUMNS: Final = ["user_id", "date", "timezone"]
+MAX_IMPORT_ROWS: Final = 50000
+# How many birthdays are read from the database at a time while exporting.
+EXPORT_BATCH_SIZE: Final = 500
+_USER_MENTION: Final = re.compile(r"^<@!?(\d+)>$")
+
+
+@dataclass
+class ImportedBirthday:
+    user_id: int
+    date: str
+    timezone: Optional[str] = None
+
+
+def _parse_row(row: dict) -> ImportedBirthday:
+    user = str(row.get("user_id") or "").strip()
+    date = str(row.get("date") or "").strip()
+    timezone = str(row.get("timezone") or "").strip() or None
+    if not user or not date:
+        raise ValueError("user_id and date are required")
+    mention = _USER_MENTION.match(user)
+    if not (mention or user.isdigit()):
+        raise ValueError(f"user_id must be a user ID or mention: {user}")
+    parsed_date = parser.parse(date, default=BIRTHDAY_PARSE_DEFAULT).strftime("%m-%d")
+    if timezone is not None:
+        try:
+            timezone = pytz.timezone(timezone).zone
+        except pytz.UnknownTimeZoneError:
+            raise ValueError(f"unknown timezone: {timezone}")
+    return ImportedBirthday(int(mention.group(1) if mention else user), parsed_date, timezone)
+
+
+def parse_birthdays_import(filename: str, data: bytes) -> tuple[list[ImportedBirthday], list[str]]:
+    """
+    Parse and validate every row of a birthday import file. Nothing should be written unless there are no errors.
+
+    The file is a CSV file with a header row with the columns user_id, date and, optionally, timezone, which is the
+    format written by write_birthdays_export. The date takes the same values as /learn_birthday, and the year is ignored.
+
+    Args:
+        filename: The name of the uploaded file, for the error report.
+        data: The content of the file.
+
+    Returns:
+        tuple[list[ImportedBirthday], list[str]]: The valid rows and the errors of the invalid rows.
+    """
+    try:
+        rows = list(csv.DictReader(io.StringIO(data.decode("utf-8-sig"))))
+    except (ValueError, csv.Error) as e:
+        LOGGER.e(TAG, f"parse_birthdays_import: failed to read {filename}", e)
+        return [], [f"could not read {filename}: {e}"]
+    if not rows:
+        return [], [f"{filename} has no birthdays"]
+    if len(rows) > MAX_IMPORT_ROWS:
+        return [], [f"{filename} has {len(rows)} birthdays, but at most {MAX_IMPORT_ROWS} can be imported at once"]
+    birthdays = []
+    errors = []
+    lines: dict[int, int] = {}
+    for index, row in enumerate(rows):
+        # Row 1 is the header, so the first birthday is on line 2
+        line = index + 2
+        try:
+            birthday = _parse_row(row)
+        except (ValueError, OverflowError) as e:
+            errors.append(f"row {line}: {e}")
+            continue
+        if birthday.user_id in lines:
+            errors.append(f"row {line}: user {birthday.user_id} is already on row {lines[birthday.user_id]}")
+            continue
+        lines[birthday.user_id] = line
+        birthdays.append(birthday)
+    return birthdays, errors
+
+
+def write_birthdays_export(birthday_dao: BirthdayDao, file: IO[str]) -> int:
+    """
+    Write every birthday to a CSV file in calendar order, in the format read by parse_birthdays_import. The birthdays
+    are read and written EXPORT_BATCH_SIZE at a time, so the whole table is never in memory.
+
+    Args:
+        birthday_dao: The DAO to read the birthdays from.
+        file: A text file opened with newline="".
+
+    Returns:
+        int: The number of exported birthdays.
+    """
+    writer = csv.writer(file)
+    writer.writerow(CSV_COLUMNS)
+    count = 0
+    after = None
+    while True:
+        birthdays = birthday_dao.get_birthdays_page(after, EXPORT_BATCH_SIZE)
+        writer.writerows([birthday.user_id, birthday.date.strftime("%m-%d"), birthday.timezone or ""] for birthday in birthdays)
+        count += len(birthdays)
+        if len(birthdays) < EXPORT_BATCH_SIZE:
+            return count
+        after = (birthdays[-1].date.month, birthdays[-1].date.day, birthdays[-1].user_id)
@@ -0,0 +1,101 @@
+import asyncio
+import re
+import time
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from typing import Callable, Final, Hashable, Optional, TypeVar
+
+from src.constants import LOGGER
+from src.utils.response_limiter import RateLimit
+
+TAG = "CatchUp"
+
+CATCH_UP_ALL: Final = "all"
+CATCH_UP_LATEST: Final = "latest"
+CATCH_UP_DROP: Final = "drop"
+# Items that became due less than this long ago are on time, so the policy never applies to them.
+LATE_GRACE: Final = timedelta(minutes=1)
+_DROP_PATTERN: Final = re.compile(r"^drop:(\d+)$")
+
+T = TypeVar("T")
+
+
+@dataclass(frozen=True)
+class CatchUpPolicy:
+    """
+    What a scheduler does with the items it missed while the bot was down.
+
+    all: send every missed item. latest: send only the most recent missed items of each channel. drop: send the missed
+    items that are at most max_age late, and drop the rest.
+    """
+    mode: str = CATCH_UP_ALL
+    max_age: Optional[timedelta] = None
+
+    def __str__(self):
+        return f"{self.mode}:{int(self.max_age.total_seconds() // 60)}" if self.mode == CATCH_UP_DROP else self.mode
+
+    @staticmethod
+    def is_late(due: datetime, now: datetime) -> bool:
+        return now - due > LATE_GRACE
+
+    def select(self, items: list[T], now: datetime, get_due: Callable[[T], datetime], get_channel: Callable[[T], Hashable]) -> tuple[list[T], list[T]]:
+        """
+        Apply the policy to due items.
+
+        Args:
+            items: The due items, in the order they should be sent.
+            now: The current time.
+            get_due: Gets the time an item was due.
+            get_channel: Gets the channel an item is sent to.
+
+        Returns:
+            tuple[list[T], list[T]]: The items to send, in their original order, and the items to drop.
+        """
+        if self.mode == CATCH_UP_DROP:
+            dropped = [item for item in items if self.is_late(get_due(item), now) and now - get_due(item) > self.max_age]
+        elif self.mode == CATCH_UP_LATEST:
+            latest: dict[Hashable, datetime] = {}
+            for item in items:
+                if self.is_late(get_due(item), now):
+                    latest[get_channel(item)] = max(latest.get(get_channel(item), get_due(item)), get_due(item))
+            dropped = [item for item in items if self.is_late(get_due(item), now) and get_due(item) < latest[get_channel(item)]]
+        else:
+            dropped = []
+        if dropped:
+            LOGGER.w(TAG, f"select: dropping {len(dropped)} of {len(items)} due items because of catch-up policy {self}")
+        dropped_ids = {id(item) for item in dropped}
+        return [item for item in items if id(item) not in dropped_ids], dropped
+
+
+def parse_catch_up_policy(text: str) -> CatchUpPolicy:
+    """
+    Parse a catch-up policy: "all", "latest", or "drop:<minutes>", for example "drop:30" to drop items more than 30
+    minutes late.
+
+    Raises:
+        ValueError: If the text is not a valid catch-up policy.
+    """
+    text = text.strip().lower()
+    if text in (CATCH_UP_ALL, CATCH_UP_LATEST):
+        return CatchUpPolicy(text)
+    match = _DROP_PATTERN.match(text)
+    if match is None:
+        raise ValueError(f"Catch-up policy must be 'all', 'latest' or 'drop:<minutes>': {text}")
+    return CatchUpPolicy(CATCH_UP_DROP, timedelta(minutes=int(match.group(1))))
+
+
+class Pacer:
+    """
+    Spaces out catch-up sends to the rate of a RateLimit. Coroutines that call wait() are given consecutive slots, so
+    sends that are scheduled together are spread out instead of going out in one burst.
+    """
+
+    def __init__(self, rate_limit: RateLimit):
+        self.interval = rate_limit.seconds / rate_limit.count
+        self._next_slot = 0.0
+
+    async def wait(self):
+        now = time.monotonic()
+        slot = max(now, self._next_slot)
+        self._next_slot = slot + self.interval
+        await asyncio.sleep(slot - now)
@@ -0,0 +1,58 @@
+import threading
+import time
+from datetime import datetime
+
+from tzlocal import get_localzone
+
+TAG = "hit_counter.py"
+
+
+class HitCounter:
+    """
+    In-memory hit counts of the response rules, keyed by the keyword cell of the rule. Counting only touches memory, so
+    it is cheap enough for the message hot path. The counts are written to the database in batches by ResponseHitsUtil.
+    """
+
+    def __init__(self):
+        self._hits: dict[str, tuple[int, float]] = {}
+        self._lock = threading.Lock()
+
+    def record(self, rule: str):
+        with self._lock:
+            count, _ = self._hits.get(rule, (0, 0.0))
+            self._hits[rule] = (count + 1, time.time())
+
+    def _to_datetimes(self, hits: dict[str, tuple[int, float]]) -> dict[str, tuple[int, datetime]]:
+        timezone = get_localzone()
+        return {rule: (count, datetime.fromtimestamp(last_hit, timezone)) for rule, (count, last_hit) in hits.items()}
+
+    def drain(self) -> dict[str, tuple[int, datetime]]:
+        """
+        Take the hits counted since the last drain.
+
+        Returns:
+            dict[str, tuple[int, datetime]]: The number of hits and the time of the last hit, by rule.
+        """
+        with self._lock:
+            hits, self._hits = self._hits, {}
+        return self._to_datetimes(hits)
+
+    def restore(self, hits: dict[str, tuple[int, datetime]]):
+        """
+        Put drained hits back, for example when writing them to the database failed.
+
+        Args:
+            hits: The hits returned by drain.
+        """
+        with self._lock:
+            for rule, (count, last_hit) in hits.items():
+                current_count, current_last_hit = self._hits.get(rule, (0, 0.0))
+                self._hits[rule] = (current_count + count, max(current_last_hit, last_hit.timestamp()))
+
+    def peek(self) -> dict[str, tuple[int, datetime]]:
+        with self._lock:
+            hits = dict(self._hits)
+        return self._to_datetimes(hits)
+
+
+hit_counter = HitCounter()
@@ -0,0 +1,82 @@
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Final, Optional
+
+TAG = "match_cache.py"
+
+# Returned by MatchCache.get when the text is not cached, because None is a valid cached value (no row matched).
+MISSING: Final = object()
+
+
+@dataclass
+class MatchCacheStats:
+    hits: int
+    misses: int
+    size: int
+    max_size: int
+
+    def __str__(self):
+        lookups = self.hits + self.misses
+        hit_rate = self.hits / lookups if lookups else 0
+        return f"hits: {self.hits}, misses: {self.misses}, hit rate: {hit_rate:.1%}, size: {self.size}/{self.max_size}"
+
+
+class MatchCache:
+    """
+    Bounded LRU cache from normalized message text to the index of the matched row, or None if no row matched.
+
+    A cache belongs to one ruleset. When the ruleset is replaced, a new cache is created with it.
+    """
+
+    def __init__(self, max_size: int):
+        """
+        Initialize the MatchCache.
+
+        Args:
+            max_size: The maximum number of entries to keep. A size of 0 disables the cache.
+        """
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        self._entries: OrderedDict[str, Optional[int]] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, text: str) -> object:
+        """
+        Look up the cached row index for the text.
+
+        Args:
+            text: The normalized message text.
+
+        Returns:
+            object: The cached row index or None, or MISSING if the text is not cached.
+        """
+        with self._lock:
+            index = self._entries.get(text, MISSING)
+            if index is MISSING:
+                self.misses += 1
+            else:
+                self.hits += 1
+                self._entries.move_to_end(text)
+            return index
+
+    def put(self, text: str, index: Optional[int]):
+        """
+        Cache the row index for the text, evicting the least recently used entry if the cache is full.
+
+        Args:
+            text: The normalized message text.
+            index: The index of the matched row, or None if no row matched.
+        """
+        if self.max_size <= 0:
+            return
+        with self._lock:
+            self._entries[text] = index
+            self._entries.move_to_end(text)
+            if len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def get_stats(self) -> MatchCacheStats:
+        with self._lock:
+            return MatchCacheStats(self.hits, self.misses, len(self._entries), self.max_size)
@@ -0,0 +1,107 @@
+import inspect
+from typing import Any, Awaitable, Callable, Final, Optional
+
+import discord
+
+from src.constants import LOGGER
+
+TAG = "Paginator"
+
+MAX_PAGE_LENGTH: Final = 2000
+# How many items are fetched for one page. Must be more than fit in MAX_PAGE_LENGTH characters, so one fetch fills a page.
+PAGE_FETCH_SIZE: Final = 50
+PAGINATOR_TIMEOUT: Final = 600
+
+# Fetches up to limit items after the given key, or from the start if the key is None, as (key, text) pairs in order.
+# May be a coroutine function, for example to look up the names of the users on the page.
+PageFetcher = Callable[[Optional[Any], int], list[tuple[Any, str]] | Awaitable[list[tuple[Any, str]]]]
+
+
+class Paginator(discord.ui.View):
+    """
+    A message with previous and next buttons that shows a long list one page at a time.
+
+    Items are fetched with keyset pagination: each page starts after the key of the last item of the previous page, so a
+    page costs one query no matter how far into the list it is. The start key of every visited page is remembered, so the
+    previous button can go back without counting rows. Each page is a single message edit of up to 2000 characters.
+    """
+
+    def __init__(self, fetch: PageFetcher, header: str, empty_text: str, owner_id: Optional[int] = None, fetch_size: int = PAGE_FETCH_SIZE):
+        """
+        Args:
+            fetch: Fetches the items of a page.
+            header: The first line of every page.
+            empty_text: The text to show if there are no items.
+            owner_id: If set, only this user can turn the pages.
+            fetch_size: How many items to fetch for a page. Must be more than fit on a page.
+        """
+        super().__init__(timeout=PAGINATOR_TIMEOUT)
+        self.fetch = fetch
+        self.header = header
+        self.empty_text = empty_text
+        self.owner_id = owner_id
+        self.fetch_size = fetch_size
+        self.message: Optional[discord.Message] = None
+        self._page_starts: list[Optional[Any]] = [None]
+        self._next_start: Optional[Any] = None
+
+    async def _render(self) -> str:
+        """
+        Fetch the current page and pack as many items into it as fit. Updates the buttons.
+        """
+        items = self.fetch(self._page_starts[-1], self.fetch_size)
+        if inspect.isawaitable(items):
+            items = await items
+        lines = [f"{self.header} (page {len(self._page_starts)})"]
+        length = len(lines[0])
+        shown = 0
+        self._next_start = None
+        for key, text in items:
+            if length + 1 + len(text) > MAX_PAGE_LENGTH:
+                if shown == 0:
+                    # An item that does not fit on a page on its own is cut short, so the list can move past it.
+                    text = text[:MAX_PAGE_LENGTH - length - 2] + "…"
+                else:
+                    break
+            lines.append(text)
+            length += 1 + len(text)
+            shown += 1
+            self._next_start = key
+        has_more = shown < len(items) or len(items) == self.fetch_size
+        self.previous_page.disabled = len(self._page_starts) == 1
+        self.next_page.disabled = not has_more
+        if shown == 0:
+            return f"{self.header}\n{self.empty_text}" if len(self._page_starts) == 1 else f"{lines[0]}\nNo more items."
+        return "\n".join(lines)
+
+    async def send(self, interaction: discord.Interaction):
+        """
+        Reply to an interaction with the first page.
+        """
+        await interaction.response.send_message(await self._render(), view=self)
+        self.message = await interaction.original_response()
+
+    async def interaction_check(self, interaction: discord.Interaction) -> bool:
+        if self.owner_id is not None and interaction.user.id != self.owner_id:
+            await interaction.response.send_message("Only the user who ran the command can turn the pages.", ephemeral=True)
+            return False
+        return True
+
+    async def on_timeout(self):
+        if self.message is None:
+            return
+        try:
+            await self.message.edit(view=None)
+        except discord.HTTPException as e:
+            LOGGER.w(TAG, f"on_timeout: failed to remove the buttons: {e}")
+
+    @discord.ui.button(label="Previous", style=discord.ButtonStyle.secondary)
+    async def previous_page(self, interaction: discord.Interaction, button: discord.ui.Button):
+        if len(self._page_starts) > 1:
+            self._page_starts.pop()
+        await interaction.response.edit_message(content=await self._render(), view=self)
+
+    @discord.ui.button(label="Next", style=discord.ButtonStyle.primary)
+    async def next_page(self, interaction: discord.Interaction, button: discord.ui.Button):
+        self._page_starts.append(self._next_start)
+        await interaction.response.edit_message(content=await self._render(), view=self)
@@ -0,0 +1,128 @@
+import re
+from abc import ABC, abstractmethod
+from datetime import datetime, timedelta
+from typing import Final, Optional
+
+TAG = "recurrence.py"
+
+CRON_PREFIX: Final = "cron:"
+_INTERVAL: Final = re.compile(r"^(\d+)([mhdw])$")
+_INTERVAL_UNITS: Final = {"m": timedelta(minutes=1), "h": timedelta(hours=1), "d": timedelta(days=1), "w": timedelta(weeks=1)}
+# (name, lowest value, highest value) of each field of a cron rule, in order.
+_CRON_FIELDS: Final = [("minute", 0, 59), ("hour", 0, 23), ("day of month", 1, 31), ("month", 1, 12), ("day of week", 0, 6)]
+# Every combination of day of month, month and day of week repeats within 28 years, so a rule with no occurrence in
+# that window, such as February 30th, never fires.
+_CRON_SEARCH_DAYS: Final = 366 * 28
+
+
+class Recurrence(ABC):
+    """
+    The rule of a recurring announcement. Only the next occurrence of a series is ever computed, so a series is a single
+    row that is moved forward after each fire.
+    """
+
+    @abstractmethod
+    def next_after(self, previous: datetime, now: datetime) -> Optional[datetime]:
+        """
+        Compute the next occurrence of the series.
+
+        Args:
+            previous: The occurrence that just fired. Its timezone is the timezone of the series.
+            now: Occurrences at or before this time are skipped.
+
+        Returns:
+            Optional[datetime]: The first occurrence after both previous and now, or None if there is none.
+        """
+
+
+class IntervalRecurrence(Recurrence):
+    """
+    Fires every fixed interval, such as every 6 hours ("6h") or every week ("1w").
+    """
+
+    def __init__(self, interval: timedelta):
+        self.interval = interval
+
+    def next_after(self, previous: datetime, now: datetime) -> Optional[datetime]:
+        # Skip the occurrences that were missed in one step instead of walking through them.
+        skipped = max(0, (now - previous) // self.interval)
+        return previous + self.interval * (skipped + 1)
+
+
+class CronRecurrence(Recurrence):
+    """
+    Fires on the minutes that match a cron rule of five fields: minute, hour, day of month, month and day of week, where
+    Sunday is 0. Each field is *, a number, a range such as 1-5, a step such as */15 or 1-31/2, or a comma-separated list
+    of those. As in cron, if both day of month and day of week are restricted, a day matching either one fires.
+    """
+
+    def __init__(self, rule: str):
+        fields = rule.split()
+        if len(fields) != len(_CRON_FIELDS):
+            raise ValueError(f"a cron rule needs {len(_CRON_FIELDS)} fields: {rule}")
+        self.minutes, self.hours, self.days, self.months, self.weekdays = (_parse_cron_field(field, *spec) for field, spec in zip(fields, _CRON_FIELDS))
+        self._days_restricted = fields[2] != "*"
+        self._weekdays_restricted = fields[4] != "*"
+
+    def _is_day_matching(self, day: datetime) -> bool:
+        if day.month not in self.months:
+            return False
+        day_matches = day.day in self.days
+        # datetime counts Monday as 0, cron counts Sunday as 0
+        weekday_matches = (day.weekday() + 1) % 7 in self.weekdays
+        if self._days_restricted and self._weekdays_restricted:
+            return day_matches or weekday_matches
+        return day_matches and weekday_matches
+
+    def next_after(self, previous: datetime, now: datetime) -> Optional[datetime]:
+        start = max(previous, now.astimezone(previous.tzinfo)).replace(second=0, microsecond=0) + timedelta(minutes=1)
+        day = start.replace(hour=0, minute=0)
+        for _ in range(_CRON_SEARCH_DAYS):
+            if self._is_day_matching(day):
+                for hour in sorted(self.hours):
+                    for minute in sorted(self.minutes):
+                        candidate = day.replace(hour=hour, minute=minute)
+                        if candidate >= start:
+                            return candidate
+            day = (day + timedelta(days=1)).replace(hour=0, minute=0)
+        return None
+
+
+def _parse_cron_field(field: str, name: str, lowest: int, highest: int) -> set[int]:
+    values = set()
+    for part in field.split(","):
+        value_range, _, step = part.partition("/")
+        if value_range == "*":
+            start, end = lowest, highest
+        elif "-" in value_range:
+            start, end = (int(value) for value in value_range.split("-", 1))
+        else:
+            start = end = int(value_range)
+        step = int(step) if step else 1
+        if start < lowest or end > highest or start > end or step < 1:
+            raise ValueError(f"invalid {name} in cron rule: {part}")
+        values.update(range(start, end + 1, step))
+    return values
+
+
+def parse_recurrence(text: str) -> Recurrence:
+    """
+    Parse the recurrence of an announcement.
+
+    Args:
+        text: An interval of a number and a unit (m, h, d or w), such as "1d" or "6h", or a cron rule prefixed with
+            "cron:", such as "cron:0 9 * * 1" for every Monday at 9:00.
+
+    Returns:
+        Recurrence: The parsed recurrence.
+
+    Raises:
+        ValueError: If the text is not a valid recurrence.
+    """
+    text = text.strip().lower()
+    if text.startswith(CRON_PREFIX):
+        return CronRecurrence(text[len(CRON_PREFIX):])
+    match = _INTERVAL.match(text)
+    if match is None or int(match.group(1)) == 0:
+        raise ValueError(f"invalid recurrence: {text}")
+    return IntervalRecurrence(int(match.group(1)) * _INTERVAL_UNITS[match.group(2)])
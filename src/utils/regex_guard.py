@@ -0,0 +1,312 @@
+import multiprocessing
+import re
+import threading
+from dataclasses import dataclass
+from multiprocessing.connection import Connection
+from typing import Final, Optional
+
+from src.constants import LOGGER
+from src.utils.response_matcher import ResponseMatcher
+
+TAG = "regex_guard.py"
+
+# Probes are as long as the longest message Discord allows, so a pattern that passes them cannot be stalled by a message.
+PROBE_LENGTH: Final = 2000
+MAX_PROBES_PER_PATTERN: Final = 12
+# How long the sandbox may take to compile a ruleset that was sent to it, in seconds.
+LOAD_TIMEOUT: Final = 120
+
+# Fork instead of spawn: spawn re-imports the main module in the child, and client.py starts the bot at import time.
+_CONTEXT: Final = multiprocessing.get_context("fork")
+
+
+class RegexSandboxNotReady(Exception):
+    def __init__(self):
+        super().__init__("regex sandbox is still loading the ruleset")
+
+
+class RegexTimeout(Exception):
+    def __init__(self, program_index: int):
+        self.program_index = program_index
+        super().__init__(f"regex program {program_index} exceeded its time budget")
+
+
+@dataclass
+class DisabledRule:
+    row: int
+    pattern: str
+    reason: str
+
+    def __str__(self):
+        return f"row: {self.row + 1}, pattern: {self.pattern}, reason: {self.reason}"
+
+
+def _sandbox_main(conn: Connection, progress, inherited_conns: list[Connection]):
+    # Runs in the child process. Do not log from here, the logger belongs to the parent process.
+    # Close the parent ends of the pipes that were inherited by the fork, including the ones of other sandboxes, so
+    # every child sees EOF and exits once the parent process is gone.
+    for inherited_conn in inherited_conns:
+        inherited_conn.close()
+    programs = []
+    while True:
+        try:
+            request = conn.recv()
+        except EOFError:
+            return
+        kind = request[0]
+        if kind == "load":
+            programs = request[1]
+            conn.send(None)
+        elif kind == "search":
+            _, text, limit = request
+            result = None
+            for index, program in enumerate(programs):
+                if limit is not None and program.first_row >= limit:
+                    break
+                progress.value = index
+                result = program.search(text)
+                if result is not None:
+                    break
+            if result is not None and limit is not None and result >= limit:
+                result = None
+            progress.value = -1
+            conn.send(result)
+        elif kind == "vet":
+            _, patterns, texts = request
+            # Unpickling the request compiled every pattern. Tell the parent, so the budgets only start now.
+            conn.send(None)
+            for index, (pattern, _) in enumerate(patterns):
+                progress.value = index
+                for text in texts if texts is not None else get_probe_texts(pattern):
+                    pattern.search(text)
+                conn.send(index)
+            progress.value = -1
+
+
+# The parent ends of the pipes of every running sandbox child, by every sandbox. Forked children close them.
+_parent_conns: set[Connection] = set()
+_parent_conns_lock = threading.Lock()
+
+
+class _Child:
+    """
+    One sandbox child process and the parent end of its pipe.
+    """
+
+    def __init__(self):
+        parent_conn, child_conn = _CONTEXT.Pipe()
+        self.progress = _CONTEXT.RawValue('i', -1)
+        with _parent_conns_lock:
+            # Forks from other threads must not inherit child_conn, so it is closed before the lock is released
+            self.process = _CONTEXT.Process(target=_sandbox_main, args=(child_conn, self.progress, [*_parent_conns, parent_conn]), daemon=True)
+            self.process.start()
+            child_conn.close()
+            _parent_conns.add(parent_conn)
+        self.conn = parent_conn
+
+    def load(self, programs: list):
+        self.conn.send(("load", programs))
+        if not self.conn.poll(LOAD_TIMEOUT):
+            raise RuntimeError("regex sandbox did not finish loading the ruleset")
+        self.conn.recv()
+
+    def kill(self):
+        self.process.kill()
+        self.process.join()
+        with _parent_conns_lock:
+            _parent_conns.discard(self.conn)
+        self.conn.close()
+
+
+def forget_inherited_children():
+    """
+    Close the pipes of the sandbox children of the parent process. Call it in a process that was forked from the bot:
+    those children belong to the parent, so this process must not use, wait for or kill them.
+    """
+    global _parent_conns_lock
+    # Another thread of the parent may have held the lock when this process was forked
+    _parent_conns_lock = threading.Lock()
+    for conn in _parent_conns:
+        conn.close()
+    _parent_conns.clear()
+
+
+class RegexSandbox:
+    """
+    A child process that evaluates regex keywords with a wall-clock budget.
+
+    CPython cannot interrupt a running regex, and the regex engine holds the GIL while it runs, so a catastrophic
+    backtracking pattern would freeze every thread of the bot. Running the patterns in a child process lets the bot
+    kill the child when the budget runs out and carry on. A new child is started and loaded with the ruleset on a
+    background thread, and searches raise RegexSandboxNotReady until it is ready, so a message never waits for it.
+    """
+
+    def __init__(self):
+        self._child: Optional[_Child] = None
+        self._loaded_matcher: Optional[ResponseMatcher] = None
+        # The matcher a child is being loaded with, if any
+        self._loading_matcher: Optional[ResponseMatcher] = None
+        self._lock = threading.Lock()
+
+    def _preload(self, matcher: ResponseMatcher):
+        """
+        Start a child and load the matcher into it without holding the lock, then swap it in. The caller sets
+        _loading_matcher first. If a newer matcher started loading in the meantime, the new child is discarded.
+        """
+        child = None
+        try:
+            child = _Child()
+            child.load(matcher.programs)
+        except Exception:
+            if child is not None:
+                child.kill()
+            with self._lock:
+                if self._loading_matcher is matcher:
+                    self._loading_matcher = None
+            raise
+        with self._lock:
+            if self._loading_matcher is matcher:
+                self._loading_matcher = None
+                child, self._child, self._loaded_matcher = self._child, child, matcher
+        if child is not None:
+            child.kill()
+
+    def _preload_in_background(self, matcher: ResponseMatcher):
+        try:
+            self._preload(matcher)
+            LOGGER.d(TAG, f"_preload_in_background: loaded {len(matcher.programs)} regex programs")
+        except Exception as e:
+            LOGGER.e(TAG, "_preload_in_background: failed to load the regex sandbox", e)
+
+    def _load_in_background(self, matcher: ResponseMatcher):
+        # Must be called with the lock held
+        if self._loading_matcher is matcher:
+            return
+        self._loading_matcher = matcher
+        threading.Thread(target=self._preload_in_background, args=(matcher,), daemon=True).start()
+
+    def _discard_child(self) -> Optional[_Child]:
+        # Must be called with the lock held. The caller kills the returned child after releasing the lock.
+        child = self._child
+        self._child = None
+        self._loaded_matcher = None
+        return child
+
+    def load(self, matcher: ResponseMatcher):
+        """
+        Start a child with the regex programs of a ruleset and wait until it is ready. Searches keep using the previous
+        child in the meantime.
+
+        Args:
+            matcher: The matcher of the ruleset that was just loaded.
+        """
+        with self._lock:
+            self._loading_matcher = matcher
+        self._preload(matcher)
+
+    def is_ready(self, matcher: ResponseMatcher) -> bool:
+        with self._lock:
+            return self._child is not None and self._loaded_matcher is matcher
+
+    def close(self):
+        with self._lock:
+            self._loading_matcher = None
+            child = self._discard_child()
+        if child is not None:
+            child.kill()
+
+    def search(self, matcher: ResponseMatcher, text: str, limit: Optional[int], budget: float) -> Optional[int]:
+        """
+        Search the regex programs of the matcher in the sandbox.
+
+        Args:
+            matcher: The matcher whose regex programs should be searched.
+            text: The lowercased message.
+            limit: Only rows below this index are of interest, usually the best literal match.
+            budget: The wall-clock budget for the search, in seconds.
+
+        Returns:
+            Optional[int]: The lowest matching row below the limit, or None.
+
+        Raises:
+            RegexTimeout: If the search did not finish within the budget. The child is killed and replaced in the
+                background.
+            RegexSandboxNotReady: If no child has the matcher loaded yet. One is loaded in the background.
+        """
+        stale = None
+        try:
+            with self._lock:
+                if self._child is None or self._loaded_matcher is not matcher:
+                    self._load_in_background(matcher)
+                    raise RegexSandboxNotReady()
+                try:
+                    self._child.conn.send(("search", text, limit))
+                    if self._child.conn.poll(budget):
+                        return self._child.conn.recv()
+                except (EOFError, OSError):
+                    stale = self._discard_child()
+                    self._load_in_background(matcher)
+                    raise
+                program_index = self._child.progress.value
+                stale = self._discard_child()
+                self._load_in_background(matcher)
+                raise RegexTimeout(program_index)
+        finally:
+            if stale is not None:
+                stale.kill()
+
+    def vet(self, patterns: list[tuple[re.Pattern, int]], texts: Optional[list[str]], budget: float, reason: str) -> list[DisabledRule]:
+        """
+        Run every pattern against the texts and report the patterns that do not finish within the budget.
+
+        Args:
+            patterns: The (pattern, row index) pairs to vet.
+            texts: The texts to search, or None to search the probe texts from get_probe_texts.
+            budget: The wall-clock budget for searching one text, in seconds.
+            reason: The reason to record for patterns that run out of budget.
+
+        Returns:
+            list[DisabledRule]: The patterns that ran out of budget.
+        """
+        pattern_budget = budget * (len(texts) if texts is not None else MAX_PROBES_PER_PATTERN)
+        disabled = []
+        with self._lock:
+            remaining = patterns
+            while remaining:
+                child = _Child()
+                try:
+                    child.conn.send(("vet", remaining, texts))
+                    # The budgets start once the child has received and compiled every pattern
+                    if not child.conn.poll(LOAD_TIMEOUT):
+                        raise RuntimeError("regex sandbox did not finish loading the patterns to vet")
+                    child.conn.recv()
+                    finished = 0
+                    while finished < len(remaining) and child.conn.poll(pattern_budget):
+                        finished = child.conn.recv() + 1
+                finally:
+                    child.kill()
+                if finished == len(remaining):
+                    break
+                pattern, row = remaining[finished]
+                LOGGER.w(TAG, f"vet: pattern for row {row + 1} ran out of budget: {pattern.pattern}")
+                disabled.append(DisabledRule(row, pattern.pattern, reason))
+                remaining = remaining[finished + 1:]
+        return disabled
+
+
+def get_probe_texts(pattern: re.Pattern) -> list[str]:
+    """
+    Build adversarial texts for a pattern: long runs of the characters that appear in the pattern, followed by a
+    character that is unlikely to match, which is what makes nested quantifiers backtrack catastrophically.
+
+    Args:
+        pattern: The pattern to build probes for.
+
+    Returns:
+        list[str]: The probe texts.
+    """
+    characters = sorted(set(char for char in pattern.pattern if char.isalnum()) | {"a", "0", " "})
+    probes = [char * PROBE_LENGTH + "!" for char in characters]
+    probes.append(" ".join(characters) * (PROBE_LENGTH // (2 * len(characters) or 1)) + "!")
+    return probes[:MAX_PROBES_PER_PATTERN]
+
@@ -0,0 +1,160 @@
+import asyncio
+import multiprocessing
+import statistics
+import threading
+import time
+from collections import deque
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import Final, Optional
+
+import src.utils.responses as responses
+from src.constants import LOGGER
+from src.utils.hit_counter import hit_counter
+
+TAG = "ResponseExecutor"
+
+MODE_INLINE: Final = "inline"
+MODE_THREAD: Final = "thread"
+MODE_PROCESS: Final = "process"
+MODES: Final = (MODE_INLINE, MODE_THREAD, MODE_PROCESS)
+# How many recent queueing delays to keep for the percentiles in the stats.
+DELAY_SAMPLES: Final = 1000
+
+
+def _get_response_in_worker(content_hash: Optional[str], message: str) -> tuple[Optional[str], Optional[str], float]:
+    # Runs in a worker process. The worker has its own copy of the ruleset, so reload it if the parent has reloaded.
+    # The hit is returned instead of counted, because only the parent process writes hit counts to the database.
+    started = time.time()
+    if content_hash != responses.get_content_hash():
+        responses.load_responses_file()
+    response, rule = responses.get_response_and_rule(message)
+    return response, rule, started
+
+
+def _get_response_in_thread(message: str) -> tuple[Optional[str], Optional[str], float]:
+    started = time.time()
+    response, rule = responses.get_response_and_rule(message)
+    return response, rule, started
+
+
+@dataclass
+class ResponseExecutorStats:
+    mode: str
+    active: bool
+    submitted: int
+    dropped: int
+    pending: int
+    p50_delay_ms: float
+    p99_delay_ms: float
+    max_delay_ms: float
+
+    def __str__(self):
+        return (f"mode: {self.mode}, active: {self.active}, submitted: {self.submitted}, dropped: {self.dropped}, pending: {self.pending}, "
+                f"queueing delay p50: {self.p50_delay_ms:.2f} ms, p99: {self.p99_delay_ms:.2f} ms, max: {self.max_delay_ms:.2f} ms")
+
+
+class ResponseExecutor:
+    """
+    Runs responses.get_response_and_rule off the event loop once the ruleset is large enough for matching to hold up other
+    gateway events. Smaller rulesets are matched inline, because handing a message to a pool costs more than matching it.
+    """
+
+    def __init__(self, mode: str, threshold: int, workers: int, max_pending: int):
+        """
+        Initialize the ResponseExecutor.
+
+        Args:
+            mode: MODE_INLINE to always match on the event loop, MODE_THREAD to use a thread pool, or MODE_PROCESS to use
+                a process pool.
+            threshold: The number of rules from which matching is sent to the pool.
+            workers: The number of threads or processes in the pool.
+            max_pending: The maximum number of messages waiting for or being matched in the pool. Messages that arrive
+                when the pool is full are not answered, so a flood cannot queue up without limit.
+        """
+        if mode not in MODES:
+            raise ValueError(f"Unknown response executor mode: {mode}. Expected one of: {MODES}")
+        self.mode = mode
+        self.threshold = threshold
+        self.workers = workers
+        self.max_pending = max_pending
+        self.submitted = 0
+        self.dropped = 0
+        self.pending = 0
+        self._delays: deque[float] = deque(maxlen=DELAY_SAMPLES)
+        self._max_delay = 0.0
+        self._executor: Optional[Executor] = None
+        self._lock = threading.Lock()
+
+    def _get_executor(self) -> Executor:
+        if self._executor is None:
+            if self.mode == MODE_PROCESS:
+                # Fork, because spawn would re-import client.py in every worker, and client.py starts the bot at import time.
+                self._executor = ProcessPoolExecutor(self.workers, mp_context=multiprocessing.get_context("fork"), initializer=responses.reset_after_fork)
+            else:
+                self._executor = ThreadPoolExecutor(self.workers, thread_name_prefix=TAG)
+        return self._executor
+
+    def is_active(self) -> bool:
+        return self.mode != MODE_INLINE and responses.get_rule_count() >= self.threshold
+
+    async def get_response_and_rule(self, message: str) -> tuple[Optional[str], Optional[str]]:
+        """
+        Get a response for the message and the rule that matched, matching it in the pool if the ruleset is large
+        enough. A hit is counted for the matched rule.
+
+        Args:
+            message: The message to respond to.
+
+        Returns:
+            tuple[Optional[str], Optional[str]]: The response and the keyword cell of the matched rule, or (None, None)
+                if no rule matched or the pool was full.
+        """
+        if not self.is_active():
+            response, rule = responses.get_response_and_rule(message)
+            if rule is not None:
+                hit_counter.record(rule)
+            return response, rule
+
+        if self.pending >= self.max_pending:
+            self.dropped += 1
+            LOGGER.w(TAG, f"get_response_and_rule: {self.pending} messages are already pending. Dropping message.")
+            return None, None
+
+        self.pending += 1
+        self.submitted += 1
+        submitted = time.time()
+        try:
+            loop = asyncio.get_running_loop()
+            if self.mode == MODE_PROCESS:
+                future = loop.run_in_executor(self._get_executor(), _get_response_in_worker, responses.get_content_hash(), message)
+            else:
+                future = loop.run_in_executor(self._get_executor(), _get_response_in_thread, message)
+            response, rule, started = await future
+        except Exception as e:
+            LOGGER.e(TAG, "get_response_and_rule: failed to match message in the pool", e)
+            return None, None
+        finally:
+            self.pending -= 1
+        if rule is not None:
+            hit_counter.record(rule)
+
+        delay = max(started - submitted, 0.0)
+        with self._lock:
+            self._delays.append(delay)
+            self._max_delay = max(self._max_delay, delay)
+        LOGGER.d(TAG, f"get_response_and_rule: queueing delay: {delay * 1000:.2f} ms")
+        return response, rule
+
+    def get_stats(self) -> ResponseExecutorStats:
+        with self._lock:
+            delays = sorted(self._delays)
+            max_delay = self._max_delay
+        p50 = statistics.median(delays) if delays else 0.0
+        p99 = delays[min(len(delays) - 1, int(len(delays) * 0.99))] if delays else 0.0
+        return ResponseExecutorStats(self.mode, self.is_active(), self.submitted, self.dropped, self.pending, p50 * 1000, p99 * 1000, max_delay * 1000)
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(cancel_futures=True)
+            self._executor = None
@@ -0,0 +1,83 @@
+import threading
+from typing import Final
+
+from src import constants
+from src.constants import LOGGER
+from src.db.db_manager import DbManager
+from src.db.response_hits.response_hits_dao import ResponseHitsDao
+from src.db.response_hits.response_hits_record import ResponseHitsRecord
+from src.utils.hit_counter import hit_counter
+from src.utils.signal_util import signal_util
+
+TAG = "ResponseHitsUtil"
+MAX_LISTED_RULES: Final = 50
+
+
+class ResponseHitsUtil:
+    """
+    Periodically writes the hit counts collected by hit_counter to the database in one batch, so counting hits never
+    adds a database write to the message hot path.
+    """
+
+    def __init__(self, flush_interval: float):
+        self.is_running = False
+        self.flush_interval = flush_interval
+        self.start()
+
+    def start(self):
+        self.is_running = True
+        thread = threading.Thread(target=self._loop)
+        thread.start()
+
+    def stop(self):
+        self.is_running = False
+
+    @staticmethod
+    def _flush(response_hits_dao: ResponseHitsDao):
+        hits = hit_counter.drain()
+        if not hits:
+            return
+        try:
+            response_hits_dao.add_hits(hits)
+            LOGGER.d(TAG, f"_flush: flushed hits for {len(hits)} rules")
+        except Exception as e:
+            LOGGER.e(TAG, "_flush: failed to flush hits. Will retry on the next flush.", e)
+            hit_counter.restore(hits)
+
+    def _loop(self):
+        # Need to get the DB manager and dao here because it needs to be initialized in the same thread it is used from
+        db_manager = DbManager(constants.DB_PATH)
+        response_hits_dao = ResponseHitsDao(db_manager)
+        while not signal_util.is_interrupted and self.is_running:
+            signal_util.wait(self.flush_interval)
+            self._flush(response_hits_dao)
+        self.stop()
+        LOGGER.i(TAG, "ResponseHitsUtil stopped")
+
+
+def get_hits_report(rule_keys: list[str], records: list[ResponseHitsRecord], count: int) -> str:
+    """
+    Build a report of the most used rules and the rules that never fired.
+
+    Args:
+        rule_keys: The keyword cells of the rules in the current responses file.
+        records: The hit counts stored in the database.
+        count: How many of the most used rules to list.
+
+    Returns:
+        str: The report.
+    """
+    totals = {record.rule: record.hits for record in records}
+    for rule, (hits, _) in hit_counter.peek().items():
+        totals[rule] = totals.get(rule, 0) + hits
+
+    hot = sorted((rule for rule in rule_keys if totals.get(rule, 0) > 0), key=lambda rule: totals[rule], reverse=True)
+    dead = [rule for rule in rule_keys if totals.get(rule, 0) == 0]
+
+    report = f"Hot rules ({len(hot)} of {len(rule_keys)} rules have fired):\n"
+    report += "".join(f"{index + 1}. {rule}: {totals[rule]} hits\n" for index, rule in enumerate(hot[:count]))
+    report += f"Dead rules ({len(dead)} rules have never fired):\n"
+    report += "".join(f"- {rule}\n" for rule in dead[:MAX_LISTED_RULES])
+    if len(dead) > MAX_LISTED_RULES:
+        report += f"...and {len(dead) - MAX_LISTED_RULES} more\n"
+    return report
@@ -0,0 +1,175 @@
+import re
+import time
+from dataclasses import dataclass
+from typing import Final, Optional
+
+from src.constants import LOGGER
+
+TAG = "ResponseLimiter"
+# When there are more buckets than this, buckets that have refilled completely are dropped, because a full bucket
+# behaves exactly like a missing one.
+MAX_BUCKETS: Final = 10000
+_RATE_LIMIT_PATTERN: Final = re.compile(r"^\s*(\d+)\s*/\s*(\d+(?:\.\d+)?)\s*s?\s*$")
+
+
+@dataclass(frozen=True)
+class RateLimit:
+    count: int
+    seconds: float
+
+    def __str__(self):
+        return f"{self.count}/{self.seconds:g}s"
+
+
+def parse_rate_limit(text: str) -> RateLimit:
+    """
+    Parse a rate limit in the form "<count>/<seconds>", for example "1/60" for one reply per minute.
+
+    Args:
+        text: The rate limit to parse.
+
+    Returns:
+        RateLimit: The parsed rate limit.
+
+    Raises:
+        ValueError: If the text is not a valid rate limit.
+    """
+    match = _RATE_LIMIT_PATTERN.match(text)
+    if match is None or int(match.group(1)) < 1 or float(match.group(2)) <= 0:
+        raise ValueError(f"Rate limit must look like '<count>/<seconds>' with a count of at least 1: {text}")
+    return RateLimit(int(match.group(1)), float(match.group(2)))
+
+
+class TokenBucket:
+    """
+    Allows up to RateLimit.count replies at once, refilling one token every RateLimit.seconds / RateLimit.count seconds.
+    """
+
+    def __init__(self, rate_limit: RateLimit, now: float):
+        self.rate_limit = rate_limit
+        self.tokens = float(rate_limit.count)
+        self.updated = now
+
+    def refill(self, now: float):
+        rate = self.rate_limit.count / self.rate_limit.seconds
+        self.tokens = min(float(self.rate_limit.count), self.tokens + (now - self.updated) * rate)
+        self.updated = now
+
+    def is_full(self, now: float) -> bool:
+        self.refill(now)
+        return self.tokens >= self.rate_limit.count
+
+    def get_delay(self, now: float) -> float:
+        """
+        Get how long until the bucket has a token, in seconds.
+        """
+        self.refill(now)
+        return max(0.0, (1 - self.tokens) * self.rate_limit.seconds / self.rate_limit.count)
+
+
+class ResponseLimiter:
+    """
+    Per-channel and per-rule cooldowns for auto-responses. A reply is only sent if both the channel's bucket and the
+    bucket of the rule in that channel have a token. Triggers that arrive while a bucket is empty are coalesced: they
+    are answered by a single trailing reply once the buckets refill, taken with take_trailing_reply, so a trending
+    keyword costs a bounded number of sends. A reply that is allowed in the meantime covers them instead.
+    """
+
+    def __init__(self, channel_rate_limit: Optional[RateLimit]):
+        """
+        Initialize the ResponseLimiter.
+
+        Args:
+            channel_rate_limit: The limit for all replies in one channel, or None for no channel limit.
+        """
+        self.channel_rate_limit = channel_rate_limit
+        self.allowed = 0
+        self.coalesced = 0
+        self._buckets: dict[tuple, TokenBucket] = {}
+        # The number of triggers coalesced since the last reply, by channel and rule.
+        self._pending: dict[tuple[int, str], int] = {}
+
+    def _get_bucket(self, key: tuple, rate_limit: RateLimit, now: float) -> TokenBucket:
+        bucket = self._buckets.get(key)
+        if bucket is None or bucket.rate_limit != rate_limit:
+            bucket = TokenBucket(rate_limit, now)
+            self._buckets[key] = bucket
+        else:
+            bucket.refill(now)
+        return bucket
+
+    def _prune(self, now: float):
+        if len(self._buckets) <= MAX_BUCKETS:
+            return
+        self._buckets = {key: bucket for key, bucket in self._buckets.items() if not bucket.is_full(now)}
+
+    def _get_buckets(self, channel_id: int, rule: str, rule_rate_limit: Optional[RateLimit], now: float) -> list[TokenBucket]:
+        buckets = []
+        if self.channel_rate_limit is not None:
+            buckets.append(self._get_bucket(("channel", channel_id), self.channel_rate_limit, now))
+        if rule_rate_limit is not None:
+            buckets.append(self._get_bucket(("rule", channel_id, rule), rule_rate_limit, now))
+        return buckets
+
+    def allow(self, channel_id: int, rule: str, rule_rate_limit: Optional[RateLimit], now: Optional[float] = None) -> bool:
+        """
+        Check if a reply for the rule may be sent to the channel, and take a token from each bucket if so.
+
+        Args:
+            channel_id: The channel the trigger was posted in.
+            rule: The keyword cell of the rule that matched.
+            rule_rate_limit: The limit of the rule from the responses file, or None for no rule limit.
+            now: The current monotonic time. Defaults to time.monotonic().
+
+        Returns:
+            bool: True if the reply may be sent, False if it is coalesced into a trailing reply.
+        """
+        now = time.monotonic() if now is None else now
+        buckets = self._get_buckets(channel_id, rule, rule_rate_limit, now)
+        key = (channel_id, rule)
+        if any(bucket.tokens < 1 for bucket in buckets):
+            self.coalesced += 1
+            self._pending[key] = self._pending.get(key, 0) + 1
+            LOGGER.d(TAG, f"allow: coalescing trigger of rule {rule} in channel {channel_id}")
+            return False
+        for bucket in buckets:
+            bucket.tokens -= 1
+        self.allowed += 1
+        # This reply answers the triggers that were coalesced before it
+        self._pending.pop(key, None)
+        self._prune(now)
+        return True
+
+    def get_pending(self, channel_id: int, rule: str) -> int:
+        """
+        Get the number of triggers of the rule in the channel that were coalesced since the last reply.
+        """
+        return self._pending.get((channel_id, rule), 0)
+
+    def take_trailing_reply(self, channel_id: int, rule: str, rule_rate_limit: Optional[RateLimit], now: Optional[float] = None) -> tuple[int, float]:
+        """
+        Take a token from each bucket for the trailing reply to the coalesced triggers of the rule in the channel, if
+        the buckets have refilled.
+
+        Args:
+            channel_id: The channel the triggers were posted in.
+            rule: The keyword cell of the rule that matched.
+            rule_rate_limit: The limit of the rule from the responses file, or None for no rule limit.
+            now: The current monotonic time. Defaults to time.monotonic().
+
+        Returns:
+            tuple[int, float]: The number of coalesced triggers the reply answers and 0 if it may be sent now, 0 and 0 if
+                there is nothing left to answer, or 0 and how many seconds to wait before trying again.
+        """
+        now = time.monotonic() if now is None else now
+        key = (channel_id, rule)
+        if key not in self._pending:
+            return 0, 0.0
+        buckets = self._get_buckets(channel_id, rule, rule_rate_limit, now)
+        delay = max((bucket.get_delay(now) for bucket in buckets), default=0.0)
+        if delay > 0:
+            return 0, delay
+        for bucket in buckets:
+            bucket.tokens -= 1
+        self.allowed += 1
+        return self._pending.pop(key), 0.0
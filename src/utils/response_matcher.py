@@ -0,0 +1,189 @@
+import re
+from collections import deque
+from typing import Final, Optional
+
+from src.constants import LOGGER
+
+TAG = "response_matcher.py"
+REGEX_SHARD_SIZE: Final = 256
+
+
+class KeywordAutomaton:
+    """
+    Aho-Corasick automaton over the literal keywords of the responses file.
+
+    Every keyword is tagged with the index of the row it came from, so a single scan of a message finds the lowest
+    matching row index without testing each keyword separately.
+    """
+
+    def __init__(self, keywords: list[tuple[str, int]]):
+        """
+        Build the automaton.
+
+        Args:
+            keywords: The (keyword, row index) pairs to match. Keywords are expected to already be lowercased.
+        """
+        # Node 0 is the root. Each node has its goto transitions, a failure link, and the lowest row index of any
+        # keyword ending at this node or at any node reachable through its failure links.
+        self._goto: list[dict[str, int]] = [{}]
+        self._fail: list[int] = [0]
+        self._output: list[Optional[int]] = [None]
+
+        for keyword, row in keywords:
+            node = 0
+            for char in keyword:
+                next_node = self._goto[node].get(char)
+                if next_node is None:
+                    next_node = len(self._goto)
+                    self._goto[node][char] = next_node
+                    self._goto.append({})
+                    self._fail.append(0)
+                    self._output.append(None)
+                node = next_node
+            if self._output[node] is None or row < self._output[node]:
+                self._output[node] = row
+
+        self._build_failure_links()
+
+    def _build_failure_links(self):
+        queue = deque(self._goto[0].values())
+        while queue:
+            node = queue.popleft()
+            for char, child in self._goto[node].items():
+                queue.append(child)
+                fail = self._fail[node]
+                while fail and char not in self._goto[fail]:
+                    fail = self._fail[fail]
+                self._fail[child] = self._goto[fail].get(char, 0)
+                inherited = self._output[self._fail[child]]
+                if inherited is not None and (self._output[child] is None or inherited < self._output[child]):
+                    self._output[child] = inherited
+
+    def search(self, text: str, limit: Optional[int] = None) -> Optional[int]:
+        """
+        Find the lowest row index with a keyword that occurs in the text.
+
+        Args:
+            text: The lowercased text to scan.
+            limit: Only rows below this index are of interest. Used to stop early.
+
+        Returns:
+            Optional[int]: The lowest matching row index, or None if no keyword occurs in the text.
+        """
+        goto = self._goto
+        fail = self._fail
+        output = self._output
+        best = limit
+        node = 0
+        for char in text:
+            while node and char not in goto[node]:
+                node = fail[node]
+            node = goto[node].get(char, 0)
+            row = output[node]
+            if row is not None and (best is None or row < best):
+                best = row
+                if best == 0:
+                    break
+        return best if best != limit else None
+
+
+class RegexProgram:
+    """
+    A shard of regex keywords, searched one pattern at a time in row order, so the first pattern that matches belongs
+    to the lowest matching row. Sharding lets the matcher skip whole shards that cannot beat the best literal match,
+    and lets the regex sandbox report which shard ran out of budget.
+    """
+
+    def __init__(self, patterns: list[tuple[re.Pattern, int]]):
+        """
+        Args:
+            patterns: The (pattern, row index) pairs, in row order.
+        """
+        self.first_row = patterns[0][1]
+        self.patterns = patterns
+
+    def search(self, text: str) -> Optional[int]:
+        """
+        Find the lowest row in this program with a pattern that occurs in the text.
+
+        Args:
+            text: The lowercased text to search.
+
+        Returns:
+            Optional[int]: The lowest matching row index, or None if no pattern occurs in the text.
+        """
+        for pattern, row in self.patterns:
+            if pattern.search(text):
+                return row
+        return None
+
+
+class ResponseMatcher:
+    """
+    Compiled form of the keyword lists of the responses file.
+
+    Literal keywords are matched with a KeywordAutomaton. Regex keywords are grouped into RegexPrograms of up to
+    REGEX_SHARD_SIZE patterns each. The programs are searched in row order, but only while they can still beat the best
+    literal match, so the first row that matches still wins.
+    """
+
+    def __init__(self, keyword_lists: list[list[str | re.Pattern]], disabled: Optional[set[tuple[int, str]]] = None):
+        """
+        Compile the keyword lists.
+
+        Args:
+            keyword_lists: The parsed keywords of each row, as produced by responses.parse_keyword.
+            disabled: The (row index, pattern) pairs of regex keywords to leave out.
+        """
+        literals = []
+        self._programs: list[RegexProgram] = []
+        shard = []
+        for row, keyword_list in enumerate(keyword_lists):
+            for keyword in keyword_list:
+                if not isinstance(keyword, re.Pattern):
+                    literals.append((keyword, row))
+                elif disabled and (row, keyword.pattern) in disabled:
+                    LOGGER.w(TAG, f"ResponseMatcher: keyword for row {row} is disabled: {keyword.pattern}")
+                else:
+                    shard.append((keyword, row))
+                    if len(shard) >= REGEX_SHARD_SIZE:
+                        self._programs.append(RegexProgram(shard))
+                        shard = []
+        if shard:
+            self._programs.append(RegexProgram(shard))
+        self._automaton = KeywordAutomaton(literals)
+
+    @property
+    def programs(self) -> list[RegexProgram]:
+        return self._programs
+
+    def match_literals(self, text: str) -> Optional[int]:
+        """
+        Find the first row with a literal keyword that occurs in the text, ignoring regex keywords.
+
+        Args:
+            text: The lowercased message to match.
+
+        Returns:
+            Optional[int]: The index of the first row with a matching literal keyword, or None.
+        """
+        return self._automaton.search(text)
+
+    def match(self, text: str) -> Optional[int]:
+        """
+        Find the first row with a keyword that matches the text.
+
+        Args:
+            text: The lowercased message to match.
+
+        Returns:
+            Optional[int]: The index of the first matching row, or None if no row matches.
+        """
+        best = self._automaton.search(text)
+        for program in self._programs:
+            if best is not None and program.first_row >= best:
+                break
+            row = program.search(text)
+            if row is not None:
+                return row if best is None or row < best else best
+        return best
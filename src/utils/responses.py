@@ -1,50 +1,234 @@
 import csv
+import hashlib
+import io
 import os
+import pickle
 import random
 import re
+import threading
+from dataclasses import dataclass, field, replace
 from typing import Optional, Final
 
 from dotenv import load_dotenv
 
+from src import constants
 from src.constants import LOGGER
+from src.utils.hit_counter import hit_counter
+from src.utils.match_cache import MISSING, MatchCache, MatchCacheStats
+from src.utils.regex_guard import DisabledRule, RegexSandbox, RegexSandboxNotReady, RegexTimeout, forget_inherited_children
+from src.utils.response_limiter import RateLimit, parse_rate_limit
+from src.utils.response_matcher import ResponseMatcher
 
 TAG = "responses.py"
 
 load_dotenv()
 RESPONSES_FILE_PATH = os.getenv('RESPONSES_FILE_PATH')
+RESPONSES_CACHE_SIZE = int(os.getenv('RESPONSES_CACHE_SIZE', 1024))
+# Longer messages are rarely repeated word for word, so they are matched without going through the cache.
+MAX_CACHED_MESSAGE_LENGTH: Final = 200
+# When set, regex keywords are vetted while loading and searched in a sandbox process with this wall-clock budget per
+# message, so a catastrophic backtracking pattern cannot freeze the bot.
+RESPONSES_REGEX_BUDGET_MS = os.getenv('RESPONSES_REGEX_BUDGET_MS')
+REGEX_BUDGET = float(RESPONSES_REGEX_BUDGET_MS) / 1000 if RESPONSES_REGEX_BUDGET_MS else None
 
-_keyword_lists = []
-_response_lists = []
-_last_known_good_file = None
 _COMMENT_CHARACTER: Final = "#"
 
+SNAPSHOT_PATH: Final = f"{constants.OUT_PATH}/responses_snapshot.pickle"
+# Increase this whenever the parsed keywords or the ResponseMatcher change shape, so old snapshots are ignored.
+SNAPSHOT_VERSION: Final = 5
+
+
+@dataclass
+class _Ruleset:
+    """
+    Everything derived from one version of the responses file. It is replaced as a whole, so a reader on another
+    thread always sees a matcher, cache and response lists that belong together.
+    """
+    keyword_lists: list[list[str | re.Pattern]]
+    response_lists: list[list[str]]
+    matcher: ResponseMatcher
+    cache: MatchCache
+    file: Optional[str] = None
+    content_hash: Optional[str] = None
+    disabled_rules: list[DisabledRule] = field(default_factory=list)
+    skipped_searches: int = 0
+    # The keyword cell of each row. Hit counts are keyed by it, so they survive reordering the responses file.
+    rule_keys: list[str] = field(default_factory=list)
+    # The optional rate limit from the third column of each row, by keyword cell.
+    rule_rate_limits: dict[str, RateLimit] = field(default_factory=dict)
+
+
+_ruleset = _Ruleset([], [], ResponseMatcher([]), MatchCache(RESPONSES_CACHE_SIZE))
+# Serializes loads from the responses watcher thread and the /reload_responses command, and rule disabling.
+_load_lock = threading.Lock()
+# Searches regex keywords within REGEX_BUDGET. Vetting uses its own sandbox, so it never kills the one serving messages.
+_sandbox = RegexSandbox()
+_vet_sandbox = RegexSandbox()
+_diagnose_lock = threading.Lock()
+
+
+def _parse_responses_file(text: str) -> tuple[list[list[str | re.Pattern]], list[list[str]], list[str], dict[str, RateLimit]]:
+    keyword_lists = []
+    response_lists = []
+    rule_keys = []
+    rule_rate_limits = {}
+    csv_reader = csv.reader(filter(lambda line: line[0] != _COMMENT_CHARACTER, io.StringIO(text)), delimiter=',')
+    for row in csv_reader:
+        keyword_lists.append([parse_keyword(keyword) for keyword in row[0].split(";;")])
+        response_lists.append([parse_response(response) for response in row[1].split(";;")])
+        rule_keys.append(row[0].strip())
+        if len(row) > 2 and row[2].strip():
+            rule_rate_limits[row[0].strip()] = parse_rate_limit(row[2])
+    return keyword_lists, response_lists, rule_keys, rule_rate_limits
+
+
+def _load_snapshot(content_hash: str) -> Optional[dict]:
+    try:
+        with open(SNAPSHOT_PATH, "rb") as snapshot_file:
+            snapshot = pickle.load(snapshot_file)
+    except FileNotFoundError:
+        return None
+    except Exception as e:
+        LOGGER.w(TAG, f"_load_snapshot: ignoring unreadable snapshot: {e}")
+        return None
+    if snapshot.get("version") != SNAPSHOT_VERSION or snapshot.get("hash") != content_hash or snapshot.get("regex_budget") != REGEX_BUDGET:
+        LOGGER.d(TAG, "_load_snapshot: snapshot is out of date")
+        return None
+    return snapshot
+
+
+def _save_snapshot(content_hash: str, ruleset: _Ruleset):
+    snapshot = {
+        "version": SNAPSHOT_VERSION,
+        "hash": content_hash,
+        "regex_budget": REGEX_BUDGET,
+        "keyword_lists": ruleset.keyword_lists,
+        "response_lists": ruleset.response_lists,
+        "rule_keys": ruleset.rule_keys,
+        "rule_rate_limits": ruleset.rule_rate_limits,
+        "matcher": ruleset.matcher,
+        "disabled_rules": ruleset.disabled_rules,
+    }
+    temp_path = f"{SNAPSHOT_PATH}.tmp"
+    try:
+        with open(temp_path, "wb") as snapshot_file:
+            pickle.dump(snapshot, snapshot_file, protocol=pickle.HIGHEST_PROTOCOL)
+        # Replace the old snapshot in one step, so a crash never leaves a half-written snapshot behind.
+        os.replace(temp_path, SNAPSHOT_PATH)
+    except Exception as e:
+        LOGGER.w(TAG, f"_save_snapshot: failed to save snapshot: {e}")
+
+
+def _get_regex_patterns(keyword_lists: list[list[str | re.Pattern]]) -> list[tuple[re.Pattern, int]]:
+    return [(keyword, row) for row, keyword_list in enumerate(keyword_lists) for keyword in keyword_list if isinstance(keyword, re.Pattern)]
+
+
+def _build_ruleset(path: str) -> _Ruleset:
+    with open(path, "r") as csv_file:
+        text = csv_file.read()
+    content_hash = hashlib.sha256(text.encode()).hexdigest()
+    file = text.replace("\\", "\\\\\\")
+
+    snapshot = _load_snapshot(content_hash)
+    if snapshot is not None:
+        LOGGER.i(TAG, "Loaded responses from snapshot.")
+        return _Ruleset(snapshot["keyword_lists"], snapshot["response_lists"], snapshot["matcher"], MatchCache(RESPONSES_CACHE_SIZE), file,
+                        content_hash, snapshot["disabled_rules"], rule_keys=snapshot["rule_keys"], rule_rate_limits=snapshot["rule_rate_limits"])
+
+    keyword_lists, response_lists, rule_keys, rule_rate_limits = _parse_responses_file(text)
+    disabled_rules = []
+    if REGEX_BUDGET is not None:
+        disabled_rules = _vet_sandbox.vet(_get_regex_patterns(keyword_lists), None, REGEX_BUDGET, "too slow on probe texts while loading")
+    matcher = ResponseMatcher(keyword_lists, {(rule.row, rule.pattern) for rule in disabled_rules})
+    ruleset = _Ruleset(keyword_lists, response_lists, matcher, MatchCache(RESPONSES_CACHE_SIZE), file, content_hash, disabled_rules, rule_keys=rule_keys,
+                       rule_rate_limits=rule_rate_limits)
+    _save_snapshot(content_hash, ruleset)
+    return ruleset
+
 
 def load_responses_file():
-    global _keyword_lists, _response_lists, _last_known_good_file
+    """
+    Parse and compile the responses file, then swap it in. If anything goes wrong, the last known good ruleset is kept.
+
+    If the file has not changed since the last snapshot in SNAPSHOT_PATH, the compiled ruleset is loaded from the
+    snapshot instead. This does blocking file IO and may compile every keyword, so call it from a worker thread when
+    the event loop is running.
 
-    keyword_lists_old = _keyword_lists.copy()
-    response_lists_old = _response_lists.copy()
+    Returns:
+        bool: True if the responses file was loaded, False otherwise.
+    """
+    global _ruleset
+
+    with _load_lock:
+        try:
+            ruleset = _build_ruleset(RESPONSES_FILE_PATH)
+        except Exception as e:
+            LOGGER.e(TAG, f"Error loading responses file: {e}")
+            return False
+        _ruleset = ruleset
+    LOGGER.i(TAG, "Successfully loaded responses file.")
+    LOGGER.d(TAG, str(ruleset.keyword_lists))
+    LOGGER.d(TAG, str(ruleset.response_lists))
+    for rule in ruleset.disabled_rules:
+        LOGGER.w(TAG, f"Disabled response rule: {rule}")
+    if REGEX_BUDGET is not None:
+        try:
+            _sandbox.load(ruleset.matcher)
+        except Exception as e:
+            LOGGER.e(TAG, f"Failed to load responses into the regex sandbox: {e}")
+    return True
 
-    _keyword_lists = []
-    _response_lists = []
 
+def _disable_rules(ruleset: _Ruleset, program_index: int, text: str):
+    """
+    Find the patterns of a regex program that ran out of budget on a message, and swap in a ruleset without them.
+    Runs on its own thread, because vetting the patterns takes up to REGEX_BUDGET per pattern.
+    """
+    global _ruleset
+
+    if not _diagnose_lock.acquire(blocking=False):
+        LOGGER.d(TAG, "_disable_rules: already looking for slow rules. Skipping.")
+        return
     try:
-        with open(RESPONSES_FILE_PATH, "r") as csv_file:
-            csv_reader = csv.reader(filter(lambda line: line[0] != _COMMENT_CHARACTER, csv_file), delimiter=',')
-            for row in csv_reader:
-                _keyword_lists.append([parse_keyword(keyword) for keyword in row[0].split(";;")])
-                _response_lists.append([parse_response(response) for response in row[1].split(";;")])
-            csv_file.seek(0)
-            _last_known_good_file = csv_file.read().replace("\\", "\\\\\\")
-        LOGGER.i(TAG, "Successfully loaded responses file.")
-        LOGGER.d(TAG, str(_keyword_lists))
-        LOGGER.d(TAG, str(_response_lists))
-        return True
+        patterns = ruleset.matcher.programs[program_index].patterns
+        disabled_rules = _vet_sandbox.vet(patterns, [text], REGEX_BUDGET, "ran out of budget on a message")
+        if not disabled_rules:
+            LOGGER.w(TAG, f"_disable_rules: no single rule of program {program_index} ran out of budget on its own.")
+            return
+        with _load_lock:
+            if _ruleset is not ruleset:
+                LOGGER.d(TAG, "_disable_rules: the ruleset was reloaded in the meantime.")
+                return
+            disabled_rules = ruleset.disabled_rules + disabled_rules
+            matcher = ResponseMatcher(ruleset.keyword_lists, {(rule.row, rule.pattern) for rule in disabled_rules})
+            _ruleset = replace(ruleset, matcher=matcher, cache=MatchCache(RESPONSES_CACHE_SIZE), disabled_rules=disabled_rules)
+        for rule in disabled_rules:
+            LOGGER.w(TAG, f"Disabled response rule: {rule}")
+        _sandbox.load(matcher)
     except Exception as e:
-        LOGGER.e(TAG, f"Error loading responses file: {e}")
-        _keyword_lists = keyword_lists_old
-        _response_lists = response_lists_old
-        return False
+        LOGGER.e(TAG, f"_disable_rules: failed to disable slow rules: {e}")
+    finally:
+        _diagnose_lock.release()
+
+
+def reset_after_fork():
+    """
+    Give a process that was forked from the bot its own regex sandboxes and locks. The inherited sandbox children belong
+    to the parent process, so the forked process cannot use them, and the inherited locks may have been held by parent
+    threads that do not exist here.
+    """
+    global _load_lock, _sandbox, _vet_sandbox, _diagnose_lock
+
+    forget_inherited_children()
+    _load_lock = threading.Lock()
+    _sandbox = RegexSandbox()
+    _vet_sandbox = RegexSandbox()
+    _diagnose_lock = threading.Lock()
+    if REGEX_BUDGET is not None:
+        try:
+            _sandbox.load(_ruleset.matcher)
+        except Exception as e:
+            LOGGER.e(TAG, f"reset_after_fork: failed to load responses into the regex sandbox: {e}")
 
 
 def parse_keyword(keyword: str) -> str | re.Pattern:
@@ -69,34 +253,118 @@ def parse_response(response: str) -> str:
 
 
 def get_all_responses():
-    return f"keywords: {_keyword_lists}\nresponses: {_response_lists}"
+    ruleset = _ruleset
+    return f"keywords: {ruleset.keyword_lists}\nresponses: {ruleset.response_lists}"
 
 
 def get_responses_file():
-    return _last_known_good_file
+    return _ruleset.file
 
 
-def get_response(message: str) -> Optional[str]:
+def get_rule_count() -> int:
+    return len(_ruleset.response_lists)
+
+
+def get_rule_keys() -> list[str]:
+    return _ruleset.rule_keys
+
+
+def get_rule_rate_limit(rule: str) -> Optional[RateLimit]:
+    return _ruleset.rule_rate_limits.get(rule)
+
+
+def get_content_hash() -> Optional[str]:
+    """
+    Get the content hash of the responses file the current ruleset was loaded from. Worker processes compare it with
+    their own to notice that the parent process reloaded the responses file.
     """
-    Get a response based on the input message.
+    return _ruleset.content_hash
+
+
+def get_cache_stats() -> MatchCacheStats:
+    return _ruleset.cache.get_stats()
+
+
+def get_disabled_rules_report() -> str:
+    ruleset = _ruleset
+    report = f"Regex budget: {f'{REGEX_BUDGET * 1000:g} ms' if REGEX_BUDGET is not None else 'disabled'}. "
+    report += f"Messages with skipped regex rules since the last reload: {ruleset.skipped_searches}.\n"
+    report += f"Disabled rules: {len(ruleset.disabled_rules)}\n"
+    report += "\n".join(str(rule) for rule in ruleset.disabled_rules)
+    return report
+
+
+def _guarded_match(ruleset: _Ruleset, text: str) -> tuple[Optional[int], bool]:
+    best = ruleset.matcher.match_literals(text)
+    try:
+        row = _sandbox.search(ruleset.matcher, text, best, REGEX_BUDGET)
+    except RegexTimeout as e:
+        ruleset.skipped_searches += 1
+        LOGGER.w(TAG, f"_guarded_match: regex rules skipped, program {e.program_index} ran out of budget on a message of length {len(text)}")
+        threading.Thread(target=_disable_rules, args=(ruleset, e.program_index, text)).start()
+        # The result is incomplete, so it must not be cached.
+        return best, False
+    except RegexSandboxNotReady:
+        # A new sandbox is being loaded in the background. Until then, only literal rules are matched.
+        ruleset.skipped_searches += 1
+        LOGGER.d(TAG, "_guarded_match: regex rules skipped, the regex sandbox is still loading")
+        return best, False
+    except Exception as e:
+        LOGGER.e(TAG, f"_guarded_match: regex sandbox failed, only literal rules were matched: {e}")
+        return best, False
+    return (row if row is not None else best), True
+
+
+def _match(ruleset: _Ruleset, text: str) -> Optional[int]:
+    cacheable = len(text) <= MAX_CACHED_MESSAGE_LENGTH
+    if cacheable:
+        index = ruleset.cache.get(text)
+        if index is not MISSING:
+            return index
+    if REGEX_BUDGET is None:
+        index = ruleset.matcher.match(text)
+    else:
+        index, complete = _guarded_match(ruleset, text)
+        cacheable = cacheable and complete
+    if cacheable:
+        ruleset.cache.put(text, index)
+    return index
+
+
+def get_response_and_rule(message: str) -> tuple[Optional[str], Optional[str]]:
+    """
+    Get a response based on the input message, and the rule that matched, without counting the hit.
 
     Args:
     message (str): The input message to match against keyword lists.
 
     Returns:
-    Optional[str]: The response based on the input message, or None if no match is found.
+    tuple[Optional[str], Optional[str]]: The response and the keyword cell of the matched rule, or (None, None) if no match is found.
     """
     if message is None:
-        return None
+        return None, None
+
+    ruleset = _ruleset
+    index = _match(ruleset, message.lower())
+    if index is None:
+        return None, None
+    return random.choice(ruleset.response_lists[index]), ruleset.rule_keys[index]
+
+
+def get_response(message: str) -> Optional[str]:
+    """
+    Get a response based on the input message, and count a hit for the rule that matched.
+
+    Args:
+    message (str): The input message to match against keyword lists.
 
-    global _keyword_lists, _response_lists
-    for index, keyword_list in enumerate(_keyword_lists):
-        for keyword in keyword_list:
-            if isinstance(keyword, str) and keyword in message.lower():
-                return random.choice(_response_lists[index])
-            elif isinstance(keyword, re.Pattern) and keyword.search(message.lower()):
-                return random.choice(_response_lists[index])
-    return None
+    Returns:
+    Optional[str]: The response based on the input message, or None if no match is found.
+    """
+    response, rule = get_response_and_rule(message)
+    if rule is not None:
+        hit_counter.record(rule)
+    return response
 
 
 load_responses_file()
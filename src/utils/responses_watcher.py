@@ -0,0 +1,59 @@
+import os
+import threading
+from typing import Optional
+
+import src.utils.responses as responses
+from src.constants import LOGGER
+from src.utils.signal_util import signal_util
+
+TAG = "ResponsesWatcher"
+
+
+class ResponsesWatcher:
+    """
+    Polls the responses file for changes and reloads it on its own thread, so parsing and compiling a large responses
+    file never runs on the event loop. If the new file fails to load, the last known good ruleset stays in use.
+    """
+
+    def __init__(self, path: str, interval: float):
+        """
+        Initialize the ResponsesWatcher and start watching.
+
+        Args:
+            path: The path to the responses file.
+            interval: How often to check the file for changes, in seconds.
+        """
+        self.is_running = False
+        self.path = path
+        self.interval = interval
+        self._last_stat = self._get_stat()
+        self.start()
+
+    def start(self):
+        self.is_running = True
+        thread = threading.Thread(target=self._loop)
+        thread.start()
+
+    def stop(self):
+        self.is_running = False
+
+    def _get_stat(self) -> Optional[tuple[int, int]]:
+        try:
+            stat = os.stat(self.path)
+            return stat.st_mtime_ns, stat.st_size
+        except OSError as e:
+            LOGGER.e(TAG, f"_get_stat: failed to stat responses file: {self.path}", e)
+            return None
+
+    def _loop(self):
+        while not signal_util.is_interrupted and self.is_running:
+            signal_util.wait(self.interval)
+            stat = self._get_stat()
+            if stat is None or stat == self._last_stat:
+                continue
+            LOGGER.i(TAG, f"_loop: responses file changed, reloading. stat: {stat}")
+            self._last_stat = stat
+            if not responses.load_responses_file():
+                LOGGER.e(TAG, "_loop: failed to reload responses file. Keeping the last known good responses.")
+        self.stop()
+        LOGGER.i(TAG, "ResponsesWatcher stopped")
@@ -1,6 +1,7 @@
 import signal
 import threading
-from typing import Optional
+import time
+from typing import Callable, Optional
 
 from src.constants import LOGGER
 
@@ -47,25 +48,37 @@ class SignalUtil:
         # Give the program time to clean up
         if self.cleanup_timeout is not None:
             LOGGER.i(TAG, f"interrupt(): waiting so the program can clean up.")
-            self.wait(self.cleanup_timeout)
+            time.sleep(self.cleanup_timeout)
 
         # Restore the original signal handlers and repeat the signal
         signal.signal(signal.SIGINT, self.original_sigint_handler)
         signal.signal(signal.SIGTERM, self.original_sigterm_handler)
         signal.raise_signal(args[0])
 
-    def wait(self, timeout: Optional[float]):
+    def wait(self, timeout: Optional[float], predicate: Optional[Callable[[], bool]] = None):
         """
         Wait function that allows for the program to gracefully exit if interrupted. Use this function in the main loop instead of time.sleep().
 
         Args:
-            timeout: The amount of time to wait in seconds
+            timeout: The amount of time to wait in seconds, or None to wait until interrupted or woken up.
+            predicate: Optional function that is checked whenever notify() is called. The wait ends early once it returns True.
 
         Returns:
 
         """
         self.condition.acquire()
-        self.condition.wait(timeout)
+        self.condition.wait_for(lambda: self.is_interrupted or (predicate is not None and predicate()), timeout)
+        self.condition.release()
+
+    def notify(self):
+        """
+        Wake up the threads waiting in wait(), so they can check their predicate.
+
+        Returns:
+            None
+        """
+        self.condition.acquire()
+        self.condition.notify_all()
         self.condition.release()
 
 
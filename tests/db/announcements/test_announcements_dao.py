@@ -0,0 +1,122 @@
+import os
+import unittest
+from datetime import datetime, timedelta, timezone
+
+from src import constants
+from src.db.announcements.announcements_dao import AnnouncementsDao
+from src.db.db_manager import DbManager
+from tests import test_constants
+
+NOW = constants.JST.localize(datetime(2024, 1, 1, 12, 0, 0))
+
+
+class TestAnnouncementsDao(unittest.TestCase):
+
+    def setUp(self):
+        if os.path.exists(test_constants.TEST_DB_PATH):
+            os.remove(test_constants.TEST_DB_PATH)
+        self.db_manager = DbManager(test_constants.TEST_DB_PATH)
+        self.announcements_dao = AnnouncementsDao(self.db_manager)
+
+    def tearDown(self):
+        self.db_manager.close()
+
+    def test_get_due_announcements(self):
+        past = self.announcements_dao.schedule_announcement(NOW - timedelta(minutes=1), 1, "past", None)
+        now = self.announcements_dao.schedule_announcement(NOW, 1, "now", None)
+        self.announcements_dao.schedule_announcement(NOW + timedelta(minutes=1), 1, "future", None)
+        due = self.announcements_dao.get_due_announcements(NOW)
+        self.assertEqual([announcement.id for announcement in due], [past.id, now.id])
+
+    def test_get_next_due_time(self):
+        self.assertIsNone(self.announcements_dao.get_next_due_time())
+        self.announcements_dao.schedule_announcement(NOW + timedelta(minutes=2), 1, "later", None)
+        self.announcements_dao.schedule_announcement(NOW + timedelta(minutes=1), 1, "next", None)
+        self.assertEqual(self.announcements_dao.get_next_due_time(), NOW + timedelta(minutes=1))
+        # An overdue announcement, such as one that came due while a batch was being sent, is due right away
+        past = self.announcements_dao.schedule_announcement(NOW - timedelta(minutes=1), 1, "past", None)
+        self.assertEqual(self.announcements_dao.get_next_due_time(), NOW - timedelta(minutes=1))
+        self.announcements_dao.mark_sending([past.id], NOW)
+        self.assertEqual(self.announcements_dao.get_next_due_time(), NOW + timedelta(minutes=1))
+
+    def test_reschedule_announcement(self):
+        announcement = self.announcements_dao.schedule_announcement(NOW, 1, "weekly", None, "1w")
+        self.announcements_dao.reschedule_announcement(announcement.id, NOW + timedelta(weeks=1))
+        self.assertEqual(self.announcements_dao.get_due_announcements(NOW + timedelta(days=6)), [])
+        due = self.announcements_dao.get_due_announcements(NOW + timedelta(weeks=1))
+        self.assertEqual([(item.id, item.time, item.recurrence) for item in due], [(announcement.id, NOW + timedelta(weeks=1), "1w")])
+
+    def test_schedule_announcements(self):
+        count = self.announcements_dao.schedule_announcements([(NOW, 1, "first", None, None), (NOW + timedelta(days=1), 2, "second", None, "1d")])
+        self.assertEqual(count, 2)
+        announcements = self.announcements_dao.get_all_announcements()
+        self.assertEqual([(item.channel, item.message, item.recurrence) for item in announcements], [(1, "first", None), (2, "second", "1d")])
+
+    def test_delete_announcements(self):
+        ids = [self.announcements_dao.schedule_announcement(NOW, channel, "message", None).id for channel in (1, 2, 1, 2, 1)]
+        deleted = self.announcements_dao.delete_announcements(first_id=ids[1], last_id=ids[3], channel=1)
+        self.assertEqual([announcement.id for announcement in deleted], [ids[2]])
+        deleted = self.announcements_dao.delete_announcements(channel=2)
+        self.assertEqual([announcement.id for announcement in deleted], [ids[1], ids[3]])
+        self.assertEqual([announcement.id for announcement in self.announcements_dao.get_all_announcements()], [ids[0], ids[4]])
+
+    def test_get_announcements_page(self):
+        ids = [self.announcements_dao.schedule_announcement(NOW, 1, str(index), None).id for index in range(5)]
+        first = self.announcements_dao.get_announcements_page(None, 2)
+        self.assertEqual([announcement.id for announcement in first], ids[:2])
+        rest = self.announcements_dao.get_announcements_page(first[-1].id, 10)
+        self.assertEqual([announcement.id for announcement in rest], ids[2:])
+        self.assertEqual(self.announcements_dao.get_announcement_count(), 5)
+
+    def test_delivery_state(self):
+        first = self.announcements_dao.schedule_announcement(NOW, 1, "first", None)
+        second = self.announcements_dao.schedule_announcement(NOW, 1, "second", None)
+        self.announcements_dao.mark_sending([first.id, second.id], NOW)
+        self.assertEqual(self.announcements_dao.get_due_announcements(NOW), [])
+        sending = self.announcements_dao.get_sending_announcements()
+        self.assertEqual([(announcement.id, announcement.sending_epoch) for announcement in sending], [(first.id, int(NOW.timestamp())), (second.id, int(NOW.timestamp()))])
+
+        retry = NOW + timedelta(minutes=1)
+        failed = self.announcements_dao.record_failed_attempt(first.id, "error", int(retry.timestamp()))
+        self.assertEqual((failed.state, failed.attempts, failed.last_error), ("pending", 1, "error"))
+        self.announcements_dao.defer_announcement(second.id, int(retry.timestamp()))
+        self.assertEqual(self.announcements_dao.get_due_announcements(NOW), [])
+        self.assertEqual(self.announcements_dao.get_next_due_time(), retry)
+        self.assertEqual([announcement.id for announcement in self.announcements_dao.get_due_announcements(retry)], [first.id, second.id])
+
+        failed = self.announcements_dao.record_failed_attempt(first.id, "error", None)
+        self.assertEqual((failed.state, failed.attempts), ("failed", 2))
+        self.assertEqual([announcement.id for announcement in self.announcements_dao.get_due_announcements(retry)], [second.id])
+        rescheduled = self.announcements_dao.reschedule_announcement(first.id, retry)
+        self.assertEqual((rescheduled.state, rescheduled.attempts, rescheduled.last_error), ("pending", 0, None))
+
+    def test_get_attachment_hashes(self):
+        self.announcements_dao.schedule_announcement(NOW, 1, "none", None)
+        self.announcements_dao.schedule_announcement(NOW, 1, "cdn only", {"url": "https://example.com/a.png"})
+        self.announcements_dao.schedule_announcement(NOW, 1, "stored", {"url": "https://example.com/b.png", "sha256": "abc"})
+        self.announcements_dao.schedule_announcement(NOW, 2, "stored again", {"url": "https://example.com/b.png", "sha256": "abc"})
+        self.assertEqual(self.announcements_dao.get_attachment_hashes(), {"abc"})
+
+    def test_upgrade_to_version_4_backfills_due_epoch(self):
+        self.db_manager.cursor.execute("DROP TABLE announcements")
+        self.db_manager.create_tables()
+        self.db_manager.cursor.execute("INSERT INTO announcements(time, channel, message, attachment) VALUES(?, ?, ?, ?)", ("2024-01-01 12:00:00.5+09:00", 1, "old", "null"))
+        self.db_manager.upgrade_to_version_4()
+        self.db_manager.upgrade_to_version_5()
+        self.db_manager.upgrade_to_version_6()
+        due = self.announcements_dao.get_due_announcements(datetime(2024, 1, 1, 3, 0, 1, tzinfo=timezone.utc))
+        self.assertEqual([announcement.message for announcement in due], ["old"])
+        self.assertEqual(self.announcements_dao.get_due_announcements(NOW), [])
+
+    def test_upgrade_to_version_4_deletes_unparsable_times(self):
+        self.db_manager.cursor.execute("DROP TABLE announcements")
+        self.db_manager.create_tables()
+        self.db_manager.cursor.executemany("INSERT INTO announcements(time, channel, message, attachment) VALUES(?, ?, ?, ?)", [("not a time", 1, "broken", "null"), ("2024-01-01 12:00:00+09:00", 1, "old", "null")])
+        self.db_manager.upgrade_to_version_4()
+        self.db_manager.upgrade_to_version_5()
+        self.db_manager.upgrade_to_version_6()
+        self.assertEqual([announcement.message for announcement in self.announcements_dao.get_all_announcements()], ["old"])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,81 @@
+import os
+import unittest
+from datetime import date
+
+from src.db.birthday.birthday_dao import BirthdayDao
+from src.db.db_manager import DbManager
+from tests import test_constants
+
+
+class TestBirthdayDao(unittest.TestCase):
+
+    def setUp(self):
+        if os.path.exists(test_constants.TEST_DB_PATH):
+            os.remove(test_constants.TEST_DB_PATH)
+        self.db_manager = DbManager(test_constants.TEST_DB_PATH)
+        self.birthday_dao = BirthdayDao(self.db_manager)
+
+    def tearDown(self):
+        self.db_manager.close()
+
+    def test_get_unwished_birthdays(self):
+        self.birthday_dao.learn_birthday(1, "03-15")
+        self.birthday_dao.learn_birthday(2, "03-15")
+        self.birthday_dao.learn_birthday(3, "03-16")
+        self.birthday_dao.update_last_wished_year(2, 2024)
+        self.assertEqual([birthday.user_id for birthday in self.birthday_dao.get_unwished_birthdays(date(2024, 3, 15))], [1])
+        self.assertEqual(sorted(birthday.user_id for birthday in self.birthday_dao.get_unwished_birthdays(date(2025, 3, 15))), [1, 2])
+
+    def test_update_last_wished_years(self):
+        for user_id in (1, 2, 3):
+            self.birthday_dao.learn_birthday(user_id, "03-15")
+        self.birthday_dao.update_last_wished_years([1, 3], 2024)
+        self.assertEqual([birthday.user_id for birthday in self.birthday_dao.get_unwished_birthdays(date(2024, 3, 15))], [2])
+
+    def test_timezones(self):
+        self.birthday_dao.learn_birthday(1, "03-15")
+        self.birthday_dao.learn_birthday(2, "03-15", "Asia/Tokyo")
+        self.birthday_dao.learn_birthday(3, "03-15", "America/New_York")
+        self.assertEqual(self.birthday_dao.get_timezones(), {None, "Asia/Tokyo", "America/New_York"})
+        self.assertEqual([birthday.user_id for birthday in self.birthday_dao.get_unwished_birthdays(date(2024, 3, 15))], [1])
+        self.assertEqual([birthday.user_id for birthday in self.birthday_dao.get_unwished_birthdays(date(2024, 3, 15), "Asia/Tokyo")], [2])
+
+    def test_leap_day(self):
+        self.birthday_dao.learn_birthday(1, "02-29")
+        self.birthday_dao.learn_birthday(2, "02-28")
+        self.assertEqual(self.birthday_dao.get_birthday_by_user_id(1).date.strftime("%m-%d"), "02-29")
+        self.assertEqual(sorted(birthday.user_id for birthday in self.birthday_dao.get_unwished_birthdays(date(2025, 2, 28))), [1, 2])
+        self.assertEqual([birthday.user_id for birthday in self.birthday_dao.get_unwished_birthdays(date(2024, 2, 28))], [2])
+        self.assertEqual([birthday.user_id for birthday in self.birthday_dao.get_unwished_birthdays(date(2024, 2, 29))], [1])
+
+    def test_get_birthdays_page(self):
+        for user_id, birthday in ((1, "12-01"), (2, "01-05"), (3, "03-15"), (4, "03-15")):
+            self.birthday_dao.learn_birthday(user_id, birthday)
+        first = self.birthday_dao.get_birthdays_page(None, 2)
+        self.assertEqual([birthday.user_id for birthday in first], [2, 3])
+        second = self.birthday_dao.get_birthdays_page((3, 15, 3), 10)
+        self.assertEqual([birthday.user_id for birthday in second], [4, 1])
+        self.assertEqual([birthday.user_id for birthday in self.birthday_dao.get_birthdays_page(None, 10, (3, 15))], [2])
+        self.assertEqual(self.birthday_dao.get_birthday_count(), 4)
+
+    def test_upgrade_to_version_8_backfills_month_and_day(self):
+        self.db_manager.cursor.execute("DROP TABLE birthdays")
+        self.db_manager.upgrade_to_version_2()
+        self.db_manager.cursor.execute("INSERT INTO birthdays(user_id, date, last_wished_year) VALUES(?, ?, ?)", (1, "02-29", 0))
+        self.db_manager.upgrade_to_version_8()
+        self.db_manager.upgrade_to_version_9()
+        self.assertEqual([birthday.user_id for birthday in self.birthday_dao.get_unwished_birthdays(date(2024, 2, 29))], [1])
+
+    def test_upgrade_to_version_8_moves_unparsed_birthdays(self):
+        self.db_manager.cursor.execute("DROP TABLE birthdays")
+        self.db_manager.upgrade_to_version_2()
+        self.db_manager.cursor.executemany("INSERT INTO birthdays(user_id, date, last_wished_year) VALUES(?, ?, ?)", [(1, "03-15", 0), (2, "banana", 2023)])
+        self.db_manager.upgrade_to_version_8()
+        self.db_manager.upgrade_to_version_9()
+        self.assertEqual([birthday.user_id for birthday in self.birthday_dao.get_all_birthdays()], [1])
+        self.assertEqual([birthday.user_id for birthday in self.birthday_dao.get_birthdays_page(None, 10)], [1])
+        self.assertEqual(self.db_manager.cursor.execute("SELECT * FROM birthdays_unparsed").fetchall(), [(2, "banana", 2023)])
+
+
+if __name__ == '__main__':
+    unittest.main()
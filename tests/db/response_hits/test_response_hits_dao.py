@@ -0,0 +1,31 @@
+import os
+import unittest
+from datetime import datetime
+
+from src.db.db_manager import DbManager
+from src.db.response_hits.response_hits_dao import ResponseHitsDao
+from tests import test_constants
+
+
+class TestResponseHitsDao(unittest.TestCase):
+
+    def setUp(self):
+        if os.path.exists(test_constants.TEST_DB_PATH):
+            os.remove(test_constants.TEST_DB_PATH)
+        self.db_manager = DbManager(test_constants.TEST_DB_PATH)
+        self.response_hits_dao = ResponseHitsDao(self.db_manager)
+
+    def tearDown(self):
+        self.db_manager.close()
+
+    def test_add_hits(self):
+        self.response_hits_dao.add_hits({"ohayaho": (2, datetime(2024, 1, 1)), "69": (1, datetime(2024, 1, 2))})
+        self.response_hits_dao.add_hits({"ohayaho": (3, datetime(2024, 1, 3))})
+        hits = {record.rule: record for record in self.response_hits_dao.get_all_hits()}
+        self.assertEqual(hits["ohayaho"].hits, 5)
+        self.assertEqual(hits["ohayaho"].last_hit, datetime(2024, 1, 3))
+        self.assertEqual(hits["69"].hits, 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
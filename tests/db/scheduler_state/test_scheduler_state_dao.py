@@ -0,0 +1,28 @@
+import os
+import unittest
+
+from src.db.db_manager import DbManager
+from src.db.scheduler_state.scheduler_state_dao import SchedulerStateDao
+from tests import test_constants
+
+
+class TestSchedulerStateDao(unittest.TestCase):
+
+    def setUp(self):
+        if os.path.exists(test_constants.TEST_DB_PATH):
+            os.remove(test_constants.TEST_DB_PATH)
+        self.db_manager = DbManager(test_constants.TEST_DB_PATH)
+        self.scheduler_state_dao = SchedulerStateDao(self.db_manager)
+
+    def tearDown(self):
+        self.db_manager.close()
+
+    def test_set_value(self):
+        self.assertIsNone(self.scheduler_state_dao.get_value("key"))
+        self.scheduler_state_dao.set_value("key", "first")
+        self.scheduler_state_dao.set_value("key", "second")
+        self.assertEqual(self.scheduler_state_dao.get_value("key"), "second")
+
+
+if __name__ == '__main__':
+    unittest.main()
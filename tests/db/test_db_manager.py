@@ -15,6 +15,9 @@ class TestDbClient(unittest.TestCase):
             print("test.db doesn't exist. Skipping deleting it.")
         self.db_manager = DbManager(test_constants.TEST_DB_PATH)
 
+    def tearDown(self):
+        self.db_manager.close()
+
     def test_get_db_schema(self):
         self.assertEqual(self.db_manager.get_db_schema_version(), db_manager.DB_SCHEMA_VERSION)
 
@@ -23,6 +26,19 @@ class TestDbClient(unittest.TestCase):
         self.db_manager.upgrade_db_schema()
         self.assertEqual(self.db_manager.get_db_schema_version(), db_manager.DB_SCHEMA_VERSION)
 
+    def test_failed_upgrade_is_rolled_back(self):
+        def upgrade_to_version_2():
+            self.db_manager.cursor.execute("CREATE TABLE half_upgraded(id INTEGER)")
+            raise ValueError("upgrade failed")
+
+        self.db_manager.set_db_schema_version(1)
+        self.db_manager.upgrade_to_version_2 = upgrade_to_version_2
+        with self.assertRaises(ValueError):
+            self.db_manager.upgrade_db_schema()
+        self.assertEqual(self.db_manager.get_db_schema_version(), 1)
+        tables = self.db_manager.cursor.execute("SELECT name FROM sqlite_master WHERE name='half_upgraded'").fetchall()
+        self.assertEqual(tables, [])
+
 
 if __name__ == '__main__':
     unittest.main()
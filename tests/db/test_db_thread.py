@@ -0,0 +1,40 @@
+import asyncio
+import os
+import threading
+import unittest
+
+from src.db.birthday.birthday_dao import BirthdayDao
+from src.db.db_thread import AsyncDao, DbThread
+from tests import test_constants
+
+
+class TestDbThread(unittest.IsolatedAsyncioTestCase):
+
+    def setUp(self):
+        if os.path.exists(test_constants.TEST_DB_PATH):
+            os.remove(test_constants.TEST_DB_PATH)
+        self.db_thread = DbThread(test_constants.TEST_DB_PATH)
+        self.birthday_dao = AsyncDao(self.db_thread, BirthdayDao)
+
+    def tearDown(self):
+        self.db_thread.stop()
+
+    async def test_calls_run_on_the_db_thread_in_order(self):
+        threads = []
+        await asyncio.gather(*(self.db_thread.run(lambda db_manager: threads.append(threading.current_thread().name)) for _ in range(3)))
+        self.assertEqual(threads, ["DbThread"] * 3)
+        results = await asyncio.gather(self.birthday_dao.learn_birthday(1, "03-15"), self.birthday_dao.forget_birthday(1), self.birthday_dao.get_birthday_by_user_id(1))
+        self.assertEqual(results[0].user_id, 1)
+        self.assertEqual(results[1].user_id, 1)
+        self.assertIsNone(results[2])
+
+    async def test_errors_are_raised_in_the_caller(self):
+        with self.assertRaises(ValueError):
+            await self.birthday_dao.learn_birthday(1, "not a date")
+        with self.assertRaises(AttributeError):
+            self.birthday_dao.remember_everything
+        self.assertEqual(await self.birthday_dao.get_birthday_count(), 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
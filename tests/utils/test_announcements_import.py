@@ -0,0 +1,38 @@
+import json
+import unittest
+from datetime import datetime
+
+from src import constants
+from src.utils.announcements_import import parse_announcements_import
+
+NOW = constants.JST.localize(datetime(2024, 1, 1, 12, 0, 0))
+
+
+class TestAnnouncementsImport(unittest.TestCase):
+    def test_csv(self):
+        data = "time,channel,message,recurrence\n2024-01-02 09:00,123,hello\\nworld,\n2024-01-03T09:00:00+00:00,<#456>,weekly,1W\n".encode()
+        announcements, errors = parse_announcements_import("events.csv", data, NOW)
+        self.assertEqual(errors, [])
+        self.assertEqual([(item.channel, item.message, item.recurrence) for item in announcements], [(123, "hello\nworld", None), (456, "weekly", "1w")])
+        self.assertEqual(announcements[0].time, constants.JST.localize(datetime(2024, 1, 2, 9, 0, 0)))
+
+    def test_json(self):
+        data = json.dumps([{"time": "2024-01-02 09:00", "channel": 123, "message": "hello"}]).encode()
+        announcements, errors = parse_announcements_import("events.json", data, NOW)
+        self.assertEqual(errors, [])
+        self.assertEqual(announcements[0].channel, 123)
+
+    def test_reports_every_invalid_row(self):
+        data = "time,channel,message,recurrence\n2023-12-31 09:00,123,past,\nnot a time,123,bad time,\n2024-01-02 09:00,general,bad channel,\n2024-01-02 09:00,123,bad recurrence,1y\n2024-01-02 09:00,123,,\n2024-01-02 09:00,123,ok,\n".encode()
+        announcements, errors = parse_announcements_import("events.csv", data, NOW)
+        self.assertEqual(len(announcements), 1)
+        self.assertEqual([error.split(":")[0] for error in errors], ["row 2", "row 3", "row 4", "row 5", "row 6"])
+
+    def test_unreadable_file(self):
+        self.assertEqual(parse_announcements_import("events.json", b"{}", NOW)[0], [])
+        self.assertEqual(len(parse_announcements_import("events.json", b"{}", NOW)[1]), 1)
+        self.assertEqual(len(parse_announcements_import("events.csv", b"time,channel,message\n", NOW)[1]), 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
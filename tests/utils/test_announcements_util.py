@@ -0,0 +1,301 @@
+import asyncio
+import os
+import sqlite3
+import threading
+import time
+import unittest
+from datetime import datetime, timedelta, timezone
+from types import SimpleNamespace
+from unittest import mock
+
+import discord
+from tzlocal import get_localzone
+
+from src import constants
+from src.db.announcements.announcements_dao import AnnouncementsDao
+from src.db.announcements.announcements_record import AnnouncementsRecord
+from src.db.db_manager import DbManager
+from src.utils import announcements_util
+from src.utils.announcements_util import AnnouncementsUtil
+from src.utils.catch_up import CatchUpPolicy, parse_catch_up_policy
+from src.utils.response_limiter import RateLimit
+from tests import test_constants
+
+
+BOT = SimpleNamespace(id=0)
+
+
+class FakeChannel:
+    def __init__(self, messages: list[SimpleNamespace]):
+        self.messages = messages
+
+    async def history(self, limit: int, after: datetime, oldest_first: bool):
+        messages = sorted((message for message in self.messages if message.created_at > after), key=lambda message: message.created_at, reverse=not oldest_first)
+        for message in messages[:limit]:
+            yield message
+
+
+class FakeClient:
+    def __init__(self, channel: FakeChannel):
+        self.user = BOT
+        self.channel = channel
+
+    def get_channel(self, channel_id: int) -> FakeChannel:
+        return self.channel
+
+
+class FakeAnnouncementsUtil(AnnouncementsUtil):
+    """
+    An AnnouncementsUtil without its thread, whose sends are recorded instead of posted. A send fails with the error
+    in errors for its message, if there is one.
+    """
+
+    def __init__(self, catch_up_policy: CatchUpPolicy = CatchUpPolicy(), client: FakeClient = None):
+        self.sent: list[str] = []
+        self.errors: dict[str, Exception] = {}
+        super().__init__(client, catch_up_policy=catch_up_policy, catch_up_rate_limit=RateLimit(1000, 1))
+
+    def start(self):
+        pass
+
+    async def _send_announcement(self, announcement: AnnouncementsRecord):
+        # Yield, so the sends of other channels can run in between
+        await asyncio.sleep(0)
+        if announcement.message in self.errors:
+            raise self.errors[announcement.message]
+        self.sent.append(announcement.message)
+
+
+class TestAnnouncementsUtil(unittest.TestCase):
+
+    def setUp(self):
+        if os.path.exists(test_constants.TEST_DB_PATH):
+            os.remove(test_constants.TEST_DB_PATH)
+        self.db_manager = DbManager(test_constants.TEST_DB_PATH)
+        self.announcements_dao = AnnouncementsDao(self.db_manager)
+        self.loop = asyncio.new_event_loop()
+        self.loop_thread = threading.Thread(target=self.loop.run_forever)
+        self.loop_thread.start()
+        self.now = datetime.now(get_localzone())
+
+    def tearDown(self):
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.loop_thread.join()
+        self.loop.close()
+        self.db_manager.close()
+
+    def schedule(self, minutes: float, message: str, channel: int = 1, recurrence=None) -> AnnouncementsRecord:
+        return self.announcements_dao.schedule_announcement(self.now + timedelta(minutes=minutes), channel, message, None, recurrence)
+
+    def test_catch_up_policy_only_applies_to_missed_announcements(self):
+        util = FakeAnnouncementsUtil(parse_catch_up_policy("drop:0"))
+        self.schedule(-120, "missed")
+        retrying = self.schedule(-120, "retrying")
+        # Failed before, and its retry is due now
+        self.announcements_dao.record_failed_attempt(retrying.id, "error", int(self.now.timestamp()) - 1)
+        util._process_due_announcements(self.announcements_dao, self.loop)
+        self.assertEqual(util.sent, ["retrying"])
+        self.assertEqual(self.announcements_dao.get_all_announcements(), [])
+
+
+    def test_failed_send_is_retried_with_backoff(self):
+        util = FakeAnnouncementsUtil()
+        announcement = self.schedule(-0.05, "flaky")
+        util.errors["flaky"] = RuntimeError("gateway hiccup")
+        util._process_due_announcements(self.announcements_dao, self.loop)
+        failed = self.announcements_dao.get_announcement_by_id(announcement.id)
+        self.assertEqual((failed.state, failed.attempts, failed.last_error), ("pending", 1, repr(RuntimeError("gateway hiccup"))))
+        retry = self.announcements_dao.get_next_due_time()
+        self.assertAlmostEqual((retry - self.now).total_seconds(), announcements_util.RETRY_BASE_DELAY, delta=2)
+        # Nothing is sent again before the retry is due
+        util._process_due_announcements(self.announcements_dao, self.loop)
+        self.assertEqual(util.sent, [])
+
+        self.announcements_dao.record_failed_attempt(announcement.id, "error", int(self.now.timestamp()) - 1)
+        util._process_due_announcements(self.announcements_dao, self.loop)
+        retry = self.announcements_dao.get_next_due_time()
+        self.assertAlmostEqual((retry - self.now).total_seconds(), announcements_util.RETRY_BASE_DELAY * 4, delta=2)
+
+        del util.errors["flaky"]
+        self.announcements_dao.defer_announcement(announcement.id, int(self.now.timestamp()) - 1)
+        util._process_due_announcements(self.announcements_dao, self.loop)
+        self.assertEqual(util.sent, ["flaky"])
+        self.assertIsNone(self.announcements_dao.get_announcement_by_id(announcement.id))
+
+    def test_permanent_error_is_not_retried(self):
+        util = FakeAnnouncementsUtil()
+        announcement = self.schedule(-0.05, "forbidden")
+        util.errors["forbidden"] = discord.Forbidden(SimpleNamespace(status=403, reason="Forbidden"), "Missing Access")
+        util._process_due_announcements(self.announcements_dao, self.loop)
+        failed = self.announcements_dao.get_announcement_by_id(announcement.id)
+        self.assertEqual((failed.state, failed.attempts), ("failed", 1))
+        self.assertIsNone(self.announcements_dao.get_next_due_time())
+
+    def test_gives_up_after_max_attempts(self):
+        util = FakeAnnouncementsUtil()
+        announcement = self.schedule(-0.05, "flaky")
+        util.errors["flaky"] = RuntimeError("gateway hiccup")
+        for _ in range(announcements_util.MAX_ATTEMPTS - 1):
+            self.announcements_dao.record_failed_attempt(announcement.id, "error", int(self.now.timestamp()) - 1)
+        util._process_due_announcements(self.announcements_dao, self.loop)
+        failed = self.announcements_dao.get_announcement_by_id(announcement.id)
+        self.assertEqual((failed.state, failed.attempts), ("failed", announcements_util.MAX_ATTEMPTS))
+
+    def test_recurring_announcement_moves_to_next_occurrence(self):
+        util = FakeAnnouncementsUtil()
+        announcement = self.schedule(-0.05, "hourly", recurrence="1h")
+        util._process_due_announcements(self.announcements_dao, self.loop)
+        self.assertEqual(util.sent, ["hourly"])
+        # A series is a single row that is moved forward
+        rescheduled = self.announcements_dao.get_announcement_by_id(announcement.id)
+        self.assertEqual((rescheduled.state, rescheduled.attempts), ("pending", 0))
+        self.assertEqual(rescheduled.time.timestamp(), (announcement.time + timedelta(hours=1)).timestamp())
+        util._process_due_announcements(self.announcements_dao, self.loop)
+        self.assertEqual(util.sent, ["hourly"])
+
+    def test_missed_recurring_announcement_fires_once(self):
+        util = FakeAnnouncementsUtil()
+        announcement = self.schedule(-60 * 24 * 3 - 30, "hourly", recurrence="1h")
+        util._process_due_announcements(self.announcements_dao, self.loop)
+        # The missed occurrences are skipped instead of being sent one after another
+        self.assertEqual(util.sent, ["hourly"])
+        rescheduled = self.announcements_dao.get_announcement_by_id(announcement.id)
+        self.assertEqual(rescheduled.time.timestamp(), (self.now + timedelta(minutes=30)).timestamp())
+
+    def test_dropped_recurring_announcement_moves_to_next_occurrence(self):
+        util = FakeAnnouncementsUtil(parse_catch_up_policy("drop:0"))
+        announcement = self.schedule(-120, "hourly", recurrence="1h")
+        util._process_due_announcements(self.announcements_dao, self.loop)
+        self.assertEqual(util.sent, [])
+        rescheduled = self.announcements_dao.get_announcement_by_id(announcement.id)
+        self.assertEqual((rescheduled.state, rescheduled.time.timestamp()), ("pending", (self.now + timedelta(hours=1)).timestamp()))
+
+    def test_failed_recurring_announcement_moves_to_next_occurrence(self):
+        util = FakeAnnouncementsUtil()
+        announcement = self.schedule(-0.05, "hourly", recurrence="1h")
+        util.errors["hourly"] = discord.Forbidden(SimpleNamespace(status=403, reason="Forbidden"), "Missing Access")
+        util._process_due_announcements(self.announcements_dao, self.loop)
+        # Giving up on one occurrence does not end the series
+        rescheduled = self.announcements_dao.get_announcement_by_id(announcement.id)
+        self.assertEqual((rescheduled.state, rescheduled.attempts, rescheduled.last_error), ("pending", 0, None))
+        self.assertEqual(rescheduled.time.timestamp(), (announcement.time + timedelta(hours=1)).timestamp())
+
+    def test_announcement_due_during_dispatch_is_not_slept_through(self):
+        util = FakeAnnouncementsUtil()
+        self.schedule(-0.05, "slow upload")
+        meanwhile = self.schedule(1 / 60, "due meanwhile", channel=2)
+        send = util._send_announcement
+
+        async def send_slowly(announcement: AnnouncementsRecord):
+            # The other announcement comes due while this one is still being sent
+            while datetime.now(get_localzone()) < meanwhile.time + timedelta(seconds=1):
+                await asyncio.sleep(0.05)
+            await send(announcement)
+
+        util._send_announcement = send_slowly
+        util._process_due_announcements(self.announcements_dao, self.loop)
+        self.assertEqual(util.sent, ["slow upload"])
+        self.assertEqual(util._get_sleep_delay(self.announcements_dao.get_next_due_time()), 0)
+        util._send_announcement = send
+        util._process_due_announcements(self.announcements_dao, self.loop)
+        self.assertEqual(util.sent, ["slow upload", "due meanwhile"])
+
+    def test_dispatch_keeps_channel_order(self):
+        util = FakeAnnouncementsUtil()
+        announcements = [self.schedule(-0.05, message, channel) for message, channel in [("a1", 1), ("b1", 2), ("a2", 1), ("b2", 2), ("a3", 1)]]
+        results = asyncio.run_coroutine_threadsafe(util._dispatch(announcements), self.loop).result()
+        self.assertEqual(results, {announcement.id: None for announcement in announcements})
+        # The channels are sent to in parallel, but each channel in due order
+        self.assertEqual([message for message in util.sent if message.startswith("a")], ["a1", "a2", "a3"])
+        self.assertEqual([message for message in util.sent if message.startswith("b")], ["b1", "b2"])
+        self.assertLess(util.sent.index("b1"), util.sent.index("a3"))
+
+    def test_dispatch_failure_stops_only_its_channel(self):
+        util = FakeAnnouncementsUtil()
+        a1, b1, a2, b2, a3 = [self.schedule(-0.05, message, channel) for message, channel in [("a1", 1), ("b1", 2), ("a2", 1), ("b2", 2), ("a3", 1)]]
+        error = RuntimeError("gateway hiccup")
+        util.errors["a2"] = error
+        results = asyncio.run_coroutine_threadsafe(util._dispatch([a1, b1, a2, b2, a3]), self.loop).result()
+        # a3 is not attempted, so it is not posted before a2
+        self.assertEqual(results, {a1.id: None, b1.id: None, a2.id: error, b2.id: None})
+        self.assertEqual(sorted(util.sent), ["a1", "b1", "b2"])
+
+    def test_announcements_after_failure_are_deferred_to_its_retry(self):
+        util = FakeAnnouncementsUtil()
+        self.schedule(-0.05, "a1")
+        a2 = self.schedule(-0.04, "a2")
+        a3 = self.schedule(-0.03, "a3")
+        util.errors["a2"] = RuntimeError("gateway hiccup")
+        util._process_due_announcements(self.announcements_dao, self.loop)
+        self.assertEqual(util.sent, ["a1"])
+        failed = self.announcements_dao.get_announcement_by_id(a2.id)
+        deferred = self.announcements_dao.get_announcement_by_id(a3.id)
+        self.assertEqual((failed.attempts, deferred.attempts), (1, 0))
+        self.assertEqual(deferred.state, "pending")
+        # Both become due at the retry of the failed one, and are sent in their original order
+        retry = self.announcements_dao.get_next_due_time()
+        self.assertEqual([announcement.id for announcement in self.announcements_dao.get_due_announcements(retry)], [a2.id, a3.id])
+        del util.errors["a2"]
+        for announcement in (a2, a3):
+            self.announcements_dao.defer_announcement(announcement.id, int(self.now.timestamp()) - 1)
+        util._process_due_announcements(self.announcements_dao, self.loop)
+        self.assertEqual(util.sent, ["a1", "a2", "a3"])
+
+    def test_dispatch_sends_every_channel_with_one_slot(self):
+        util = FakeAnnouncementsUtil()
+        util.max_concurrent_channels = 1
+        announcements = [self.schedule(-0.05, f"channel {channel}", channel) for channel in range(1, 4)]
+        asyncio.run_coroutine_threadsafe(util._dispatch(announcements), self.loop).result()
+        self.assertEqual(util.sent, ["channel 1", "channel 2", "channel 3"])
+
+    def test_loop_survives_failed_pass(self):
+        util = FakeAnnouncementsUtil()
+        self.schedule(-0.05, "after the outage")
+        process = util._process_due_announcements
+        failures = []
+
+        def process_after_failures(announcements_dao: AnnouncementsDao, loop):
+            if len(failures) < 2:
+                failures.append(time.monotonic())
+                raise sqlite3.OperationalError("database is locked")
+            process(announcements_dao, loop)
+
+        util._process_due_announcements = process_after_failures
+        util.is_running = True
+        with mock.patch.object(constants, "DB_PATH", test_constants.TEST_DB_PATH), mock.patch.object(announcements_util, "RETRY_BASE_DELAY", 0.1):
+            thread = threading.Thread(target=util._loop, args=(self.loop, ))
+            thread.start()
+            deadline = time.monotonic() + 5
+            while not util.sent and time.monotonic() < deadline:
+                time.sleep(0.05)
+            util.stop()
+            thread.join()
+        self.assertEqual(util.sent, ["after the outage"])
+        # The passes are retried with backoff
+        self.assertGreaterEqual(failures[1] - failures[0], 0.1)
+
+    def reconcile(self, messages: list[SimpleNamespace]) -> AnnouncementsRecord:
+        announcement = self.schedule(-120, "interrupted")
+        # The last attempt was an hour after the due time, because of retries
+        self.announcements_dao.mark_sending([announcement.id], self.now - timedelta(minutes=60))
+        util = FakeAnnouncementsUtil(client=FakeClient(FakeChannel(messages)))
+        util._reconcile(self.announcements_dao, self.loop)
+        return self.announcements_dao.get_announcement_by_id(announcement.id)
+
+    def test_reconcile_finds_post_after_busy_history(self):
+        attempt = (self.now - timedelta(minutes=60)).astimezone(timezone.utc)
+        # A busy channel: hundreds of messages between the due time and the last attempt
+        messages = [SimpleNamespace(author=SimpleNamespace(id=index + 1), content="chatter", created_at=attempt - timedelta(minutes=59, seconds=-index)) for index in range(600)]
+        messages.append(SimpleNamespace(author=BOT, content="interrupted", created_at=attempt + timedelta(seconds=1)))
+        self.assertIsNone(self.reconcile(messages))
+
+    def test_reconcile_resends_unposted_announcement(self):
+        attempt = (self.now - timedelta(minutes=60)).astimezone(timezone.utc)
+        # The same text posted long after the attempt is not the interrupted announcement
+        messages = [SimpleNamespace(author=BOT, content="interrupted", created_at=attempt + timedelta(minutes=30))]
+        interrupted = self.reconcile(messages)
+        self.assertEqual((interrupted.state, interrupted.sending_epoch), ("pending", int((self.now - timedelta(minutes=60)).timestamp())))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,54 @@
+import hashlib
+import os
+import tempfile
+import time
+import unittest
+from unittest import mock
+
+from src.utils import attachment_store
+from src.utils.attachment_store import AttachmentStore
+
+
+class TestAttachmentStore(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.store = AttachmentStore(self.temp_dir.name)
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+    def test_put_is_content_addressed(self):
+        sha256 = self.store.put(b"hayato")
+        self.assertEqual(sha256, hashlib.sha256(b"hayato").hexdigest())
+        self.assertEqual(self.store.put(b"hayato"), sha256)
+        self.assertTrue(self.store.has(sha256))
+        self.assertFalse(self.store.has(None))
+        with open(self.store.get_path(sha256), "rb") as blob_file:
+            self.assertEqual(blob_file.read(), b"hayato")
+        self.assertEqual(os.listdir(self.temp_dir.name), [sha256])
+
+    def test_collect_garbage(self):
+        kept = self.store.put(b"kept")
+        unreferenced = self.store.put(b"unreferenced")
+        recent = self.store.put(b"recent")
+        old = time.time() - attachment_store.GC_GRACE_SECONDS - 1
+        for sha256 in (kept, unreferenced):
+            os.utime(self.store.get_path(sha256), (old, old))
+        self.assertEqual(self.store.collect_garbage({kept}), 1)
+        self.assertTrue(self.store.has(kept))
+        self.assertFalse(self.store.has(unreferenced))
+        self.assertTrue(self.store.has(recent))
+
+    def test_collect_garbage_skips_blobs_deleted_meanwhile(self):
+        unreferenced = self.store.put(b"unreferenced")
+        old = time.time() - attachment_store.GC_GRACE_SECONDS - 1
+        os.utime(self.store.get_path(unreferenced), (old, old))
+        listdir = os.listdir
+        # A blob that is listed, but deleted before it is checked
+        with mock.patch.object(attachment_store.os, "listdir", lambda path: ["deleted meanwhile"] + listdir(path)):
+            self.assertEqual(self.store.collect_garbage(set()), 1)
+        self.assertFalse(self.store.has(unreferenced))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,72 @@
+import os
+import unittest
+from datetime import date
+
+from src.db.birthday.birthday_dao import BirthdayDao
+from src.db.db_manager import DbManager
+from src.db.db_thread import AsyncDao, DbThread
+from src.utils.birthday_calendar import SORT_BY_MONTH, SORT_UPCOMING, BirthdayCalendar, MemberNameCache
+from tests import test_constants
+
+
+class FakeMember:
+    def __init__(self, user_id: int):
+        self.id = user_id
+        self.display_name = f"member {user_id}"
+
+
+class FakeGuild:
+    def __init__(self, cached: set[int], queryable: set[int]):
+        self.cached = cached
+        self.queryable = queryable
+        self.queries = []
+
+    def get_member(self, user_id: int):
+        return FakeMember(user_id) if user_id in self.cached else None
+
+    async def query_members(self, user_ids: list[int], limit: int, cache: bool):
+        self.queries.append(list(user_ids))
+        return [FakeMember(user_id) for user_id in user_ids if user_id in self.queryable]
+
+
+class TestBirthdayCalendar(unittest.IsolatedAsyncioTestCase):
+
+    def setUp(self):
+        if os.path.exists(test_constants.TEST_DB_PATH):
+            os.remove(test_constants.TEST_DB_PATH)
+        self.db_manager = DbManager(test_constants.TEST_DB_PATH)
+        self.birthday_dao = BirthdayDao(self.db_manager)
+        for user_id, birthday in ((1, "01-05"), (2, "03-15"), (3, "06-01"), (4, "12-24")):
+            self.birthday_dao.learn_birthday(user_id, birthday)
+        self.guild = FakeGuild({1}, {2, 3})
+        self.db_thread = DbThread(test_constants.TEST_DB_PATH)
+        self.async_birthday_dao = AsyncDao(self.db_thread, BirthdayDao)
+
+    def tearDown(self):
+        self.db_thread.stop()
+        self.db_manager.close()
+
+    async def test_sort_by_month(self):
+        calendar = BirthdayCalendar(self.async_birthday_dao, self.guild, SORT_BY_MONTH, date(2024, 3, 15), MemberNameCache())
+        page = await calendar.fetch(None, 10)
+        self.assertEqual([text for _, text in page], ["January 05: member 1", "March 15: member 2", "June 01: member 3", "December 24: unknown user 4"])
+
+    async def test_sort_upcoming_wraps_around(self):
+        calendar = BirthdayCalendar(self.async_birthday_dao, self.guild, SORT_UPCOMING, date(2024, 3, 15), MemberNameCache())
+        first = await calendar.fetch(None, 2)
+        self.assertEqual([text.split(":")[0] for _, text in first], ["March 15", "June 01"])
+        second = await calendar.fetch(first[-1][0], 2)
+        self.assertEqual([text.split(":")[0] for _, text in second], ["December 24", "January 05"])
+        self.assertEqual(await calendar.fetch(second[-1][0], 2), [])
+
+    async def test_names_are_cached(self):
+        name_cache = MemberNameCache()
+        calendar = BirthdayCalendar(self.async_birthday_dao, self.guild, SORT_BY_MONTH, date(2024, 3, 15), name_cache)
+        await calendar.fetch(None, 10)
+        await calendar.fetch(None, 10)
+        # Member 1 is in the client's cache, the rest are queried once, including member 4 who left the guild
+        self.assertEqual(self.guild.queries, [[2, 3, 4]])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,56 @@
+import unittest
+from datetime import date, datetime, timedelta, timezone
+
+from src.utils import birthday_util
+from src.utils.birthday_util import BirthdayUtil, TimezoneWheel, get_batched_birthday_messages
+
+# Etc/GMT+12, the default birthday timezone, is UTC-12. Asia/Tokyo is UTC+9. Asia/Seoul shares its offset.
+NOW = datetime(2024, 3, 14, 12, 0, 0, tzinfo=timezone.utc)
+
+
+class TestBatchedBirthdayMessages(unittest.TestCase):
+    def test_single_message(self):
+        chunks = get_batched_birthday_messages([1, 2])
+        self.assertEqual(chunks, [(birthday_util.BIRTHDAY_BATCH_MESSAGE_TEMPLATE.replace(birthday_util.BIRTHDAY_REPLACEMENT, "<@1>, <@2>"), [1, 2])])
+
+    def test_chunks_fit_message_limit(self):
+        user_ids = list(range(10 ** 17, 10 ** 17 + 300))
+        chunks = get_batched_birthday_messages(user_ids)
+        self.assertGreater(len(chunks), 1)
+        self.assertEqual([user_id for _, chunk_user_ids in chunks for user_id in chunk_user_ids], user_ids)
+        for message, chunk_user_ids in chunks:
+            self.assertLessEqual(len(message), birthday_util.MAX_MESSAGE_LENGTH)
+            self.assertEqual(message.count("<@"), len(chunk_user_ids))
+        # Every chunk but the last is full, so the number of API calls is as low as possible
+        self.assertGreater(len(chunks[0][0]), birthday_util.MAX_MESSAGE_LENGTH - len("<@100000000000000000>, "))
+
+
+class TestTimezoneWheel(unittest.TestCase):
+    def setUp(self):
+        self.wheel = TimezoneWheel({None, "Asia/Tokyo", "Asia/Seoul", "America/New_York"}, NOW)
+
+    def test_buckets_by_offset(self):
+        self.assertEqual(self.wheel.buckets[timedelta(hours=9)], ["Asia/Seoul", "Asia/Tokyo"])
+        self.assertEqual(self.wheel.buckets[timedelta(hours=-12)], [None])
+        # New York is on daylight saving time in March
+        self.assertEqual(self.wheel.buckets[timedelta(hours=-4)], ["America/New_York"])
+
+    def test_wakes_at_next_bucket_midnight(self):
+        # Midnight in Tokyo is 15:00 UTC
+        tokyo_midnight = datetime(2024, 3, 14, 15, 0, 2, tzinfo=timezone.utc)
+        self.assertEqual(self.wheel.get_next_midnight(NOW), tokyo_midnight)
+        self.assertEqual(self.wheel.get_started_timezones(NOW, tokyo_midnight), ["Asia/Seoul", "Asia/Tokyo"])
+        self.assertEqual(self.wheel.get_started_timezones(NOW, tokyo_midnight - timedelta(seconds=1)), [])
+        # Midnight in New York is 04:00 UTC
+        self.assertEqual(self.wheel.get_next_midnight(tokyo_midnight), datetime(2024, 3, 15, 4, 0, 2, tzinfo=timezone.utc))
+
+    def test_days_to_process(self):
+        today = date(2024, 3, 14)
+        self.assertEqual(BirthdayUtil._get_days_to_process(None, today), [today])
+        self.assertEqual(BirthdayUtil._get_days_to_process("2024-03-14", today), [])
+        self.assertEqual(BirthdayUtil._get_days_to_process("2024-03-12", today), [date(2024, 3, 13), today])
+        self.assertEqual(len(BirthdayUtil._get_days_to_process("2023-01-01", today)), birthday_util.MAX_CATCH_UP_DAYS + 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
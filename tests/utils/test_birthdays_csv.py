@@ -0,0 +1,47 @@
+import io
+import os
+import unittest
+
+from src.db.birthday.birthday_dao import BirthdayDao
+from src.db.db_manager import DbManager
+from src.utils import birthdays_csv
+from src.utils.birthdays_csv import parse_birthdays_import, write_birthdays_export
+from tests import test_constants
+
+
+class TestBirthdaysCsv(unittest.TestCase):
+
+    def setUp(self):
+        if os.path.exists(test_constants.TEST_DB_PATH):
+            os.remove(test_constants.TEST_DB_PATH)
+        self.db_manager = DbManager(test_constants.TEST_DB_PATH)
+        self.birthday_dao = BirthdayDao(self.db_manager)
+
+    def tearDown(self):
+        self.db_manager.close()
+
+    def test_import(self):
+        data = "user_id,date,timezone\n1,March 15,\n<@2>,1992-02-29,asia/tokyo\n".encode()
+        birthdays, errors = parse_birthdays_import("birthdays.csv", data)
+        self.assertEqual(errors, [])
+        self.assertEqual([(birthday.user_id, birthday.date, birthday.timezone) for birthday in birthdays], [(1, "03-15", None), (2, "02-29", "Asia/Tokyo")])
+
+    def test_reports_every_invalid_row(self):
+        data = "user_id,date,timezone\nsomeone,03-15,\n1,not a date,\n2,03-15,Mars/Olympus\n3,,\n4,03-15,\n4,03-16,\n".encode()
+        birthdays, errors = parse_birthdays_import("birthdays.csv", data)
+        self.assertEqual([birthday.user_id for birthday in birthdays], [4])
+        self.assertEqual([error.split(":")[0] for error in errors], ["row 2", "row 3", "row 4", "row 5", "row 7"])
+
+    def test_export_round_trip(self):
+        self.birthday_dao.learn_birthdays([(user_id, f"{user_id % 12 + 1:02d}-{user_id % 28 + 1:02d}", "Asia/Tokyo" if user_id % 2 else None) for user_id in range(1, 1201)])
+        file = io.StringIO(newline="")
+        self.assertEqual(write_birthdays_export(self.birthday_dao, file), 1200)
+        self.assertGreater(1200, birthdays_csv.EXPORT_BATCH_SIZE)
+        birthdays, errors = parse_birthdays_import("birthdays.csv", file.getvalue().encode())
+        self.assertEqual(errors, [])
+        self.assertEqual(sorted((birthday.user_id, birthday.date, birthday.timezone) for birthday in birthdays),
+                         sorted((birthday.user_id, birthday.date.strftime("%m-%d"), birthday.timezone) for birthday in self.birthday_dao.get_all_birthdays()))
+
+
+if __name__ == '__main__':
+    unittest.main()
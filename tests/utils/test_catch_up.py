@@ -0,0 +1,59 @@
+import asyncio
+import time
+import unittest
+from datetime import datetime, timedelta
+
+from src import constants
+from src.utils.catch_up import CatchUpPolicy, Pacer, parse_catch_up_policy
+from src.utils.response_limiter import RateLimit
+
+NOW = constants.JST.localize(datetime(2024, 1, 1, 12, 0, 0))
+
+
+class TestCatchUpPolicy(unittest.TestCase):
+    def setUp(self):
+        # (name, channel, minutes late)
+        self.items = [("a1", 1, 120), ("b1", 2, 90), ("a2", 1, 60), ("a3", 1, 20), ("b2", 2, 0.5)]
+
+    def select(self, policy: CatchUpPolicy) -> tuple[list[str], list[str]]:
+        kept, dropped = policy.select(self.items, NOW, lambda item: NOW - timedelta(minutes=item[2]), lambda item: item[1])
+        return [item[0] for item in kept], [item[0] for item in dropped]
+
+    def test_parse_catch_up_policy(self):
+        self.assertEqual(parse_catch_up_policy(" ALL "), CatchUpPolicy())
+        self.assertEqual(parse_catch_up_policy("latest"), CatchUpPolicy("latest"))
+        self.assertEqual(parse_catch_up_policy("drop:30"), CatchUpPolicy("drop", timedelta(minutes=30)))
+        self.assertEqual(str(parse_catch_up_policy("drop:30")), "drop:30")
+        for text in ["", "none", "drop", "drop:-1", "drop:x"]:
+            with self.assertRaises(ValueError, msg=text):
+                parse_catch_up_policy(text)
+
+    def test_all(self):
+        self.assertEqual(self.select(CatchUpPolicy()), (["a1", "b1", "a2", "a3", "b2"], []))
+
+    def test_latest(self):
+        self.assertEqual(self.select(CatchUpPolicy("latest")), (["b1", "a3", "b2"], ["a1", "a2"]))
+
+    def test_drop(self):
+        self.assertEqual(self.select(parse_catch_up_policy("drop:75")), (["a2", "a3", "b2"], ["a1", "b1"]))
+        # Items that are not late are never dropped
+        self.assertEqual(self.select(parse_catch_up_policy("drop:0")), (["b2"], ["a1", "b1", "a2", "a3"]))
+
+
+class TestPacer(unittest.IsolatedAsyncioTestCase):
+    async def test_spreads_out_waits(self):
+        pacer = Pacer(RateLimit(1, 0.05))
+        start = time.monotonic()
+        finished = []
+
+        async def send():
+            await pacer.wait()
+            finished.append(time.monotonic() - start)
+
+        await asyncio.gather(*(send() for _ in range(4)))
+        self.assertLess(finished[0], 0.04)
+        self.assertGreaterEqual(finished[-1], 0.14)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,34 @@
+import unittest
+
+from src.utils.match_cache import MISSING, MatchCache
+
+
+class TestMatchCache(unittest.TestCase):
+    def test_get_and_put(self):
+        cache = MatchCache(2)
+        self.assertIs(cache.get("ohayaho"), MISSING)
+        cache.put("ohayaho", 0)
+        cache.put("hello", None)
+        self.assertEqual(cache.get("ohayaho"), 0)
+        self.assertIsNone(cache.get("hello"))
+        stats = cache.get_stats()
+        self.assertEqual((stats.hits, stats.misses, stats.size), (2, 1, 2))
+
+    def test_evicts_least_recently_used(self):
+        cache = MatchCache(2)
+        cache.put("a", 0)
+        cache.put("b", 1)
+        cache.get("a")
+        cache.put("c", 2)
+        self.assertEqual(cache.get("a"), 0)
+        self.assertIs(cache.get("b"), MISSING)
+        self.assertEqual(cache.get("c"), 2)
+
+    def test_disabled(self):
+        cache = MatchCache(0)
+        cache.put("a", 0)
+        self.assertIs(cache.get("a"), MISSING)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,51 @@
+import unittest
+
+from src.utils import paginator
+from src.utils.paginator import Paginator
+
+
+class TestPaginator(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        self.items = [(key, f"item {key} " + "x" * 290) for key in range(1, 21)]
+        self.fetches = []
+
+    def fetch(self, after_key, limit):
+        self.fetches.append(after_key)
+        return [item for item in self.items if after_key is None or item[0] > after_key][:limit]
+
+    async def test_pages_follow_keys(self):
+        view = Paginator(self.fetch, "Items", "No items.")
+        first = await view._render()
+        self.assertLessEqual(len(first), paginator.MAX_PAGE_LENGTH)
+        self.assertTrue(first.startswith("Items (page 1)\nitem 1 "))
+        self.assertTrue(view.previous_page.disabled)
+        self.assertFalse(view.next_page.disabled)
+        shown = first.count("\n")
+
+        view._page_starts.append(view._next_start)
+        second = await view._render()
+        self.assertTrue(second.startswith(f"Items (page 2)\nitem {shown + 1} "))
+        self.assertFalse(view.previous_page.disabled)
+        self.assertEqual(self.fetches, [None, shown])
+
+        while not view.next_page.disabled:
+            view._page_starts.append(view._next_start)
+            last = await view._render()
+        self.assertIn("item 20 ", last)
+
+    async def test_empty(self):
+        self.items = []
+        view = Paginator(self.fetch, "Items", "No items.")
+        self.assertEqual(await view._render(), "Items\nNo items.")
+        self.assertTrue(view.next_page.disabled)
+
+    async def test_long_item_is_cut_short(self):
+        self.items = [(1, "x" * 3000), (2, "short")]
+        view = Paginator(self.fetch, "Items", "No items.")
+        self.assertEqual(len(await view._render()), paginator.MAX_PAGE_LENGTH)
+        view._page_starts.append(view._next_start)
+        self.assertEqual(await view._render(), "Items (page 2)\nshort")
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,50 @@
+import unittest
+from datetime import datetime, timedelta
+
+from src import constants
+from src.utils.recurrence import CronRecurrence, IntervalRecurrence, Recurrence, parse_recurrence
+
+# 2024-01-01 is a Monday
+MONDAY = constants.JST.localize(datetime(2024, 1, 1, 9, 0, 0))
+
+
+class TestRecurrence(unittest.TestCase):
+    def test_parse_recurrence(self):
+        self.assertEqual(parse_recurrence("6h").interval, timedelta(hours=6))
+        self.assertEqual(parse_recurrence(" 2W ").interval, timedelta(weeks=2))
+        self.assertIsInstance(parse_recurrence("cron:0 9 * * 1"), CronRecurrence)
+        for text in ["", "0d", "1y", "d", "cron:0 9 * *", "cron:60 * * * *", "cron:5-1 * * * *", "cron:*/0 * * * *"]:
+            with self.assertRaises(ValueError, msg=text):
+                parse_recurrence(text)
+
+    def test_recurrence_is_abstract(self):
+        with self.assertRaises(TypeError):
+            Recurrence()
+
+    def test_interval_skips_missed_occurrences(self):
+        recurrence = IntervalRecurrence(timedelta(days=1))
+        self.assertEqual(recurrence.next_after(MONDAY, MONDAY), MONDAY + timedelta(days=1))
+        self.assertEqual(recurrence.next_after(MONDAY, MONDAY + timedelta(days=3, hours=1)), MONDAY + timedelta(days=4))
+        self.assertEqual(recurrence.next_after(MONDAY, MONDAY + timedelta(days=3)), MONDAY + timedelta(days=4))
+
+    def test_cron(self):
+        weekly = parse_recurrence("cron:0 9 * * 1")
+        self.assertEqual(weekly.next_after(MONDAY, MONDAY), MONDAY + timedelta(weeks=1))
+        self.assertEqual(weekly.next_after(MONDAY, MONDAY + timedelta(weeks=2, minutes=1)), MONDAY + timedelta(weeks=3))
+        weekdays = parse_recurrence("cron:30 8,17 * * 1-5")
+        friday = MONDAY + timedelta(days=4)
+        self.assertEqual(weekdays.next_after(MONDAY, MONDAY), MONDAY.replace(hour=17, minute=30))
+        self.assertEqual(weekdays.next_after(friday, friday.replace(hour=18)), (friday + timedelta(days=3)).replace(hour=8, minute=30))
+
+    def test_cron_day_of_month_or_day_of_week(self):
+        recurrence = parse_recurrence("cron:0 0 15 * 0")
+        # The first Sunday of 2024 is January 7th, which comes before January 15th
+        self.assertEqual(recurrence.next_after(MONDAY, MONDAY), MONDAY.replace(day=7, hour=0))
+        self.assertEqual(recurrence.next_after(MONDAY.replace(day=14), MONDAY.replace(day=14)), MONDAY.replace(day=15, hour=0))
+
+    def test_cron_without_occurrence(self):
+        self.assertIsNone(parse_recurrence("cron:0 0 30 2 *").next_after(MONDAY, MONDAY))
+
+
+if __name__ == '__main__':
+    unittest.main()
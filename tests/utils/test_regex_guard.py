@@ -0,0 +1,77 @@
+import re
+import time
+import unittest
+
+from src.utils import regex_guard
+from src.utils.regex_guard import RegexSandbox, RegexSandboxNotReady, RegexTimeout
+from src.utils.response_matcher import ResponseMatcher
+
+BUDGET = 0.2
+
+
+class TestRegexSandbox(unittest.TestCase):
+    def setUp(self):
+        self.sandbox = RegexSandbox()
+
+    def tearDown(self):
+        self.sandbox.close()
+
+    def wait_until_ready(self, matcher: ResponseMatcher):
+        deadline = time.monotonic() + 10
+        while not self.sandbox.is_ready(matcher) and time.monotonic() < deadline:
+            time.sleep(0.01)
+        self.assertTrue(self.sandbox.is_ready(matcher))
+
+    def test_search(self):
+        matcher = ResponseMatcher([["hello"], [re.compile(r"(?<!\d)69(?!\d)")], [re.compile(r"^nice\.$")]])
+        self.sandbox.load(matcher)
+        self.assertEqual(self.sandbox.search(matcher, "i love 69", None, BUDGET), 1)
+        self.assertEqual(self.sandbox.search(matcher, "nice.", None, BUDGET), 2)
+        self.assertIsNone(self.sandbox.search(matcher, "nice.", 2, BUDGET))
+        self.assertIsNone(self.sandbox.search(matcher, "hello", None, BUDGET))
+
+    def test_search_loads_in_background(self):
+        matcher = ResponseMatcher([[re.compile("b")]])
+        with self.assertRaises(RegexSandboxNotReady):
+            self.sandbox.search(matcher, "b", None, BUDGET)
+        self.wait_until_ready(matcher)
+        self.assertEqual(self.sandbox.search(matcher, "b", None, BUDGET), 0)
+
+    def test_search_timeout(self):
+        matcher = ResponseMatcher([[re.compile(r"(a+)+$")], [re.compile("b")]])
+        self.sandbox.load(matcher)
+        with self.assertRaises(RegexTimeout):
+            self.sandbox.search(matcher, "a" * 40 + "!", None, BUDGET)
+        # The new child is loaded in the background, and searches fall back until it is ready
+        self.wait_until_ready(matcher)
+        self.assertEqual(self.sandbox.search(matcher, "b", None, BUDGET), 1)
+
+    def test_vet(self):
+        patterns = [(re.compile("fine"), 0), (re.compile(r"(a+)+$"), 1), (re.compile(r"(\s*)*x"), 2), (re.compile("ok"), 3)]
+        disabled = self.sandbox.vet(patterns, None, BUDGET, "slow")
+        self.assertEqual([rule.row for rule in disabled], [1, 2])
+
+    def test_vet_budget_starts_after_loading(self):
+        # Compiling thousands of patterns in the child takes much longer than the budget of one pattern
+        patterns = [(re.compile(fr"stream\s+ohayaho{row}"), row) for row in range(3000)]
+        self.assertEqual(self.sandbox.vet(patterns, ["stream ohayaho"], 0.005, "slow"), [])
+
+    def test_children_close_inherited_pipes(self):
+        first = ResponseMatcher([[re.compile("a")]])
+        self.sandbox.load(first)
+        other = RegexSandbox()
+        other.load(ResponseMatcher([[re.compile("b")]]))
+        try:
+            child = self.sandbox._child
+            # Closing the only remaining parent end ends the child, even though the other child was forked after it
+            with regex_guard._parent_conns_lock:
+                regex_guard._parent_conns.discard(child.conn)
+            child.conn.close()
+            child.process.join(5)
+            self.assertFalse(child.process.is_alive())
+        finally:
+            other.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,39 @@
+import asyncio
+import unittest
+
+import src.utils.responses as responses
+from src.utils.response_executor import MODE_PROCESS, ResponseExecutor
+
+
+def _get_sandbox_child_pid() -> int:
+    # Runs in a worker process
+    return responses._sandbox._child.process.pid
+
+
+class TestResponseExecutor(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        self.regex_budget = responses.REGEX_BUDGET
+        responses.REGEX_BUDGET = 0.5
+        # The parent has a sandbox child of its own, which the forked workers inherit
+        responses._sandbox.load(responses._ruleset.matcher)
+        self.executor = ResponseExecutor(MODE_PROCESS, 0, 1, 10)
+
+    def tearDown(self):
+        self.executor.shutdown()
+        responses._sandbox.close()
+        responses.REGEX_BUDGET = self.regex_budget
+
+    async def test_process_mode_matches_regex_rules(self):
+        self.assertEqual(await self.executor.get_response_and_rule("ohayaho"), ("OHAYAHO!!!!!", "ohayaho"))
+        response, rule = await self.executor.get_response_and_rule("i said 69 twice, 69")
+        self.assertEqual(response, "nice.")
+        self.assertIsNotNone(rule)
+
+    async def test_workers_use_their_own_sandbox(self):
+        parent_child_pid = responses._sandbox._child.process.pid
+        child_pid = await asyncio.get_running_loop().run_in_executor(self.executor._get_executor(), _get_sandbox_child_pid)
+        self.assertNotEqual(child_pid, parent_child_pid)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,63 @@
+import unittest
+
+from src.utils.response_limiter import RateLimit, ResponseLimiter, parse_rate_limit
+
+
+class TestResponseLimiter(unittest.TestCase):
+    def test_parse_rate_limit(self):
+        self.assertEqual(parse_rate_limit("1/60"), RateLimit(1, 60))
+        self.assertEqual(parse_rate_limit(" 3 / 1.5s "), RateLimit(3, 1.5))
+        for text in ["", "1", "0/60", "1/0", "a/b"]:
+            with self.assertRaises(ValueError):
+                parse_rate_limit(text)
+
+    def test_rule_cooldown(self):
+        limiter = ResponseLimiter(None)
+        rate_limit = RateLimit(1, 60)
+        self.assertTrue(limiter.allow(1, "ohayaho", rate_limit, now=0))
+        self.assertFalse(limiter.allow(1, "ohayaho", rate_limit, now=30))
+        # Other channels and other rules have their own buckets.
+        self.assertTrue(limiter.allow(2, "ohayaho", rate_limit, now=30))
+        self.assertTrue(limiter.allow(1, "69", rate_limit, now=30))
+        self.assertTrue(limiter.allow(1, "ohayaho", rate_limit, now=60))
+        self.assertEqual((limiter.allowed, limiter.coalesced), (4, 1))
+
+    def test_channel_limit(self):
+        limiter = ResponseLimiter(RateLimit(2, 10))
+        self.assertTrue(limiter.allow(1, "a", None, now=0))
+        self.assertTrue(limiter.allow(1, "b", None, now=0))
+        self.assertFalse(limiter.allow(1, "c", None, now=1))
+        self.assertTrue(limiter.allow(1, "c", None, now=5))
+
+    def test_coalesced_triggers_get_one_trailing_reply(self):
+        limiter = ResponseLimiter(None)
+        rate_limit = RateLimit(1, 60)
+        self.assertTrue(limiter.allow(1, "ohayaho", rate_limit, now=0))
+        self.assertEqual(limiter.take_trailing_reply(1, "ohayaho", rate_limit, now=0), (0, 0))
+        for now in [10, 20, 30]:
+            self.assertFalse(limiter.allow(1, "ohayaho", rate_limit, now=now))
+        self.assertEqual(limiter.get_pending(1, "ohayaho"), 3)
+        # The trailing reply waits for the bucket to refill
+        self.assertEqual(limiter.take_trailing_reply(1, "ohayaho", rate_limit, now=45), (0, 15))
+        self.assertEqual(limiter.take_trailing_reply(1, "ohayaho", rate_limit, now=60), (3, 0))
+        self.assertEqual(limiter.get_pending(1, "ohayaho"), 0)
+        self.assertEqual(limiter.take_trailing_reply(1, "ohayaho", rate_limit, now=60), (0, 0))
+        # The trailing reply took the token
+        self.assertFalse(limiter.allow(1, "ohayaho", rate_limit, now=61))
+
+    def test_allowed_reply_answers_coalesced_triggers(self):
+        limiter = ResponseLimiter(RateLimit(2, 10))
+        self.assertTrue(limiter.allow(1, "a", None, now=0))
+        self.assertTrue(limiter.allow(1, "b", None, now=0))
+        self.assertFalse(limiter.allow(1, "a", None, now=1))
+        self.assertTrue(limiter.allow(1, "a", None, now=5))
+        self.assertEqual(limiter.take_trailing_reply(1, "a", None, now=10), (0, 0))
+
+    def test_no_limits(self):
+        limiter = ResponseLimiter(None)
+        for _ in range(100):
+            self.assertTrue(limiter.allow(1, "a", None, now=0))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,79 @@
+import random
+import re
+import unittest
+
+from src.utils import response_matcher
+from src.utils.response_matcher import KeywordAutomaton, RegexProgram, ResponseMatcher
+
+
+def naive_match(keyword_lists, text):
+    for index, keyword_list in enumerate(keyword_lists):
+        for keyword in keyword_list:
+            if isinstance(keyword, str) and keyword in text:
+                return index
+            elif isinstance(keyword, re.Pattern) and keyword.search(text):
+                return index
+    return None
+
+
+class TestKeywordAutomaton(unittest.TestCase):
+    def test_overlapping_keywords(self):
+        automaton = KeywordAutomaton([("he", 3), ("she", 2), ("his", 1), ("hers", 0)])
+        self.assertEqual(automaton.search("ushers"), 0)
+        self.assertEqual(automaton.search("ushe"), 2)
+        self.assertEqual(automaton.search("ahe"), 3)
+        self.assertIsNone(automaton.search("xyz"))
+
+    def test_limit(self):
+        automaton = KeywordAutomaton([("a", 0), ("b", 1)])
+        self.assertIsNone(automaton.search("b", limit=1))
+        self.assertEqual(automaton.search("b", limit=2), 1)
+
+
+class TestRegexProgram(unittest.TestCase):
+    def test_lowest_row_wins(self):
+        program = RegexProgram([(re.compile("b"), 2), (re.compile("(a)"), 3), (re.compile("^c", re.MULTILINE), 5)])
+        self.assertEqual(program.first_row, 2)
+        self.assertEqual(program.search("a b"), 2)
+        self.assertEqual(program.search("xa"), 3)
+        self.assertEqual(program.search("x\nc"), 5)
+        self.assertIsNone(program.search("xyz"))
+
+
+class TestResponseMatcher(unittest.TestCase):
+    def setUp(self):
+        self.shard_size = response_matcher.REGEX_SHARD_SIZE
+
+    def tearDown(self):
+        response_matcher.REGEX_SHARD_SIZE = self.shard_size
+
+    def test_first_row_wins(self):
+        keyword_lists = [["i love hayato"], ["hayato"], [re.compile(r"(?<!\d)69(?!\d)")], ["i love"]]
+        matcher = ResponseMatcher(keyword_lists)
+        self.assertEqual(matcher.match("i love hayato"), 0)
+        self.assertEqual(matcher.match("hayato 69"), 1)
+        self.assertEqual(matcher.match("i love 69"), 2)
+        self.assertEqual(matcher.match("i love 690"), 3)
+        self.assertIsNone(matcher.match("nothing here"))
+
+    def test_matches_naive_scan(self):
+        rng = random.Random(1234)
+        alphabet = "abc d"
+        keyword_lists = []
+        for _ in range(40):
+            keyword_list = []
+            for _ in range(rng.randint(1, 3)):
+                if rng.random() < 0.3:
+                    keyword_list.append(re.compile(rng.choice([r"^a+b", r"(c)\1", r"b$", r"(?i)d", r"a.?c", r"(?<!a)bb"])))
+                else:
+                    keyword_list.append("".join(rng.choice(alphabet) for _ in range(rng.randint(1, 4))))
+            keyword_lists.append(keyword_list)
+        response_matcher.REGEX_SHARD_SIZE = 3
+        matcher = ResponseMatcher(keyword_lists)
+        for _ in range(500):
+            text = "".join(rng.choice(alphabet) for _ in range(rng.randint(0, 12)))
+            self.assertEqual(matcher.match(text), naive_match(keyword_lists, text), text)
+
+
+if __name__ == '__main__':
+    unittest.main()
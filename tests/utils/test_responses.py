@@ -1,4 +1,8 @@
+import os
+import tempfile
 import unittest
+from unittest import mock
+
 import src.utils.responses as responses
 
 from src.constants import LOGGER
@@ -123,5 +127,62 @@ class TestResponses(unittest.TestCase):
         self.assertEqual(response, expected)
 
 
+class TestResponsesSnapshot(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.temp_dir.name, "responses.csv")
+        self.write("ohayaho,first\n")
+        self.patches = [
+            mock.patch.object(responses, "RESPONSES_FILE_PATH", self.path),
+            mock.patch.object(responses, "SNAPSHOT_PATH", os.path.join(self.temp_dir.name, "snapshot.pickle")),
+        ]
+        for patch in self.patches:
+            patch.start()
+        # The first load has no snapshot to use, and saves one
+        self.assertTrue(responses.load_responses_file())
+        self.assertTrue(os.path.exists(responses.SNAPSHOT_PATH))
+
+    def tearDown(self):
+        for patch in self.patches:
+            patch.stop()
+        responses.load_responses_file()
+        self.temp_dir.cleanup()
+
+    def write(self, text: str):
+        with open(self.path, "w") as csv_file:
+            csv_file.write(text)
+
+    def load(self) -> bool:
+        """
+        Reload the responses file and return whether it was parsed again instead of loaded from the snapshot.
+        """
+        with mock.patch.object(responses, "_parse_responses_file", wraps=responses._parse_responses_file) as parse:
+            self.assertTrue(responses.load_responses_file())
+        return parse.called
+
+    def test_unchanged_file_loads_from_snapshot(self):
+        self.assertFalse(self.load())
+        self.assertEqual(responses.get_response("ohayaho"), "first")
+
+    def test_stale_snapshot_version_forces_cold_load(self):
+        with mock.patch.object(responses, "SNAPSHOT_VERSION", responses.SNAPSHOT_VERSION + 1):
+            self.assertTrue(self.load())
+            # The cold load saved a snapshot for the new version
+            self.assertFalse(self.load())
+        self.assertTrue(self.load())
+
+    def test_changed_file_forces_cold_load(self):
+        self.write("ohayaho,second\n")
+        self.assertTrue(self.load())
+        self.assertEqual(responses.get_response("ohayaho"), "second")
+        self.assertFalse(self.load())
+
+    def test_unreadable_snapshot_forces_cold_load(self):
+        with open(responses.SNAPSHOT_PATH, "wb") as snapshot_file:
+            snapshot_file.write(b"not a pickle")
+        self.assertTrue(self.load())
+        self.assertEqual(responses.get_response("ohayaho"), "first")
+
+
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,74 @@
+import os
+import tempfile
+import time
+import unittest
+from unittest import mock
+
+import src.utils.responses as responses
+from src.utils.responses_watcher import ResponsesWatcher
+
+INTERVAL = 0.05
+TIMEOUT = 5
+
+
+class TestResponsesWatcher(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.temp_dir.name, "responses.csv")
+        self.write("ohayaho,first\n")
+        self.patches = [
+            mock.patch.object(responses, "RESPONSES_FILE_PATH", self.path),
+            mock.patch.object(responses, "SNAPSHOT_PATH", os.path.join(self.temp_dir.name, "snapshot.pickle")),
+        ]
+        for patch in self.patches:
+            patch.start()
+        self.assertTrue(responses.load_responses_file())
+        self.watcher = ResponsesWatcher(self.path, INTERVAL)
+
+    def tearDown(self):
+        self.watcher.stop()
+        # Let the watcher thread finish its last poll before the real responses file is restored
+        time.sleep(INTERVAL * 2)
+        for patch in self.patches:
+            patch.stop()
+        responses.load_responses_file()
+        self.temp_dir.cleanup()
+
+    def write(self, text: str):
+        with open(self.path, "w") as csv_file:
+            csv_file.write(text)
+
+    def wait_for_response(self, message: str, expected: str) -> bool:
+        deadline = time.monotonic() + TIMEOUT
+        while time.monotonic() < deadline:
+            if responses.get_response(message) == expected:
+                return True
+            time.sleep(INTERVAL)
+        return False
+
+    def test_reloads_changed_file(self):
+        self.assertEqual(responses.get_response("ohayaho"), "first")
+        # A different size is picked up even if the mtime did not tick
+        self.write("ohayaho,second\n")
+        self.assertTrue(self.wait_for_response("ohayaho", "second"))
+
+    def test_reloads_same_size_file_with_new_mtime(self):
+        self.write("ohayaho,third\n")
+        self.assertTrue(self.wait_for_response("ohayaho", "third"))
+        stat = os.stat(self.path)
+        self.write("ohayaho,fifth\n")
+        os.utime(self.path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000_000))
+        self.assertEqual(os.stat(self.path).st_size, stat.st_size)
+        self.assertTrue(self.wait_for_response("ohayaho", "fifth"))
+
+    def test_keeps_last_good_responses_on_bad_file(self):
+        # A row without a response column fails to parse
+        self.write("ohayaho\n")
+        time.sleep(INTERVAL * 10)
+        self.assertEqual(responses.get_response("ohayaho"), "first")
+        self.write("ohayaho,fixed\n")
+        self.assertTrue(self.wait_for_response("ohayaho", "fixed"))
+
+
+if __name__ == '__main__':
+    unittest.main()